@@ -1,348 +1,290 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 import time
 import json
 import os
 import csv
+import sys
 from datetime import timedelta
 
-def load_progress():
-    if os.path.exists('Scrape\Bookline\details2_progress.json'):
-        with open('Scrape\Bookline\details2_progress.json', 'r') as f:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractors import parse_bookline_book_page
+from product_urls import rebase_url
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from browser_factory import page_bytes, format_bytes
+from driver_watchdog import WatchedDriver
+from consent import open_store
+from adaptive_wait import AdaptiveWait, value_is
+from page_scripts import bookline_search_results
+from title_matching import best_match
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from store_config import STORE_URLS, PREFETCH_TABS, PREFETCH_TIMEOUT
+from tab_prefetch import TabPrefetcher, with_lookahead
+from rate_limiter import RateLimiter, host_of
+from retry import TRANSIENT, NOT_FOUND, NotFound, classify, first_line, no_results, retry_call
+from driver_pool import SHARD_POSITION
+
+PROGRESS_FILE = 'Scrape\Bookline\details2_progress.json'
+DETAILS_FILE = 'Data\Bookline\\Book_bookdetails2.csv'
+QUEUE_NAME = 'bookline_details2'
+HOST = host_of(STORE_URLS['bookline'])
+
+log = get_logger(QUEUE_NAME)
+
+def load_progress(progress_file=PROGRESS_FILE, start_line=0):
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r') as f:
             data = json.load(f)
             if 'total_runtime' not in data:
                 data['total_runtime'] = 0
             return data
-    return {'last_processed_line': 0, 'total_runtime': 0}
-
-def save_progress(line_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['last_processed_line'] = line_number
-    if runtime is not None:
-        progress_data['total_runtime'] = runtime
-    with open('Scrape\Bookline\details2_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+    return {'last_processed_line': start_line, 'total_runtime': 0}
 
 def format_runtime(seconds):
     return str(timedelta(seconds=int(seconds)))
 
-def log_error(title, error):
-    error_msg = str(error).split('\n')[0]
-    with open('Data\Bookline\error2_titles.txt', 'a', encoding='utf-8') as f:
-        f.write(f"{title}\n")
+def open_queue():
+    """Work queue of the title file, seeded on the first run (from details2_progress.json if it exists)."""
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        progress = load_progress()
+        with open('Data\Bookline\\Bookline_booktitles.csv', 'r', encoding='utf-8') as f:
+            next(f)  # Skip header
+            queue.seed(((i, line.split(';')[2] if line.count(';') > 1 else line.strip(), line) for i, line in enumerate(f)),
+                       progress['last_processed_line'], progress['total_runtime'])
+    return queue
 
-def scrape_book_details():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    start_line = progress['last_processed_line']
-    previous_runtime = progress['total_runtime']
+def scrape_title(driver, waiter, limiter, archive, metrics, page, rank, title, publisher="", url="", tabs=None):
+    """Open the title's product page (its saved link, or the best search result) and return its row.
+
+    A saved link is taken from its prefetched tab if tabs has one. Raises
+    NotFound when no search result matches the title (and publisher).
+    """
+    if url:
+        # The listing scraper saved the product link, no search needed
+        log.debug("opening saved product link", url=url)
+        # Saved links point at the store the listing ran against
+        product_url = rebase_url(STORE_URLS['bookline'], url)
+        with metrics.phase('navigate'):
+            if not (tabs and tabs.take(product_url)):
+                limiter.wait(HOST)
+                driver.get(product_url)
+    else:
+        with metrics.phase('search'):
+            log.debug("searching", title=title, publisher=publisher)
+            # Find and clear search input
+            search_box = WebDriverWait(driver, 15).until(
+                EC.presence_of_element_located((By.CLASS_NAME, "c-simple-search__input"))
+            )
+            search_box.clear()
+            waiter.until('search box cleared', 1, value_is(search_box, ""), network_idle=False)
+            search_box.send_keys(title)
+            waiter.until('query typed', 0.5, value_is(search_box, title), network_idle=False)
+            limiter.wait(HOST)
+            search_box.send_keys(Keys.RETURN)
+
+            # Find and click the "Könyv" checkbox
+            try:
+                konyv_checkbox = WebDriverWait(driver, 5).until(
+                    EC.element_to_be_clickable((By.XPATH, "//label[contains(text(), 'Könyv')]"))
+                )
+            except TimeoutException as e:
+                # The filter is only offered when the search found books
+                raise no_results(driver, e)
+            limiter.wait(HOST)  # The filter reloads the results
+            konyv_checkbox.click()
+            waiter.until('filter applied', 2)  # Wait for the filter to apply
+
+            # Get all product titles
+            try:
+                WebDriverWait(driver, 5).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, "c-product-title"))
+                )
+            except TimeoutException as e:
+                raise no_results(driver, e)
+
+            # Titles, authors and publishers of every result in one round-trip, scored here
+            match, match_score = best_match(bookline_search_results(driver), title, publisher=publisher)
+            if not match:
+                raise NotFound(f"No matching search result (best score {match_score:.2f})")
+            log.debug("found match", score=f"{match_score:.2f}", result=match['title'], publisher=match['publisher'])
+        with metrics.phase('navigate'):
+            limiter.wait(HOST)
+            match['element'].click()
+            waiter.until('product page', 1)
+
+    # Initialize book details with publisher field
+    book_details = {
+        'page': page,
+        'rank': rank,
+        'title': "null",
+        'author': "null",
+        'publisher': "null",
+        'price': "null",
+        'score': "null",
+        'reviews': "null",
+        'language': "null",
+        'pages': "N/A",
+        'edition': "N/A",
+        'code': "N/A",
+        'category': "N/A"
+    }
+
+    # Wait for the price block, then parse every field from one copy of the page source
+    with metrics.phase('navigate'):
+        try:
+            WebDriverWait(driver, 5).until(
+                EC.presence_of_element_located((By.XPATH, "//p[@class='o-prices-block__price1']"))
+            )
+        except Exception as e:
+            log.debug("price block not found, parsing the page anyway", title=title, error=first_line(e))
+
+    book_details['title'] = title
+    with metrics.phase('extract'):
+        page_source = driver.page_source
+        archive.put('bookline_details2', driver.current_url, page_source,
+                    {'page': page, 'rank': rank, 'title': title})
+        book_details.update(parse_bookline_book_page(page_source))
+    return book_details
+
+def reload_home(driver, limiter, error=None):
+    # Back to a known state before the next attempt or title
+    if error is not None:
+        limiter.record_page(HOST, driver, error)
+    if driver.ensure_healthy():
+        return  # A new browser, already on the home page
+    log.debug("opening Bookline.ro")
+    limiter.wait(HOST)
+    driver.get(STORE_URLS['bookline'] + "/")
+
+def saved_url(line):
+    # The product link column of a Bookline_booktitles.csv line, if it has one
+    parts = line.strip().split(';')
+    return parts[4] if len(parts) > 4 else ""
+
+def scrape_book_details(details_file=DETAILS_FILE, start_line=None, end_line=None, headless=True, prefetch=PREFETCH_TABS):
+    # The defaults scrape the whole title file; driver_pool.py passes a line
+    # range and a per-shard details file to run several browsers side by side
+    # One browser profile per line range, so driver_pool shards never share one
+    run_name = f"{QUEUE_NAME}_{start_line}" if start_line is not None else QUEUE_NAME
+    # Restarted between titles when it gets slow or big, and when a title hangs
+    limiter = RateLimiter()
+    driver = WatchedDriver('bookline', profile=run_name, headless=headless, limiter=limiter)
+    waiter = AdaptiveWait(driver, 'bookline')
+    metrics = ScraperMetrics(run_name)
+    metrics_port = serve_metrics()
+    queue = open_queue()
+    archive = HtmlArchive()
+    # Titles a crashed run of this range left leased
+    queue.release_leases(start_line, end_line)
+    previous_runtime = queue.runtime()
+    metrics.set_remaining(queue.remaining(start_line, end_line))
     
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
+    # The next prefetch titles' product pages load in background tabs
+    tabs = TabPrefetcher(driver, prefetch, PREFETCH_TIMEOUT, lambda: limiter.wait(HOST)) if prefetch else None
+    if tabs:
+        driver.on_restart.append(tabs.reset)
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), prefetch_tabs=prefetch,
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
     
     try:
-        print("Opening Bookline.ro...")
-        driver.get("https://bookline.ro/")
-        
-        # Handle cookie popup
-        try:
-            print("Handling cookie popup...")
-            cookie_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
-            )
-            cookie_button.click()
-            time.sleep(1)
-        except Exception as e:
-            print(f"Could not handle cookie popup: {e}")
+        log.info("opening Bookline.ro")
+        # Saved consent first; the popups are only handled when there is none
+        open_store(driver, 'bookline', limiter=limiter)
 
-        with open('Data\Bookline\\Book_bookdetails2.csv', 'a', newline='', encoding='utf-8') as csvfile:
+        with open(details_file, 'a', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['page', 'rank', 'title', 'author', 'publisher', 'price', 'score', 'reviews', 'language', 
                          'pages', 'edition', 'code', 'category']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
+            if details_file != DETAILS_FILE:
+                # A driver_pool.py shard: the queue position lets the merge restore input order
+                fieldnames = fieldnames + [SHARD_POSITION]
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
             
-            if os.path.getsize('Data\Bookline\\Book_bookdetails2.csv') == 0:
+            if os.path.getsize(details_file) == 0:
                 writer.writeheader()
             
-            with open('Data\Bookline\\Bookline_booktitles.csv', 'r', encoding='utf-8') as f:
-                # Skip header
-                next(f)
-                lines = f.readlines()[start_line:]
+            for item, upcoming in with_lookahead(queue.items(start_line, end_line), prefetch):
+                i, line = item['position'], item['payload']
+                parts = line.strip().split(';')
+                page = parts[0]
+                rank = parts[1]
+                title = parts[2]
+                publisher = parts[3] if len(parts) > 2 else ""
+                url = saved_url(line)
+                title_start = time.time()
+                driver.check_health()
+                if tabs:
+                    # The next titles' product pages load while this one is parsed and written
+                    next_urls = [rebase_url(STORE_URLS['bookline'], saved_url(next_item['payload']))
+                                 for next_item in upcoming if saved_url(next_item['payload'])]
+                    # Tabs of titles already passed would hold their place forever
+                    tabs.keep(next_urls + ([rebase_url(STORE_URLS['bookline'], url)] if url else []))
+                    for next_url in next_urls:
+                        tabs.prefetch(next_url)
                 
-                for i, line in enumerate(lines, start=start_line):
-                    parts = line.strip().split(';')
-                    page = parts[0]
-                    rank = parts[1]
-                    title = parts[2]
-                    publisher = parts[3] if len(parts) > 2 else ""
-                    
-                    print(f"\n{'='*50}")
-                    print(f"Processing title {i+1}: {title}")
-                    if publisher:
-                        print(f"Publisher: {publisher}")
-                    print(f"{'='*50}")
-                    
-                    try:
-                        print("Searching for the book...")
-                        # Find and clear search input
-                        search_box = WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.CLASS_NAME, "c-simple-search__input"))
-                        )
-                        search_box.clear()
-                        time.sleep(1)
-                        search_box.send_keys(title)
-                        time.sleep(0.5)
-                        search_box.send_keys(Keys.RETURN)
+                try:
+                    book_details = retry_call(scrape_title, driver, waiter, limiter, archive, metrics,
+                                              page, rank, title, publisher, url, tabs,
+                                              before_retry=lambda e: reload_home(driver, limiter, e))
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    if tabs:
+                        tabs.release()
+                    # Misses are expected; everything else is worth a look
+                    (log.info if kind == NOT_FOUND else log.warning)(
+                        "title failed", position=i+1, title=title, kind=kind, error=first_line(e))
+                    # Only transient failures come back; misses and parse errors are recorded once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining(start_line, end_line))
+                    if kind == TRANSIENT:
+                        reload_home(driver, limiter)
+                    continue
 
-                           # Find and click the "Könyv" checkbox
-                        try:
-                            print("Finding and clicking the 'Könyv' checkbox...")
-                            konyv_checkbox = WebDriverWait(driver, 5).until(
-                                EC.element_to_be_clickable((By.XPATH, "//label[contains(text(), 'Könyv')]"))
-                            )
-                            konyv_checkbox.click()
-                            time.sleep(2)  # Wait for the filter to apply
-                        except Exception as e:
-                            print(f"Could not find or click the 'Könyv' checkbox: {e}")
-                            return
-                        
-                        # Wait for results and find matching element
-                        try:
-                            # Get all product titles
-                            product_titles = WebDriverWait(driver, 5).until(
-                                EC.presence_of_all_elements_located((By.CLASS_NAME, "c-product-title"))
-                            )
-                            
-                            matching_element = None
-                            for product in product_titles:
-                                try:
-                                    # Get the title text
-                                    product_title = product.text.strip()
-                                    
-                                    # Check if title matches exactly
-                                    if product_title == title:
-                                        # If publisher is provided, check for publisher match
-                                        if publisher:
-                                            try:
-                                                # Get the publisher element
-                                                product_publisher = product.find_element(
-                                                    By.XPATH, ".//ancestor::div[contains(@class, 't-product-detailed')]//div[contains(@class, 'o-product__publisher')]"
-                                                ).text.strip()
-                                                
-                                                if product_publisher == publisher:
-                                                    matching_element = product
-                                                    print(f"Found exact match with matching publisher: {publisher}")
-                                                    break
-                                            except:
-                                                continue
-                                        else:
-                                            matching_element = product
-                                            print("Found exact title match")
-                                            break
-                                except:
-                                    continue
-                            
-                            # If no exact match found, use the first element
-                            if not matching_element and product_titles:
-                                matching_element = product_titles[0]
-                                print("No exact match found, using first result")
-                            
-                            if matching_element:
-                                matching_element.click()
-                                time.sleep(1)
-                            else:
-                                print("No results found")
-                                continue
-                            
-                        except Exception as e:
-                            print(f"Error finding matching element: {e}")
-                            continue
-                        
-                        # Initialize book details with publisher field
-                        book_details = {
-                            'page': page,
-                            'rank': rank,
-                            'title': "null",
-                            'author': "null",
-                            'publisher': "null",
-                            'price': "null",
-                            'score': "null",
-                            'reviews': "null",
-                            'language': "null",
-                            'pages': "N/A",
-                            'edition': "N/A",
-                            'code': "N/A",
-                            'category': "N/A"
-                        }
-                        
-                        # Extract title from product page
-                        try:
-                            title_element = driver.find_element(
-                                By.XPATH, "//h1[@class='c-product__title']"
-                            )
-                            book_details['title'] = title_element.text.strip()
-                            print(f"Found title: {book_details['title']}")
-                        except Exception as e:
-                            error_msg = str(e).split('\n')[0]
-                            print(f"Could not find title: {error_msg}")
-                            book_details['title'] = title
-                        
-                        # Extract author
-                        try:
-                            author_element = driver.find_element(
-                                By.XPATH, "//div[@class='o-product-authors']//span[@itemprop='name']"
-                            )
-                            book_details['author'] = author_element.text.strip()
-                            print(f"Found author: {book_details['author']}")
-                        except Exception as e:
-                            error_msg = str(e).split('\n')[0]
-                            print(f"Could not find author: {error_msg}")
-                        
-                        # Extract price
-                        try:
-                            price_element = WebDriverWait(driver, 5).until(
-                                EC.presence_of_element_located(
-                                    (By.XPATH, "//p[@class='o-prices-block__price1']//span[@class='price']")
-                                )
-                            )
-                            price = price_element.text.strip()
-                            if price:
-                                book_details['price'] = price.replace("RON", "").strip()
-                            else:
-                                # Check for alternative text
-                                alt_price = driver.find_element(
-                                    By.XPATH, "//p[@class='o-prices-block__price1']"
-                                ).text.strip()
-                                book_details['price'] = alt_price
-                            print(f"Found price: {book_details['price']}")
-                        except Exception as e:
-                            print(f"Could not find price: {e}")
-                        
-                        # Extract rating and reviews
-                        try:
-                            rating_element = driver.find_element(
-                                By.XPATH, "//div[contains(@class, 'o-rating-block-simple')]"
-                            )
-                            rating_data = rating_element.get_attribute("data-stars")
-                            reviews_data = rating_element.get_attribute("data-favcount")
-                            book_details['score'] = rating_data or "null"
-                            book_details['reviews'] = reviews_data or "null"
-                            print(f"Found rating: {rating_data}, reviews: {reviews_data}")
-                        except Exception as e:
-                            print(f"Could not find rating/reviews: {e}")
-                        
-                        # Extract publisher
-                        try:
-                            publisher_element = driver.find_element(
-                                By.XPATH, "//a[@class='c-product__publisher']"
-                            )
-                            book_details['publisher'] = publisher_element.text.strip()
-                            print(f"Found publisher: {book_details['publisher']}")
-                        except Exception as e:
-                            print(f"Could not find publisher: {e}")
-                        
-                        # Extract category breadcrumb (updated)
-                        try:
-                            # Get the container div first
-                            container = driver.find_element(
-                                By.XPATH, "//div[contains(@class, 'l-container') and contains(@class, 'l-gutter-2x-px')]"
-                            )
-                            # Get the HTML content as string
-                            html_content = container.get_attribute('innerHTML')
-                            
-                            # If container found, look for breadcrumb items
-                            if '<ol class="o-breadcrumb "' in html_content:
-                                category_elements = container.find_elements(
-                                    By.XPATH, ".//span[@itemprop='name']"
-                                )
-                                categories = [elem.text.strip() for elem in category_elements]
-                                book_details['category'] = " > ".join(categories) if categories else "N/A"
-                                print(f"Found category: {book_details['category']}")
-                            else:
-                                print("No breadcrumb found in container")
-                                book_details['category'] = "N/A"
-                        except Exception as e:
-                            error_msg = str(e).split('\n')[0]
-                            print(f"Could not find category: {error_msg}")
-                            book_details['category'] = "N/A"
-                        
-                        # Extract details (pages, edition, ISBN, language)
-                        try:
-                            details_element = driver.find_element(
-                                By.XPATH, "//div[contains(@class, 'o-h5')]"
-                            )
-                            details_text = details_element.text.strip()
-                            
-                            # Check if details start with a number (pages)
-                            if details_text[0].isdigit():
-                                book_details['language'] = "magyar"
-                                if '･' in details_text:
-                                    parts = details_text.split('･')
-                                    book_details['pages'] = parts[0].replace(" oldal", "").strip()
-                                    book_details['edition'] = parts[1].strip()
-                                    if len(parts) > 2:
-                                        book_details['code'] = parts[2].replace("ISBN:", "").strip()
-                            else:
-                                # If starts with language
-                                book_details['language'] = details_text.split('･')[0].strip() if '･' in details_text else details_text
-                                if '･' in details_text:
-                                    parts = details_text.split('･')
-                                    if len(parts) > 1:
-                                        book_details['pages'] = parts[1].replace(" oldal", "").strip() if "oldal" in parts[1] else "N/A"
-                                    if len(parts) > 2:
-                                        book_details['edition'] = parts[2].strip()
-                                    if len(parts) > 3:
-                                        book_details['code'] = parts[3].replace("ISBN:", "").strip()
-                            
-                            print(f"Found details - Language: {book_details['language']}, "
-                                  f"Pages: {book_details['pages']}, "
-                                  f"Edition: {book_details['edition']}, "
-                                  f"Code: {book_details['code']}")
-                        except Exception as e:
-                            print(f"Could not find book details: {e}")
-                        
-                        # Save to CSV
-                        print("\nSaving to CSV...")
-                        writer.writerow(book_details)
-                        save_progress(i + 1)
-                        
-                    except Exception as e:
-                        error_msg = str(e).split('\n')[0]
-                        print(f"Error processing title: {error_msg}")
-                        log_error(title, error_msg)
-                        save_progress(i + 1)
-                        continue
-                    
-                    time.sleep(1)
-                    
+                log.debug("book details", **book_details)
+                
+                # Save to CSV
+                with metrics.phase('write'):
+                    writer.writerow(dict(book_details, **{SHARD_POSITION: i}))
+                    csvfile.flush()
+                    queue.complete(i)
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining(start_line, end_line))
+                log.info("title done", position=i+1, title=title, seconds=f"{time.time() - title_start:.1f}",
+                         transferred=format_bytes(page_bytes(driver)))
+                if tabs:
+                    tabs.release()
+                
+                waiter.until('between titles', 1)
+                
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        log.warning("interrupted by user")
         
     except Exception as e:
-        error_msg = str(e).split('\n')[0]
-        print(f"An error occurred: {error_msg}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(i + 1, total_runtime)
+        log.error("run stopped", error=first_line(e))
         
     finally:
+        # Unfinished titles go back to pending for the next run
+        queue.release_leases(start_line, end_line)
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}", browser_restarts=driver.restarts,
+                 **(tabs.stats if tabs else {}))
+        flush_logs()
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
@@ -1,12 +1,35 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
+from selenium.common.exceptions import TimeoutException
+import argparse
 import time
 import json
 import os
 import csv
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_urls import existing_fieldnames, product_id_from_url
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from listing_index import UNCHANGED_PAGES, ListingIndex, count_lines, queue_new_titles
+from browser_factory import create_driver, page_bytes, format_bytes
+from consent import restore_consent, save_consent
+from page_scripts import bookline_listing_items
+from extractors import bookline_listing_ended
+from adaptive_wait import AdaptiveWait
+from store_config import STORE_URLS, BOOKLINE_LISTING_PATH
+from rate_limiter import RateLimiter, host_of
+from retry import classify, first_line, retry_call
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+
+LAST_PAGE = 10000
+TITLES_FILE = 'Data\Bookline\\bookline_titles.csv'
+HOST = host_of(STORE_URLS['bookline'])
+
+log = get_logger('bookline_listing')
 
 def load_progress():
     if os.path.exists('Scrape\Bookline\scraping_progress.json'):
@@ -17,168 +40,208 @@ def load_progress():
             return data
     return {'current_page': 1, 'total_runtime': 0}
 
-def save_progress(page_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['current_page'] = page_number
-    if runtime is not None:
-        progress_data['total_runtime'] = runtime
-    with open('Scrape\Bookline\scraping_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+def open_queue():
+    """One work item per listing page, seeded on the first run (from scraping_progress.json if it exists)."""
+    queue = WorkQueue('bookline_listing')
+    if not queue.is_seeded():
+        progress = load_progress()
+        queue.seed(((page, str(page), None) for page in range(1, LAST_PAGE + 1)),
+                   progress['current_page'], progress['total_runtime'])
+    return queue
+
+def open_index():
+    """Listing fingerprints, with bookline_titles.csv as the known titles on the first run."""
+    index = ListingIndex('bookline')
+    if not index.has_titles() and os.path.exists(TITLES_FILE):
+        with open(TITLES_FILE, 'r', encoding='utf-8') as f:
+            index.add_titles(row['title'] for row in csv.DictReader(f, delimiter=';'))
+    return index
 
 def format_runtime(seconds):
     from datetime import timedelta
     return str(timedelta(seconds=int(seconds)))
 
-def scrape_bookline():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    current_page = progress['current_page']
-    previous_runtime = progress['total_runtime']
-    first_load = True  # Flag for first page load
+def scrape_page(driver, limiter, archive, metrics, page):
+    """Open a listing page and return its titles, or None past the last page.
+
+    A page that shows neither products nor the end of the listing raises
+    (TimeoutException), so retry_call() loads it again.
+    """
+    url = STORE_URLS['bookline'] + BOOKLINE_LISTING_PATH.format(page=page)
+    with metrics.phase('navigate'):
+        limiter.wait(HOST)
+        driver.get(url)
+        try:
+            # Updated XPath to be more specific and avoid duplicates
+            products = WebDriverWait(driver, 3).until(
+                EC.presence_of_all_elements_located(
+                    (By.XPATH, "//div[@class='l-flex__item l-flex__item--12@small'][.//h2[@class='c-product-title']]")
+                )
+            )
+        except TimeoutException:
+            if not bookline_listing_ended(driver.page_source):
+                raise  # Slow or broken page: retried
+            return None
+
+    archive.put('bookline_listing', url, driver.page_source, {'page': page})
+    # Title link, authors and price of every product in one script call
+    page_titles = []
+    with metrics.phase('extract'):
+        for product in bookline_listing_items(driver, products):
+            if not product['title']:
+                log.warning("no title link in product", page=page, item=product['position'])
+                continue
+            
+            # Combine author and title if author exists
+            author, book_title = product['author'], product['title']
+            full_title = f"{author}: {book_title}" if author else book_title
+            
+            page_titles.append({
+                'title': full_title,
+                'url': product['url'],
+                'product_id': product_id_from_url(product['url'])
+            })
+            log.debug("found title", page=page, title=full_title)
+    return page_titles
+
+def scrape_bookline(incremental=False, titles_file=TITLES_FILE, start_page=None, end_page=None, headless=True):
+    # driver_pool.py passes a page range and a per-shard titles file to run
+    # several browsers side by side; the page fingerprints stay shared
+    driver = create_driver(profile=f'bookline_listing_{start_page}' if start_page is not None else 'bookline_listing',
+                           headless=headless)
+    waiter = AdaptiveWait(driver, 'bookline')
+    limiter = RateLimiter()
+    queue = open_queue()
+    archive = HtmlArchive()
+    index = open_index()
+    unchanged_pages = 0
+    if incremental:
+        # Walk the listing again from page 1 until it stops changing
+        queue.reset()
+    # Pages a crashed run of this range left leased
+    queue.release_leases(start_page, end_page)
+    previous_runtime = queue.runtime()
+    consent_restored = restore_consent(driver, 'bookline')
+    # A listing page counts as one title
+    metrics = ScraperMetrics('bookline_listing')
+    metrics_port = serve_metrics()
+    metrics.set_remaining(queue.remaining(start_page, end_page))
     
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), incremental=incremental,
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
     
     try:
         # Create/open CSV file
-        with open('Data\Bookline\\bookline_titles.csv', 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['page', 'title']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
+        with open(titles_file, 'a', newline='', encoding='utf-8') as csvfile:
+            fieldnames = existing_fieldnames(titles_file, ['page', 'title', 'url', 'product_id'])
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
             
             # Write header if file is empty
-            if os.path.getsize('Data\Bookline\\bookline_titles.csv') == 0:
+            if os.path.getsize(titles_file) == 0:
                 writer.writeheader()
             
-            while current_page <= 10000:
-                print(f"\n{'='*50}")
-                print(f"Processing page {current_page}")
-                print(f"{'='*50}")
-                
-                max_retries = 20  # Maximum number of retry attempts
-                retry_count = 0
-                success = False
+            # Skipped when an earlier run saved the consent cookies
+            if not consent_restored:
+                limiter.wait(HOST)
+                driver.get(STORE_URLS['bookline'])
+                try:
+                    log.debug("handling cookie popup")
+                    cookie_button = WebDriverWait(driver, 5).until(
+                        EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+                    )
+                    cookie_button.click()
+                    waiter.until('popups closed', 1)  # Wait for popup to close
+                except Exception as e:
+                    log.warning("could not handle cookie popup", error=first_line(e))
+                save_consent(driver, 'bookline')
+            
+            for item in queue.items(start_page, end_page):
+                current_page = item['position']
+                log.debug("processing page", page=current_page)
                 
-                while retry_count < max_retries and not success:
-                    try:
-                        url = f"https://bookline.ro/search/search.action?page={current_page}&searchfield=*"
-                        driver.get(url)
-                        
-                        # Handle cookie popup only on first load
-                        if first_load:
-                            try:
-                                print("Handling cookie popup...")
-                                cookie_button = WebDriverWait(driver, 5).until(
-                                    EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
-                                )
-                                cookie_button.click()
-                                time.sleep(1)  # Wait for popup to close
-                            except Exception as e:
-                                print(f"Could not handle cookie popup: {e}")
-                            first_load = False
-                        
-                        # Wait for product items to load
-                        wait = WebDriverWait(driver, 3)
-                        try:
-                            # Updated XPath to be more specific and avoid duplicates
-                            products = wait.until(
-                                EC.presence_of_all_elements_located(
-                                    (By.XPATH, "//div[@class='l-flex__item l-flex__item--12@small'][.//h2[@class='c-product-title']]")
-                                )
-                            )
-                            
-                            if not products:
-                                print("No more products found")
-                                break
-                            
-                            page_titles = []
-                            for product in products:
-                                try:
-                                    # Get the h2 element with author and title info
-                                    title_element = product.find_element(
-                                        By.CLASS_NAME, "c-product-title"
-                                    )
-                                    
-                                    # Get author info from the previous sibling div
-                                    try:
-                                        author_element = product.find_element(
-                                            By.CLASS_NAME, "o-product__authors"
-                                        )
-                                        author = author_element.text.strip()
-                                    except:
-                                        author = ""
-                                    
-                                    # Get the title from the link
-                                    title_link = title_element.find_element(By.TAG_NAME, "a")
-                                    book_title = title_link.text.strip()
-                                    
-                                    # Combine author and title if author exists
-                                    full_title = f"{author}: {book_title}" if author else book_title
-                                    
-                                    if full_title:
-                                        page_titles.append(full_title)
-                                        print(f"Found title: {full_title}")  # Debug print
-                                except Exception as e:
-                                    print(f"Error extracting title: {e}")
-                                    continue
-                            
-                            # Save titles to CSV
-                            for title in page_titles:
-                                writer.writerow({
-                                    'page': current_page,
-                                    'title': title
-                                })
-                            
-                            print(f"Found {len(page_titles)} titles on page {current_page}")
-                            save_progress(current_page)  # Save progress without runtime
-                            success = True
-                            
-                        except Exception as e:
-                            print(f"Error processing page: {e}")
-                            raise
-                        
-                    except Exception as e:
-                        retry_count += 1
-                        print(f"Attempt {retry_count} failed. Error: {e}")
-                        if retry_count < max_retries:
-                            print("Refreshing page and retrying...")
-                            time.sleep(2)  # Wait before retrying
-                            continue
-                        else:
-                            print("Max retries reached. Moving to next page.")
-                            break
+                try:
+                    page_titles = retry_call(scrape_page, driver, limiter, archive, metrics, current_page,
+                                             before_retry=lambda e: limiter.record_page(HOST, driver, e))
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    log.warning("page failed", page=current_page, kind=kind, error=first_line(e))
+                    # The page is retried after the others
+                    queue.fail(current_page, e, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining(start_page, end_page))
+                    continue
                 
-                if not success:
-                    current_page += 1
+                if page_titles is None:
+                    # Past the last page: the rest of this range is empty too,
+                    # only pages that failed earlier are left to retry
+                    log.info("no more products", last_page=current_page - 1)
+                    queue.complete_range(current_page, end_page)
                     continue
                 
-                current_page += 1
-                time.sleep(1)  # Small delay between pages
+                _, new_titles = index.check(current_page, [t['title'] for t in page_titles])
+                if incremental:
+                    # Only titles no earlier crawl has seen are saved and queued. A new title
+                    # shifts every later page, so a page without new ones counts as unchanged
+                    unchanged_pages = 0 if new_titles else unchanged_pages + 1
+                    page_titles = [t for t in page_titles if t['title'] in new_titles]
+                    first_position = count_lines(titles_file, header=True)
+                
+                with metrics.phase('write'):
+                    # Save titles to CSV
+                    for title_data in page_titles:
+                        writer.writerow(dict(title_data, page=current_page))
+                    csvfile.flush()
+                    if incremental and page_titles:
+                        # bookline_titles.csv is also the details input
+                        queue_new_titles('bookline_details', first_position,
+                                         [';'.join(str(dict(t, page=current_page).get(field, '')) for field in fieldnames) + '\n'
+                                          for t in page_titles],
+                                         lambda line: line.split(';')[1])
+                    queue.complete(current_page)
+                
+                log.info("page done", page=current_page, titles=len(page_titles), new_titles=len(new_titles),
+                         transferred=format_bytes(page_bytes(driver)))
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining(start_page, end_page))
+                
+                if incremental and unchanged_pages >= UNCHANGED_PAGES:
+                    log.info("listing unchanged, the rest is already known", unchanged_pages=unchanged_pages)
+                    # reset() made every page pending again; the next full run must not crawl them twice
+                    queue.complete_range(current_page + 1, end_page)
+                    break
+                
+                waiter.until('between pages', 1)  # Small delay between pages
                 
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(current_page, total_runtime)
+        log.warning("interrupted by user")
         
     except Exception as e:
-        print(f"An error occurred: {e}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(current_page, total_runtime)
+        log.error("run stopped", error=first_line(e))
         
     finally:
+        # Unfinished pages go back to pending for the next run
+        queue.release_leases(start_page, end_page)
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(current_page, total_runtime)
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 pages_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        archive.close()
+        index.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
-    scrape_bookline()
+    parser = argparse.ArgumentParser(description="Scrape the Bookline title listing, page by page.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Refresh run: save only new titles, queue them for details and stop "
+                             f"after {UNCHANGED_PAGES} unchanged pages")
+    args = parser.parse_args()
+
+    scrape_bookline(args.incremental)
@@ -0,0 +1,358 @@
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import argparse
+import time
+import json
+import os
+import csv
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_urls import existing_fieldnames, product_id_from_url
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from listing_index import count_lines
+from extractors import bookline_listing_ended
+from browser_factory import create_driver, page_bytes, format_bytes
+from adaptive_wait import AdaptiveWait
+from consent import restore_consent, save_consent
+from store_config import STORE_URLS, BOOKLINE_SORTED_LISTING_PATH, BOOKLINE_FILTERS
+from rate_limiter import RateLimiter, host_of
+from retry import classify, first_line
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+
+LAST_PAGE = 10000
+SORT_LABEL = 'Eladott darabszám szerint'
+DEFAULT_SORT_LABEL = 'Relevancia szerint'
+HOST = host_of(STORE_URLS['bookline'])
+
+log = get_logger('bookline_sorted')
+
+# The Bookline listing sorted by copies sold, for each product type filter
+# (formerly booklineScrape2.py and bookline_antiq.py)
+PRODUCT_TYPES = {
+    'books': {
+        'label': 'Könyv',
+        'queue': 'bookline_listing2',
+        'titles_file': 'Data\Bookline\\Bookline_booktitles.csv',
+        'progress_file': 'Scrape\Bookline\scraping2_progress.json',
+    },
+    'antiquarian': {
+        'label': 'Antikvár',
+        'queue': 'bookline_antiq',
+        'titles_file': 'Data\Bookline\\Bookline_antiqtitles.csv',
+        'progress_file': 'Scrape\Bookline\scraping_antiq_progress.json',
+    },
+}
+
+def load_progress(product_type):
+    progress_file = PRODUCT_TYPES[product_type]['progress_file']
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r') as f:
+            data = json.load(f)
+            if 'total_runtime' not in data:
+                data['total_runtime'] = 0
+            return data
+    return {'current_page': 1, 'total_runtime': 0}
+
+def open_queue(product_type='books'):
+    """One work item per listing page, seeded on the first run (from the type's progress JSON file if it exists)."""
+    queue = WorkQueue(PRODUCT_TYPES[product_type]['queue'])
+    if not queue.is_seeded():
+        progress = load_progress(product_type)
+        queue.seed(((page, str(page), None) for page in range(1, LAST_PAGE + 1)),
+                   progress['current_page'], progress['total_runtime'])
+    return queue
+
+def format_runtime(seconds):
+    from datetime import timedelta
+    return str(timedelta(seconds=int(seconds)))
+
+def with_page(url, page):
+    # url with its page parameter set to page
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True) if key != 'page']
+    return urlunsplit(parts._replace(query=urlencode([('page', page)] + query, safe='*')))
+
+def shown(driver, xpath):
+    return any(element.is_displayed() for element in driver.find_elements(By.XPATH, xpath))
+
+def listing_sorted(driver, filter_label):
+    """True when the loaded page is sorted by copies sold and filtered to filter_label."""
+    if not shown(driver, f"//a[contains(text(), '{SORT_LABEL}')]") or shown(driver, f"//a[contains(text(), '{DEFAULT_SORT_LABEL}')]"):
+        return False
+    label = f"//label[contains(text(), '{filter_label}')]"
+    boxes = driver.find_elements(By.XPATH, f"{label}//input | {label}/preceding-sibling::input[1] | //input[@id=string({label}/@for)]")
+    return any(box.is_selected() for box in boxes)
+
+def sort_by_clicks(driver, limiter, filter_label):
+    """The old setup: choose the sort order and tick the filter checkbox on the page."""
+    log.info("sorting by clicks", sort=SORT_LABEL, filter=filter_label)
+    WebDriverWait(driver, 5).until(
+        EC.element_to_be_clickable((By.XPATH, f"//a[contains(text(), '{DEFAULT_SORT_LABEL}')]"))
+    ).click()
+    sort_link = WebDriverWait(driver, 5).until(
+        EC.element_to_be_clickable((By.XPATH, f"//a[contains(text(), '{SORT_LABEL}')]"))
+    )
+    limiter.wait(HOST)  # Both choices reload the listing
+    sort_link.click()
+    WebDriverWait(driver, 10).until(lambda d: shown(d, f"//a[contains(text(), '{SORT_LABEL}')]"))
+    filter_box = WebDriverWait(driver, 10).until(
+        EC.element_to_be_clickable((By.XPATH, f"//label[contains(text(), '{filter_label}')]"))
+    )
+    limiter.wait(HOST)
+    filter_box.click()
+    WebDriverWait(driver, 10).until(lambda d: listing_sorted(d, filter_label))
+
+def renumber_ranks(titles_file, offset, first_rank):
+    """Sort the rows written after offset by page and rank them from first_rank.
+
+    The work queue retries a failed page after the others, so its rows are
+    written last; this gives them the ranks of their place in the listing.
+    """
+    with open(titles_file, 'r+', newline='', encoding='utf-8') as f:
+        fieldnames = next(csv.reader([f.readline()], delimiter=';'))
+        f.seek(offset)
+        rows = list(csv.DictReader(f, fieldnames=fieldnames, delimiter=';'))
+        rows.sort(key=lambda row: int(row['page']))
+        for rank, row in enumerate(rows, first_rank):
+            row['rank'] = rank
+        f.seek(offset)
+        f.truncate()
+        csv.DictWriter(f, fieldnames=fieldnames, delimiter=';').writerows(rows)
+
+def scrape_bookline(product_type='books', titles_file=None, start_page=None, end_page=None, headless=True):
+    # The defaults crawl every page left; driver_pool.py passes a page range
+    # and a per-shard titles file to run several browsers side by side
+    config = PRODUCT_TYPES[product_type]
+    titles_file = titles_file or config['titles_file']
+    run_name = f"{config['queue']}_{start_page}" if start_page is not None else config['queue']
+    driver = create_driver(profile=run_name, headless=headless)
+    waiter = AdaptiveWait(driver, 'bookline')
+    limiter = RateLimiter()
+    queue = open_queue(product_type)
+    archive = HtmlArchive()
+    # Pages a crashed run of this range left leased
+    queue.release_leases(start_page, end_page)
+    previous_runtime = queue.runtime()
+    consent_restored = restore_consent(driver, 'bookline')
+    # Ranks continue the file's line numbers, in page order once the run is over
+    # (a pool's merge renumbers them the same way)
+    first_rank = current_rank = count_lines(titles_file, header=True) + 1
+    run_offset = None
+    # Sorted and filtered by the URL, so any page opens directly. Replaced by
+    # the address the site shows after sorting by clicks if the site ignores
+    # the URL parameters.
+    listing_url = STORE_URLS['bookline'] + BOOKLINE_SORTED_LISTING_PATH.format(
+        page=1, product_type=BOOKLINE_FILTERS[product_type])
+
+    # A listing page counts as one title
+    metrics = ScraperMetrics(run_name)
+    metrics_port = serve_metrics()
+    metrics.set_remaining(queue.remaining(start_page, end_page))
+
+    start_time = time.time()
+    log.info("starting", product_type=product_type, previous_runtime=format_runtime(previous_runtime),
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+
+    try:
+        # Create/open CSV file
+        with open(titles_file, 'a', newline='', encoding='utf-8') as csvfile:
+            fieldnames = existing_fieldnames(titles_file,
+                                             ['page', 'rank', 'title', 'publisher', 'url', 'product_id'])
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+
+            # Write header if file is empty
+            if os.path.getsize(titles_file) == 0:
+                writer.writeheader()
+            run_offset = csvfile.tell()
+
+            # Skipped when an earlier run saved the consent cookies
+            if not consent_restored:
+                limiter.wait(HOST)
+                driver.get(STORE_URLS['bookline'])
+                try:
+                    log.debug("handling cookie popup")
+                    cookie_button = WebDriverWait(driver, 5).until(
+                        EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+                    )
+                    cookie_button.click()
+                    waiter.until('popups closed', 1)  # Wait for popup to close
+                except Exception as e:
+                    log.warning("could not handle cookie popup", error=first_line(e))
+                save_consent(driver, 'bookline')
+
+            for item in queue.items(start_page, end_page):
+                current_page = item['position']
+                log.debug("processing page", page=current_page)
+
+                try:
+                    with metrics.phase('navigate'):
+                        limiter.wait(HOST)
+                        driver.get(with_page(listing_url, current_page))
+
+                    # Wait for product items to load
+                    wait = WebDriverWait(driver, 4)
+                    # Try multiple selectors to find products
+                    products = None
+                    selectors = [
+                        "//div[contains(@class, 't-product-detailed')]",
+                        "//div[contains(@class, 'c-product-detailed')]",
+                        "//div[contains(@class, 'o-product')]",
+                        "//div[contains(@class, 'l-flex__item')][.//h2[contains(@class, 'c-product-title')]]"
+                    ]
+
+                    for product_selector in selectors:
+                        try:
+                            products = wait.until(
+                                EC.presence_of_all_elements_located((By.XPATH, product_selector))
+                            )
+                            if products:
+                                log.debug("found products", selector=product_selector)
+                                break
+                        except:
+                            continue
+
+                    if not products:
+                        if not bookline_listing_ended(driver.page_source):
+                            # Slow or broken page: retried after the others
+                            raise Exception("No products found with any selector")
+                        # Past the last page: the rest of this range is empty too,
+                        # only pages that failed earlier are left to retry
+                        log.info("no more products", last_page=current_page - 1)
+                        queue.complete_range(current_page, end_page)
+                        continue
+
+                    if not listing_sorted(driver, config['label']):
+                        # Ranks would be wrong: sort by clicks and use the address that gives
+                        log.warning("the listing is not sorted by the URL parameters")
+                        sort_by_clicks(driver, limiter, config['label'])
+                        listing_url = driver.current_url
+                        log.info("using the sorted address for the listing pages", url=listing_url)
+                        limiter.wait(HOST)
+                        driver.get(with_page(listing_url, current_page))
+                        WebDriverWait(driver, 10).until(lambda d: listing_sorted(d, config['label']))
+                        products = WebDriverWait(driver, 10).until(
+                            EC.presence_of_all_elements_located((By.XPATH, product_selector))
+                        )
+
+                    archive.put('bookline_listing', driver.current_url, driver.page_source,
+                                {'page': current_page, 'product_type': product_type})
+                    page_titles = []
+                    with metrics.phase('extract'):
+                        for product in products:
+                            try:
+                                # Try multiple ways to find the title
+                                title_element = None
+                                try:
+                                    title_element = product.find_element(By.CLASS_NAME, "c-product-title")
+                                except:
+                                    try:
+                                        title_element = product.find_element(By.XPATH, ".//h2[contains(@class, 'c-product-title')]")
+                                    except:
+                                        continue
+
+                                if not title_element:
+                                    continue
+
+                                # Get author info
+                                author = ""
+                                try:
+                                    author_element = product.find_element(By.CLASS_NAME, "o-product__authors")
+                                    author = author_element.text.strip()
+                                except:
+                                    pass
+
+                                # Get the title and product link from the link
+                                try:
+                                    title_link = title_element.find_element(By.TAG_NAME, "a")
+                                    book_title = title_link.text.strip()
+                                    url = title_link.get_attribute('href') or ""
+                                except:
+                                    book_title = title_element.text.strip()
+                                    url = ""
+
+                                # Get publisher info
+                                publisher = ""
+                                try:
+                                    publisher_element = product.find_element(By.CLASS_NAME, "o-product__publisher")
+                                    publisher = publisher_element.text.strip()
+                                except:
+                                    pass
+
+                                full_title = f"{author}: {book_title}" if author else book_title
+
+                                if full_title:
+                                    page_titles.append({
+                                        'page': current_page,
+                                        'rank': current_rank,
+                                        'title': full_title,
+                                        'publisher': publisher,
+                                        'url': url,
+                                        'product_id': product_id_from_url(url)
+                                    })
+                                    log.debug("found title", page=current_page, rank=current_rank,
+                                              title=full_title, publisher=publisher)
+                                    current_rank += 1
+                            except Exception as e:
+                                log.warning("could not extract title", page=current_page, error=first_line(e))
+                                continue
+
+                    if not page_titles:
+                        raise Exception("No titles extracted")
+
+                    with metrics.phase('write'):
+                        # Save titles to CSV
+                        for title_data in page_titles:
+                            writer.writerow(title_data)
+                        csvfile.flush()
+                        queue.complete(current_page)
+
+                    log.info("page done", page=current_page, titles=len(page_titles),
+                             transferred=format_bytes(page_bytes(driver)))
+                    limiter.record_page(HOST, driver)
+                    metrics.title_done()
+                    metrics.set_remaining(queue.remaining(start_page, end_page))
+                    waiter.until('between pages', 2)  # Small delay between pages
+
+                except Exception as e:
+                    # The page is retried after the others
+                    log.warning("page failed", page=current_page, error=first_line(e))
+                    limiter.record_page(HOST, driver, e)
+                    queue.fail(current_page, e)
+                    metrics.title_failed(classify(e))
+
+    except KeyboardInterrupt:
+        log.warning("interrupted by user")
+
+    except Exception as e:
+        log.error("run stopped", error=first_line(e))
+
+    finally:
+        # Unfinished pages go back to pending for the next run
+        queue.release_leases(start_page, end_page)
+        runtime = time.time() - start_time
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 pages_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        if run_offset is not None:
+            renumber_ranks(titles_file, run_offset, first_rank)
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
+        driver.quit()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape a Bookline listing sorted by copies sold.")
+    parser.add_argument('--type', choices=list(PRODUCT_TYPES), default='books',
+                        help="books writes Bookline_booktitles.csv, antiquarian Bookline_antiqtitles.csv")
+    parser.add_argument('--show', action='store_true', help="Show the browser window")
+    args = parser.parse_args()
+
+    scrape_bookline(args.type, headless=not args.show)
@@ -0,0 +1,316 @@
+import requests
+import argparse
+import base64
+import time
+import json
+import os
+import csv
+import sys
+from datetime import timedelta
+from urllib.parse import quote, quote_plus
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractors import parse_carturesti_api_search, parse_carturesti_api_product, parse_carturesti_search_results
+from store_config import (STORE_URLS, SEARCH_PATHS, HEADERS, CARTURESTI_FIELDNAMES, CARTURESTI_API_PATHS,
+                          CARTURESTI_API_FILE)
+from product_urls import product_id_from_url, rebase_url
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from title_matching import best_match
+from rate_limiter import RateLimiter, host_of
+from retry import TRANSIENT, NOT_FOUND, PARSE_ERROR, classify, first_line, retry_call
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+
+BASE_URL = STORE_URLS['carturesti']
+
+# Same files and work queue as carturesti_scrape_details.py, so the two modes can take over from each other
+PROGRESS_FILE = 'Scrape/Carturesti/details_progress.json'
+BOOKS_FILE = 'Data/Carturesti/book_details_carturesti.csv'
+DETAILS_FILE = 'Data/Carturesti/book_details.csv'
+QUEUE_NAME = 'carturesti_details'
+
+# Seconds --capture lets a page's XHR requests finish before reading them
+CAPTURE_WAIT = 5
+
+log = get_logger('carturesti_details_api')
+
+def load_progress():
+    if os.path.exists(PROGRESS_FILE):
+        with open(PROGRESS_FILE, 'r') as f:
+            data = json.load(f)
+            if 'total_runtime' not in data:
+                data['total_runtime'] = 0
+            return data
+    return {'last_processed_line': 0, 'total_runtime': 0}
+
+def format_runtime(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+def row_key(row):
+    # "title - author", the format error_titles.txt used
+    return f"{row[0]} - {row[2]}" if len(row) == 3 else f"CSV parsing error - {','.join(row)}"
+
+def open_queue():
+    """Work queue of the book list, seeded on the first run (from details_progress.json if it exists)."""
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        progress = load_progress()
+        with open(BOOKS_FILE, 'r', encoding='utf-8') as f:
+            csv_reader = csv.reader(f, delimiter=',', quotechar='"')
+            next(csv_reader)  # Skip header
+            queue.seed(((i, row_key(row), row) for i, row in enumerate(csv_reader)),
+                       progress['last_processed_line'], progress['total_runtime'])
+    return queue
+
+def load_endpoints(path=CARTURESTI_API_FILE):
+    """The API URL templates: CARTURESTI_API_PATHS, overridden by the ones --capture recorded."""
+    endpoints = dict(CARTURESTI_API_PATHS)
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            endpoints.update(json.load(f))
+    return endpoints
+
+def api_url(base_url, template, **values):
+    # Captured endpoints on another host are kept as absolute URLs
+    url = template.format(**values)
+    return url if url.startswith('http') else base_url + url
+
+def clean_search_query(text):
+    return text.replace('%', '')
+
+def create_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    session.headers['Accept'] = "application/json, text/plain, */*"
+    return session
+
+def fetch_json(session, url, limiter=None, timeout=15):
+    # The body is returned as text, so it can be archived as received
+    host = host_of(url)
+    if limiter:
+        limiter.wait(host)
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        if limiter:
+            limiter.record(host, error=e)
+        raise
+    if limiter:
+        limiter.record(host, response.status_code, retry_after=response.headers.get('Retry-After'))
+    response.raise_for_status()
+    return response.text
+
+def scrape_title(session, base_url, endpoints, metrics, title, author, archive=None, limiter=None):
+    """Search the book through the JSON API and return its row, or None if no search result matches it."""
+    query = f"{clean_search_query(title)} {clean_search_query(author)}"
+    search_url = api_url(base_url, endpoints['search'], query=quote(query, safe=''))
+    with metrics.phase('search'):
+        payload = fetch_json(session, search_url, limiter)
+        if archive:
+            archive.put('carturesti_api_search', search_url, payload, {'query': query})
+        results = parse_carturesti_api_search(payload)
+        match, match_score = best_match([r for r in results if r['product_id']], title, author)
+    if not match:
+        return None
+    log.debug("found match", score=f"{match_score:.2f}", product_id=match['product_id'])
+
+    product_url = api_url(base_url, endpoints['product'], product_id=quote(match['product_id'], safe=''))
+    with metrics.phase('navigate'):
+        payload = fetch_json(session, product_url, limiter)
+    book_details = {field: "N/A" for field in CARTURESTI_FIELDNAMES}
+    with metrics.phase('extract'):
+        if archive:
+            archive.put('carturesti_api', product_url, payload, {'product_id': match['product_id']})
+        book_details.update(parse_carturesti_api_product(payload))
+    return book_details
+
+def scrape_book_details_api(base_url=BASE_URL, delay=0.0, max_rate=None):
+    session = create_session()
+    limiter = RateLimiter({host_of(base_url): {'max': max_rate}} if max_rate else None)
+    metrics = ScraperMetrics('carturesti_details_api')
+    metrics_port = serve_metrics()
+    endpoints = load_endpoints()
+    queue = open_queue()
+    archive = HtmlArchive()
+    # Books a crashed run left leased
+    queue.release_leases()
+    previous_runtime = queue.runtime()
+    metrics.set_remaining(queue.remaining())
+
+    start_time = time.time()
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), base_url=base_url,
+             search=endpoints['search'], product=endpoints['product'],
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+
+    try:
+        with open(DETAILS_FILE, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=CARTURESTI_FIELDNAMES, delimiter=';')
+
+            if os.path.getsize(DETAILS_FILE) == 0:
+                writer.writeheader()
+
+            for item in queue.items():
+                i, row = item['position'], item['payload']
+                try:
+                    csv_title, csv_price, csv_author = row
+                except ValueError as e:
+                    log.warning("unreadable CSV row", position=i+1, row=row)
+                    queue.fail(i, e, retry=False, kind=PARSE_ERROR)
+                    metrics.title_failed(PARSE_ERROR)
+                    continue
+                title_start = time.time()
+
+                try:
+                    book_details = retry_call(scrape_title, session, base_url, endpoints, metrics,
+                                              csv_title, csv_author, archive, limiter)
+                except (requests.RequestException, IndexError, ValueError, KeyError) as e:
+                    kind = classify(e)
+                    log.warning("book failed", position=i+1, title=csv_title, author=csv_author, kind=kind,
+                                error=first_line(e))
+                    # Only transient failures come back; parse errors are recorded once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining())
+                    continue
+
+                if book_details is None:
+                    log.info("book failed", position=i+1, title=csv_title, author=csv_author, kind=NOT_FOUND,
+                             error="No matching search result")
+                    queue.fail(i, "No matching search result", retry=False, kind=NOT_FOUND)
+                    metrics.title_failed(NOT_FOUND)
+                    metrics.set_remaining(queue.remaining())
+                    continue
+
+                log.debug("book details", **{key: value for key, value in book_details.items() if value != "N/A"})
+                with metrics.phase('write'):
+                    writer.writerow(book_details)
+                    csvfile.flush()
+                    queue.complete(i)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining())
+                log.info("book done", position=i+1, title=csv_title, author=csv_author,
+                         seconds=f"{time.time() - title_start:.3f}")
+
+                if delay:
+                    time.sleep(delay)
+
+    except KeyboardInterrupt:
+        log.warning("interrupted by user")
+
+    finally:
+        queue.release_leases()
+        runtime = time.time() - start_time
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        session.close()
+
+
+def json_responses(driver):
+    """(url, body) of the JSON responses the browser received since the last call."""
+    responses = []
+    for entry in driver.get_log('performance'):
+        message = json.loads(entry['message'])['message']
+        if message['method'] != 'Network.responseReceived':
+            continue
+        response = message['params']['response']
+        if 'json' not in response.get('mimeType', ''):
+            continue
+        try:
+            body = driver.execute_cdp_cmd('Network.getResponseBody', {'requestId': message['params']['requestId']})
+        except Exception:
+            continue  # Already dropped from the browser's buffer
+        text = base64.b64decode(body['body']).decode('utf-8') if body.get('base64Encoded') else body['body']
+        responses.append((response['url'], text))
+    return responses
+
+def endpoint_template(url, name, values):
+    """url with the first of values that it contains replaced by {name}, relative to the store if on its host."""
+    if url.startswith(BASE_URL):
+        url = url[len(BASE_URL):]
+    for value in values:
+        if value and value in url:
+            return url.replace(value, '{' + name + '}', 1)
+    return None
+
+def capture_endpoints(title, author="", headless=True):
+    """Search one book in the browser and record the JSON endpoints the Angular app calls.
+
+    Every JSON response goes to the HTML archive (carturesti_api_search and
+    carturesti_api), where mock_store.py replays them as fixtures. The URL
+    templates of the search and product calls are saved to CARTURESTI_API_FILE.
+    """
+    # Only this mode needs a browser
+    from browser_factory import create_driver
+    from consent import open_store
+
+    # The JSON responses are read from the performance log
+    driver = create_driver(profile='carturesti_capture', headless=headless, block_resources=False, network_log=True)
+    archive = HtmlArchive()
+    endpoints = {}
+    try:
+        open_store(driver, 'carturesti')
+        json_responses(driver)  # Drop the home page's requests
+
+        query = f"{clean_search_query(title)} {clean_search_query(author)}".strip()
+        driver.get(BASE_URL + SEARCH_PATHS['carturesti'].format(query=quote(query, safe='')))
+        time.sleep(CAPTURE_WAIT)
+        for url, body in json_responses(driver):
+            print(f"Search response: {url}")
+            archive.put('carturesti_api_search', url, body, {'query': query})
+            template = endpoint_template(url, 'query', [quote(query, safe=''), quote_plus(query), quote(query)])
+            if template and 'search' not in endpoints:
+                endpoints['search'] = template
+
+        hrefs = parse_carturesti_search_results(driver.page_source)
+        if not hrefs:
+            print("No search results, nothing to capture for the product page")
+            return endpoints
+        product_url = rebase_url(BASE_URL, hrefs[0])
+        product_id = product_id_from_url(product_url)
+        driver.get(product_url)
+        time.sleep(CAPTURE_WAIT)
+        for url, body in json_responses(driver):
+            print(f"Product response: {url}")
+            archive.put('carturesti_api', url, body, {'product_id': product_id})
+            template = endpoint_template(url, 'product_id', [product_id])
+            if template and 'product' not in endpoints:
+                endpoints['product'] = template
+    finally:
+        archive.close()
+        driver.quit()
+
+    if len(endpoints) == 2:
+        with open(CARTURESTI_API_FILE, 'w', encoding='utf-8') as f:
+            json.dump(endpoints, f, indent=2)
+        print(f"Saved {endpoints} to {CARTURESTI_API_FILE}")
+    else:
+        # The archived responses show the calls; the missing template can be written by hand
+        print(f"Found only {endpoints or 'no endpoints'}, {CARTURESTI_API_FILE} not written")
+    return endpoints
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Carturesti book details from its JSON API (no rendering).")
+    parser.add_argument('--base-url', default=BASE_URL,
+                        help="Store root to fetch from, e.g. mock_store.py serving recorded JSON")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="Seconds to wait between books")
+    parser.add_argument('--max-rate', type=float,
+                        help="Maximum requests per second (the limiter finds the rate the store sustains)")
+    parser.add_argument('--capture', metavar='TITLE',
+                        help="Open TITLE in the browser and record the API endpoints instead of scraping")
+    parser.add_argument('--author', default="",
+                        help="Author of the --capture title")
+    parser.add_argument('--show-browser', action='store_true',
+                        help="Run the --capture browser with a window")
+    args = parser.parse_args()
+    if args.capture:
+        capture_endpoints(args.capture, args.author, headless=not args.show_browser)
+    else:
+        scrape_book_details_api(args.base_url.rstrip('/'), args.delay, args.max_rate)
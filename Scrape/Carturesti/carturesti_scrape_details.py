@@ -1,252 +1,241 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 import time
 import json
 import os
 import csv
+import sys
 from datetime import timedelta
 
-def load_progress():
-    if os.path.exists('Scrape\Carturesti\details_progress.json'):
-        with open('Scrape\Carturesti\details_progress.json', 'r') as f:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractors import parse_carturesti_book_page
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from browser_factory import page_bytes, format_bytes
+from driver_watchdog import WatchedDriver
+from consent import open_store
+from adaptive_wait import AdaptiveWait, value_is
+from page_scripts import carturesti_search_results
+from title_matching import best_match, slug_title
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from store_config import STORE_URLS
+from rate_limiter import RateLimiter, host_of
+from retry import TRANSIENT, NOT_FOUND, PARSE_ERROR, NotFound, classify, first_line, no_results, retry_call
+from driver_pool import SHARD_POSITION
+
+PROGRESS_FILE = 'Scrape\Carturesti\details_progress.json'
+DETAILS_FILE = 'Data\Carturesti\\book_details.csv'
+QUEUE_NAME = 'carturesti_details'
+HOST = host_of(STORE_URLS['carturesti'])
+
+log = get_logger(QUEUE_NAME)
+
+def load_progress(progress_file=PROGRESS_FILE, start_line=0):
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r') as f:
             data = json.load(f)
             if 'total_runtime' not in data:
                 data['total_runtime'] = 0
             return data
-    return {'last_processed_line': 0, 'total_runtime': 0}
-
-def save_progress(line_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['last_processed_line'] = line_number
-    if runtime is not None:
-        progress_data['total_runtime'] = runtime
-    with open('Scrape\Carturesti\details_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+    return {'last_processed_line': start_line, 'total_runtime': 0}
 
 def format_runtime(seconds):
     return str(timedelta(seconds=int(seconds)))
 
-def log_error(title):
-    with open('Data\Carturesti\error_titles.txt', 'a', encoding='utf-8') as f:
-        f.write(f"{title}\n")
+def row_key(row):
+    # "title - author", the format error_titles.txt used
+    return f"{row[0]} - {row[2]}" if len(row) == 3 else f"CSV parsing error - {','.join(row)}"
+
+def open_queue():
+    """Work queue of the book list, seeded on the first run (from details_progress.json if it exists)."""
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        progress = load_progress()
+        with open('Data\Carturesti\\book_details_carturesti.csv', 'r', encoding='utf-8') as f:
+            csv_reader = csv.reader(f, delimiter=',', quotechar='"')
+            next(csv_reader)  # Skip header
+            queue.seed(((i, row_key(row), row) for i, row in enumerate(csv_reader)),
+                       progress['last_processed_line'], progress['total_runtime'])
+    return queue
 
 def clean_search_query(text):
     # Remove percentage symbols
     return text.replace('%', '')
 
-def scrape_book_details():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
+def scrape_title(driver, waiter, limiter, archive, metrics, search_query, title, author, fieldnames):
+    """Search the book, open the result that best matches title and author and return its row.
+
+    Raises NotFound when no search result matches.
+    """
+    with metrics.phase('search'):
+        log.debug("searching", query=search_query)
+        search_box = WebDriverWait(driver, 6).until(
+            EC.presence_of_element_located((By.XPATH, "//input[@id='search-input']"))
+        )
+        search_box.clear()
+        waiter.until('search box cleared', 1, value_is(search_box, ""), network_idle=False)
+        search_box.send_keys(search_query)
+        waiter.until('query typed', 0.5, value_is(search_box, search_query), network_idle=False)
+        limiter.wait(HOST)
+        search_box.send_keys(Keys.RETURN)
+        
+        # Wait for the results and click the best match
+        try:
+            WebDriverWait(driver, 6).until(
+                EC.element_to_be_clickable((
+                    By.XPATH, 
+                    "//a[@class='clean-a select-item-event' and contains(@data-ng-click, 'onProductClick')]"
+                ))
+            )
+        except TimeoutException as e:
+            raise no_results(driver, e)
+        # Result titles are matched by their product URL slug
+        results = [dict(result, title=slug_title(result['href'])) for result in carturesti_search_results(driver)]
+        match, match_score = best_match(results, title, author)
+        if not match:
+            raise NotFound(f"No matching search result (best score {match_score:.2f})")
+        log.debug("found match", score=f"{match_score:.2f}", url=match['href'])
+    with metrics.phase('navigate'):
+        limiter.wait(HOST)
+        match['element'].click()
+        waiter.until('product page', 1)
     
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    start_line = progress['last_processed_line']
-    previous_runtime = progress['total_runtime']
+    # Initialize book details
+    book_details = {field: "N/A" for field in fieldnames}
+    
+    # Parse every field from one copy of the page source
+    with metrics.phase('extract'):
+        page_source = driver.page_source
+        archive.put('carturesti_details', driver.current_url, page_source, {'csv_title': title, 'csv_author': author})
+        book_details.update(parse_carturesti_book_page(page_source))
+    return book_details
+
+def reload_home(driver, limiter, error=None):
+    # Back to a known state before the next attempt or book
+    if error is not None:
+        limiter.record_page(HOST, driver, error)
+    if driver.ensure_healthy():
+        return  # A new browser, already on the home page
+    log.debug("going to main page")
+    limiter.wait(HOST)
+    driver.get(STORE_URLS['carturesti'] + "/")
+
+def scrape_book_details(details_file=DETAILS_FILE, start_line=None, end_line=None, headless=True):
+    # The defaults scrape the whole title file; driver_pool.py passes a line
+    # range and a per-shard details file to run several browsers side by side
+    # One browser profile per line range, so driver_pool shards never share one
+    run_name = f"{QUEUE_NAME}_{start_line}" if start_line is not None else QUEUE_NAME
+    # Restarted between titles when it gets slow or big, and when a title hangs
+    limiter = RateLimiter()
+    driver = WatchedDriver('carturesti', profile=run_name, headless=headless, limiter=limiter)
+    waiter = AdaptiveWait(driver, 'carturesti')
+    metrics = ScraperMetrics(run_name)
+    metrics_port = serve_metrics()
+    queue = open_queue()
+    archive = HtmlArchive()
+    # Books a crashed run of this range left leased
+    queue.release_leases(start_line, end_line)
+    previous_runtime = queue.runtime()
+    metrics.set_remaining(queue.remaining(start_line, end_line))
     
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
+    log.info("starting", previous_runtime=format_runtime(previous_runtime),
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
     
     try:
-        print("Opening Carturesti.ro...")
-        driver.get("https://carturesti.ro/")
-        
-        # Handle cookie popup
-        try:
-            print("Handling cookie popup...")
-            cookie_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CLASS_NAME, "cc-deny"))
-            )
-            cookie_button.click()
-            time.sleep(1)
-        except Exception as e:
-            error_msg = str(e).split('\n')[0]
-            print(f"Could not handle cookie popup: {error_msg}")
+        log.info("opening Carturesti.ro")
+        # Saved consent first; the popups are only handled when there is none
+        open_store(driver, 'carturesti', limiter=limiter)
 
-        with open('Data\Carturesti\\book_details.csv', 'a', newline='', encoding='utf-8') as csvfile:
+        with open(details_file, 'a', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['title', 'author', 'score', 'reviews', 'price', 'category_1', 
                          'category_2', 'category_3', 'category_4', 'language', 'publish_date', 
                          'publisher', 'pages', 'translator', 'edition']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
+            if details_file != DETAILS_FILE:
+                # A driver_pool.py shard: the queue position lets the merge restore input order
+                fieldnames = fieldnames + [SHARD_POSITION]
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
             
-            if os.path.getsize('Data\Carturesti\\book_details.csv') == 0:
+            if os.path.getsize(details_file) == 0:
                 writer.writeheader()
             
-            with open('Data\Carturesti\\book_details_carturesti.csv', 'r', encoding='utf-8') as f:
-                csv_reader = csv.reader(f, delimiter=',', quotechar='"')
-                next(csv_reader)  # Skip header
-                lines = list(csv_reader)[start_line:]
+            books_processed = 0  # Add counter at the start of processing
+
+            for item in queue.items(start_line, end_line):
+                i, row = item['position'], item['payload']
+                try:
+                    # Unpack the row values
+                    csv_title, csv_price, csv_author = row
+                except ValueError as e:
+                    log.warning("unreadable CSV row", position=i+1, row=row)
+                    queue.fail(i, e, retry=False, kind=PARSE_ERROR)
+                    metrics.title_failed(PARSE_ERROR)
+                    continue
+
+                # Clean the title and author before creating search query
+                clean_title = clean_search_query(csv_title)
+                clean_author = clean_search_query(csv_author)
+                search_query = f"{clean_title} {clean_author}"
+                title_start = time.time()
+                driver.check_health()
+                
+                try:
+                    book_details = retry_call(scrape_title, driver, waiter, limiter, archive, metrics, search_query,
+                                              csv_title, csv_author, fieldnames,
+                                              before_retry=lambda e: reload_home(driver, limiter, e))
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    # Misses are expected; everything else is worth a look
+                    (log.info if kind == NOT_FOUND else log.warning)(
+                        "book failed", position=i+1, title=csv_title, author=csv_author, kind=kind, error=first_line(e))
+                    # Only transient failures come back; misses and parse errors are recorded once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining(start_line, end_line))
+                    if kind == TRANSIENT:
+                        reload_home(driver, limiter)
+                    continue
+
+                log.debug("book details", **{key: value for key, value in book_details.items() if value != "N/A"})
+                
+                # Save to CSV
+                with metrics.phase('write'):
+                    writer.writerow(dict(book_details, **{SHARD_POSITION: i}))
+                    csvfile.flush()
+                    queue.complete(i)
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining(start_line, end_line))
+                books_processed += 1  # Increment counter after successful processing
+                log.info("book done", position=i+1, title=csv_title, author=csv_author,
+                         seconds=f"{time.time() - title_start:.1f}", transferred=format_bytes(page_bytes(driver)))
+                
+                waiter.until('between titles', 1)
                 
-                books_processed = 0  # Add counter at the start of processing
-
-                for i, row in enumerate(lines, start=start_line):
-                    try:
-                           
-                        # Unpack the row values
-                        csv_title, csv_price, csv_author = row
-                        # Clean the title and author before creating search query
-                        clean_title = clean_search_query(csv_title)
-                        clean_author = clean_search_query(csv_author)
-                        search_query = f"{clean_title} {clean_author}"
-                        
-                        print(f"\n{'='*50}")
-                        print(f"Processing book {i+1}:")
-                        print(f"Original title: {csv_title}")
-                        print(f"Search query: {search_query}")
-                        print(f"Author: {csv_author}")
-                        print(f"{'='*50}")
-                        
-                        try:
-                            print("Searching for the book...")
-                            search_box = WebDriverWait(driver, 6).until(
-                                EC.presence_of_element_located((By.XPATH, "//input[@id='search-input']"))
-                            )
-                            search_box.clear()
-                            time.sleep(1)
-                            search_box.send_keys(search_query)
-                            time.sleep(0.5)
-                            search_box.send_keys(Keys.RETURN)
-                            
-                            # Wait for and click first result
-                            try:
-                                print("Looking for first result...")
-                                first_result = WebDriverWait(driver, 6).until(
-                                    EC.element_to_be_clickable((
-                                        By.XPATH, 
-                                        "//a[@class='clean-a select-item-event' and contains(@data-ng-click, 'onProductClick')]"
-                                    ))
-                                )
-                                print("Found result, clicking...")
-                                first_result.click()
-                                time.sleep(1)
-                            except Exception as e:
-                                print("Could not find or click search result")
-                                log_error(f"{csv_title} - {csv_author}")
-                                save_progress(i + 1)
-                                continue
-                            
-                            # Initialize book details
-                            book_details = {field: "N/A" for field in fieldnames}
-                            
-                            # Extract title
-                            try:
-                                title_element = driver.find_element(By.XPATH, "//h1[@class='titluProdus']")
-                                book_details['title'] = title_element.text.strip()
-                                print(f"Found title: {book_details['title']}")
-                            except Exception as e:
-                                print("Could not find title")
-                            
-                            # Extract author
-                            try:
-                                author_element = driver.find_element(By.XPATH, "//a[contains(@href, '/autor/')]")
-                                book_details['author'] = author_element.text.strip()
-                                print(f"Found author: {book_details['author']}")
-                            except Exception as e:
-                                print("Could not find author")
-                            
-                            # Extract score and reviews
-                            try:
-                                score_element = driver.find_element(
-                                    By.XPATH, "//span[@data-ng-bind='h.numberFormat(agregateRating,1)']"
-                                )
-                                reviews_element = driver.find_element(
-                                    By.XPATH, "//span[@data-ng-bind='votes']"
-                                )
-                                book_details['score'] = score_element.text.strip()
-                                book_details['reviews'] = reviews_element.text.strip()
-                                print(f"Found rating: {book_details['score']}, reviews: {book_details['reviews']}")
-                            except Exception as e:
-                                print("Could not find rating/reviews")
-                            
-                            # Extract price
-                            try:
-                                price_element = driver.find_element(By.XPATH, "//span[@class='pret']")
-                                bani_element = price_element.find_element(By.XPATH, ".//span[@class='bani']")
-                                price = f"{price_element.text.replace(bani_element.text, '')}.{bani_element.text}"
-                                book_details['price'] = price
-                                print(f"Found price: {price}")
-                            except Exception as e:
-                                print("Could not find price")
-                            
-                            # Extract categories (up to 4)
-                            try:
-                                category_links = driver.find_elements(
-                                    By.XPATH, "//div[@class='linkuriCategorii']/a"
-                                )
-                                for i, link in enumerate(category_links[:4], 1):
-                                    book_details[f'category_{i}'] = link.text.strip()
-                                categories = [book_details[f'category_{i}'] for i in range(1, 5) 
-                                           if book_details[f'category_{i}'] != "N/A"]
-                                print(f"Found categories: {', '.join(categories)}")
-                            except Exception as e:
-                                print("Could not find categories")
-                            
-                            # Extract additional attributes
-                            attributes = {
-                                'language': "//div[@class='productAttr'][contains(., 'Limba:')]//div",
-                                'publish_date': "//div[@class='productAttr'][contains(., 'Data publicarii:')]//div",
-                                'publisher': "//div[@class='productAttr'][contains(., 'Editura:')]//div",
-                                'pages': "//div[@class='productAttr'][contains(., 'Nr. pagini:')]//div",
-                                'translator': "//div[@class='productAttr'][contains(., 'Traducatori:')]//div",
-                                'edition': "//div[@class='productAttr'][contains(., 'Tip coperta:')]//div"
-                            }
-                            
-                            for attr_key, xpath in attributes.items():
-                                try:
-                                    attr_element = driver.find_element(By.XPATH, xpath)
-                                    value = attr_element.text.strip()
-                                    book_details[attr_key] = value
-                                    print(f"Found {attr_key}: {value}")
-                                except Exception as e:
-                                    print(f"Could not find {attr_key}")
-                            
-                            # Save to CSV
-                            print("\nSaving to CSV...")
-                            writer.writerow(book_details)
-                            save_progress(i + 1)
-                            books_processed += 1  # Increment counter after successful processing
-                            
-                        except Exception as e:
-                            print("Error processing book")
-                            log_error(f"{csv_title} - {csv_author}")
-                            save_progress(i + 1)
-                            print("Going to main page")
-                            driver.get("https://carturesti.ro/")
-                            continue
-                        
-                        time.sleep(1)
-                        
-                    except ValueError as e:
-                        print(f"Error parsing CSV row: {row}")
-                        log_error(f"CSV parsing error - {','.join(row)}")
-                        save_progress(i + 1)
-                        continue
-                    
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        log.warning("interrupted by user")
         
     except Exception as e:
-        error_msg = str(e).split('\n')[0]
-        print(f"An error occurred: {error_msg}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(i + 1, total_runtime)
+        log.error("run stopped", error=first_line(e))
         
     finally:
+        # Unfinished titles go back to pending for the next run
+        queue.release_leases(start_line, end_line)
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}", browser_restarts=driver.restarts)
+        flush_logs()
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
@@ -1,15 +1,34 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 import time
 import json
 import os
+import sys
 import csv
 from datetime import timedelta
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from browser_factory import create_driver, page_bytes, format_bytes
+from consent import open_store
+from adaptive_wait import AdaptiveWait, value_is
+from store_config import STORE_URLS
+from rate_limiter import RateLimiter, host_of
+from extractors import parse_carturesti_book_page
+from work_queue import WorkQueue
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from retry import TRANSIENT, NOT_FOUND, PARSE_ERROR, NotFound, classify, first_line, no_results
+
+QUEUE_NAME = 'carturesti_errors'
+# carturesti_scrape_details.py's queue; the books it gave up on are this script's input
+DETAILS_QUEUE = 'carturesti_details'
+HOST = host_of(STORE_URLS['carturesti'])
+
+log = get_logger(QUEUE_NAME)
+
 def load_progress():
     if os.path.exists('Scrape/Carturesti/error_progress.json'):
         with open('Scrape/Carturesti/error_progress.json', 'r') as f:
@@ -19,13 +38,21 @@ def load_progress():
             return data
     return {'last_processed_line': 0, 'total_runtime': 0}
 
-def save_progress(line_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['last_processed_line'] = line_number
-    if runtime is not None:
-        progress_data['total_runtime'] = runtime
-    with open('Scrape/Carturesti/error_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+def open_queue():
+    """The failed books of the details queue, each at its position there.
+
+    Books that failed since the last run are added every time, so this
+    replaces reading error_titles.txt (the runtime of error_progress.json
+    is carried over on the first run).
+    """
+    details = WorkQueue(DETAILS_QUEUE)
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        queue.seed([], 0, load_progress()['total_runtime'])
+    for row in details.failed_items():
+        queue.add(row['position'], row['key'], json.loads(row['payload']))
+    details.close()
+    return queue
 
 def format_runtime(seconds):
     return str(timedelta(seconds=int(seconds)))
@@ -38,210 +65,133 @@ def clean_search_query(text):
     return text.replace('%', '')
 
 def scrape_error_books():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    start_line = progress['last_processed_line']
-    previous_runtime = progress['total_runtime']
-    
+    driver = create_driver(profile='carturesti_errors')
+    waiter = AdaptiveWait(driver, 'carturesti')
+    limiter = RateLimiter()
+    queue = open_queue()
+    details_queue = WorkQueue(DETAILS_QUEUE)
+    # Books a crashed run left leased
+    queue.release_leases()
+    previous_runtime = queue.runtime()
+    metrics = ScraperMetrics(QUEUE_NAME)
+    metrics_port = serve_metrics()
+    metrics.set_remaining(queue.remaining())
+
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
-    
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), books_left=queue.remaining(),
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+
     try:
-        print("Opening Carturesti.ro...")
-        driver.get("https://carturesti.ro/")
-        
-        # Handle cookie popup
-        try:
-            print("Handling cookie popup...")
-            cookie_button = WebDriverWait(driver, 20).until(
-                EC.element_to_be_clickable((By.CLASS_NAME, "cc-deny"))
-            )
-            cookie_button.click()
-            time.sleep(1)
-        except Exception as e:
-            print(f"Cookie popup handling failed: {str(e)}")
+        log.info("opening Carturesti.ro")
+        # Saved consent first; the popups are only handled when there is none
+        open_store(driver, 'carturesti', limiter=limiter)
 
         with open('Data/Carturesti/book_details.csv', 'a', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['title', 'author', 'score', 'reviews', 'price', 'category_1', 
                          'category_2', 'category_3', 'category_4', 'language', 'publish_date', 
                          'publisher', 'pages', 'translator', 'edition']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
-            
-            # Read error titles
-            with open('Data/Carturesti/error_titles.txt', 'r', encoding='utf-8') as f:
-                error_titles = f.readlines()[start_line:]
-                
-                for i, line in enumerate(error_titles, start=start_line):
-                    try:
-                        # Parse title and author
-                        title_author = line.strip().split(' - ')
-                        if len(title_author) != 2:
-                            print(f"Invalid format in line: {line}")
-                            log_waste(line.strip())
-                            continue
-                            
-                        csv_title, csv_author = title_author
-                        # Search only by title
-                        search_query = clean_search_query(csv_title)
-                        
-                        print(f"\n{'='*50}")
-                        print(f"Processing book {i+1}:")
-                        print(f"Title: {csv_title}")
-                        print(f"Author: {csv_author}")
-                        print(f"{'='*50}")
-                        
-                        # Rest of the scraping logic remains similar but with better error handling
+
+            for item in queue.items():
+                i = item['position']
+                # The book list row; rows the details scraper could not read are waste
+                row = item['payload']
+                if len(row) != 3:
+                    log.warning("unreadable CSV row", position=i+1, row=row)
+                    queue.fail(i, "Invalid format", retry=False, kind=PARSE_ERROR)
+                    log_waste(item['key'])
+                    continue
+
+                csv_title, _, csv_author = row
+                # Search only by title
+                search_query = clean_search_query(csv_title)
+                title_start = time.time()
+                log.debug("processing book", position=i+1, title=csv_title, author=csv_author)
+
+                try:
+                    with metrics.phase('search'):
+                        search_box = WebDriverWait(driver, 6).until(
+                            EC.presence_of_element_located((By.XPATH, "//input[@id='search-input']"))
+                        )
+                        search_box.clear()
+                        waiter.until('search box cleared', 1, value_is(search_box, ""), network_idle=False)
+                        search_box.send_keys(search_query)
+                        waiter.until('query typed', 0.5, value_is(search_box, search_query), network_idle=False)
+                        limiter.wait(HOST)
+                        search_box.send_keys(Keys.RETURN)
+
+                        # Wait for and click first result
                         try:
-                            search_box = WebDriverWait(driver, 6).until(
-                                EC.presence_of_element_located((By.XPATH, "//input[@id='search-input']"))
+                            first_result = WebDriverWait(driver, 6).until(
+                                EC.element_to_be_clickable((
+                                    By.XPATH, 
+                                    "//a[@class='clean-a select-item-event' and contains(@data-ng-click, 'onProductClick')]"
+                                ))
                             )
-                            search_box.clear()
-                            time.sleep(1)
-                            search_box.send_keys(search_query)
-                            time.sleep(0.5)
-                            search_box.send_keys(Keys.RETURN)
-                            
-                            # Initialize book details
-                            book_details = {field: "N/A" for field in fieldnames}
-                            
-                            # Wait for and click first result
-                            try:
-                                print("Looking for first result...")
-                                first_result = WebDriverWait(driver, 6).until(
-                                    EC.element_to_be_clickable((
-                                        By.XPATH, 
-                                        "//a[@class='clean-a select-item-event' and contains(@data-ng-click, 'onProductClick')]"
-                                    ))
-                                )
-                                print("Found result, clicking...")
-                                first_result.click()
-                                time.sleep(1)
-                            except Exception as e:
-                                print(f"Could not find or click search result: {str(e)}")
-                                log_waste(f"{csv_title} - {csv_author}")
-                                save_progress(i + 1)
-                                # driver.get("https://carturesti.ro/")
-                                continue
-                            
-                            # Extract title
-                            try:
-                                title_element = driver.find_element(By.XPATH, "//h1[@class='titluProdus']")
-                                book_details['title'] = title_element.text.strip()
-                                print(f"Found title: {book_details['title']}")
-                            except Exception as e:
-                                print(f"Could not find title: {str(e)}")
-                            
-                            # Extract author
-                            try:
-                                author_element = driver.find_element(By.XPATH, "//a[contains(@href, '/autor/')]")
-                                book_details['author'] = author_element.text.strip()
-                                print(f"Found author: {book_details['author']}")
-                            except Exception as e:
-                                print(f"Could not find author: {str(e)}")
-                            
-                            # Extract score and reviews
-                            try:
-                                score_element = driver.find_element(
-                                    By.XPATH, "//span[@data-ng-bind='h.numberFormat(agregateRating,1)']"
-                                )
-                                reviews_element = driver.find_element(
-                                    By.XPATH, "//span[@data-ng-bind='votes']"
-                                )
-                                book_details['score'] = score_element.text.strip()
-                                book_details['reviews'] = reviews_element.text.strip()
-                                print(f"Found rating: {book_details['score']}, reviews: {book_details['reviews']}")
-                            except Exception as e:
-                                print(f"Could not find rating/reviews: {str(e)}")
-                            
-                            # Extract price
-                            try:
-                                price_element = driver.find_element(By.XPATH, "//span[@class='pret']")
-                                bani_element = price_element.find_element(By.XPATH, ".//span[@class='bani']")
-                                price = f"{price_element.text.replace(bani_element.text, '')}.{bani_element.text}"
-                                book_details['price'] = price
-                                print(f"Found price: {price}")
-                            except Exception as e:
-                                print(f"Could not find price: {str(e)}")
-                            
-                            # Extract categories (up to 4)
-                            try:
-                                category_links = driver.find_elements(
-                                    By.XPATH, "//div[@class='linkuriCategorii']/a"
-                                )
-                                for idx, link in enumerate(category_links[:4], 1):
-                                    book_details[f'category_{idx}'] = link.text.strip()
-                                categories = [book_details[f'category_{idx}'] for idx in range(1, 5) 
-                                           if book_details[f'category_{idx}'] != "N/A"]
-                                print(f"Found categories: {', '.join(categories)}")
-                            except Exception as e:
-                                print(f"Could not find categories: {str(e)}")
-                            
-                            # Extract additional attributes
-                            attributes = {
-                                'language': "//div[@class='productAttr'][contains(., 'Limba:')]//div",
-                                'publish_date': "//div[@class='productAttr'][contains(., 'Data publicarii:')]//div",
-                                'publisher': "//div[@class='productAttr'][contains(., 'Editura:')]//div",
-                                'pages': "//div[@class='productAttr'][contains(., 'Nr. pagini:')]//div",
-                                'translator': "//div[@class='productAttr'][contains(., 'Traducatori:')]//div",
-                                'edition': "//div[@class='productAttr'][contains(., 'Tip coperta:')]//div"
-                            }
-                            
-                            for attr_key, xpath in attributes.items():
-                                try:
-                                    attr_element = driver.find_element(By.XPATH, xpath)
-                                    value = attr_element.text.strip()
-                                    book_details[attr_key] = value
-                                    print(f"Found {attr_key}: {value}")
-                                except Exception as e:
-                                    print(f"Could not find {attr_key}: {str(e)}")
-                            
-                            # Verify we found at least title and author before saving
-                            if book_details['title'] != "N/A" and book_details['author'] != "N/A":
-                                print("\nSaving to CSV...")
-                                writer.writerow(book_details)
-                                save_progress(i + 1)
-                            else:
-                                print("\nInsufficient data found, logging to waste...")
-                                log_waste(f"{csv_title} - {csv_author}")
-                                save_progress(i + 1)
-                            
-                        except Exception as e:
-                            print(f"Error during scraping process: {str(e)}")
-                            log_waste(f"{csv_title} - {csv_author}")
-                            save_progress(i + 1)
-                            driver.get("https://carturesti.ro/")
-                            continue
-                        
-                    except Exception as e:
-                        print(f"Error processing line {i+1}: {str(e)}")
-                        log_waste(line.strip())
-                        save_progress(i + 1)
-                        continue
-                    
+                        except TimeoutException as e:
+                            raise no_results(driver, e)
+                    with metrics.phase('navigate'):
+                        limiter.wait(HOST)
+                        first_result.click()
+                        waiter.until('product page', 1)
+
+                    # Every field from one copy of the page source
+                    book_details = {field: "N/A" for field in fieldnames}
+                    with metrics.phase('extract'):
+                        book_details.update(parse_carturesti_book_page(driver.page_source))
+
+                    # Verify we found at least title and author before saving
+                    if book_details['title'] == "N/A" or book_details['author'] == "N/A":
+                        raise NotFound("No title or author on the result page")
+
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    (log.info if kind == NOT_FOUND else log.warning)(
+                        "book failed", position=i+1, title=csv_title, author=csv_author, kind=kind,
+                        error=first_line(e))
+                    # Transient failures come back later; the rest go to waste.txt once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining())
+                    if kind != TRANSIENT:
+                        log_waste(f"{csv_title} - {csv_author}")
+                    limiter.wait(HOST)
+                    driver.get(STORE_URLS['carturesti'] + "/")
+                    continue
+
+                log.debug("book details", **{key: value for key, value in book_details.items() if value != "N/A"})
+                with metrics.phase('write'):
+                    writer.writerow(book_details)
+                    csvfile.flush()
+                    queue.complete(i)
+                    # Found after all: the details queue no longer lists it as failed
+                    details_queue.complete(i)
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining())
+                log.info("book done", position=i+1, title=csv_title, seconds=f"{time.time() - title_start:.1f}",
+                         transferred=format_bytes(page_bytes(driver)))
+
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
-        
+        log.warning("interrupted by user")
+
     except Exception as e:
-        print(f"An unexpected error occurred: {str(e)}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(i + 1, total_runtime)
-        
+        log.error("run stopped", error=first_line(e))
+
     finally:
+        # Unfinished books go back to pending for the next run
+        queue.release_leases()
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 books_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        details_queue.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
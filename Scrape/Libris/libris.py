@@ -1,48 +1,96 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
-import time
+import argparse
 import json
 import os
+import csv
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_urls import LIBRIS_URLS_FILE, LIBRIS_URL_FIELDNAMES, product_id
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from listing_index import UNCHANGED_PAGES, ListingIndex, count_lines, queue_new_titles
+from browser_factory import create_driver, page_bytes, format_bytes
+from consent import restore_consent, save_consent
+from page_scripts import libris_listing_items
+from adaptive_wait import AdaptiveWait
+from store_config import STORE_URLS, LIBRIS_LISTING_PATH
+from rate_limiter import RateLimiter, host_of
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from retry import classify, first_line
+
+FIRST_YEAR = 2002
+LAST_YEAR = 2025
+HOST = host_of(STORE_URLS['libris'])
+
+log = get_logger('libris_listing')
 
 def load_progress():
     if os.path.exists('Scrape\Libris\scraping_progress.json'):
         with open('Scrape\Libris\scraping_progress.json', 'r') as f:
             return json.load(f)
-    return {'year': 2002, 'page': 1}
+    return {'year': FIRST_YEAR, 'page': 1}
 
-def save_progress(year, page):
-    with open('Scrape\Libris\scraping_progress.json', 'w') as f:
-        json.dump({'year': year, 'page': page}, f)
+def open_queue():
+    """One work item per year; its payload holds the next page to scrape.
 
-def scrape_libris():
-    # Load previous progress
-    progress = load_progress()
-    current_year = progress['year']
-    current_page = progress['page']
-    
-    # Set up Edge options
-    edge_options = Options()
-    # edge_options.add_argument("--headless")
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
+    Seeded on the first run, from scraping_progress.json if it exists.
+    """
+    queue = WorkQueue('libris_listing')
+    if not queue.is_seeded():
+        progress = load_progress()
+        queue.seed(((year, str(year), {'page': progress['page'] if year == progress['year'] else 1})
+                    for year in range(FIRST_YEAR, LAST_YEAR + 1)), progress['year'])
+    return queue
+
+def open_index():
+    """Listing fingerprints, with libris_titles.txt as the known titles on the first run."""
+    index = ListingIndex('libris')
+    if not index.has_titles() and os.path.exists('Data\Libris\libris_titles.txt'):
+        with open('Data\Libris\libris_titles.txt', 'r', encoding='utf-8') as f:
+            index.add_titles(line.strip().split(',', 2)[-1] for line in f)
+    return index
+
+def scrape_libris(incremental=False):
+    queue = open_queue()
+    archive = HtmlArchive()
+    index = open_index()
+    if incremental:
+        # Walk every year again from page 1; unchanged years stop after a few pages
+        queue.reset({'page': 1})
+    # Years a crashed run left leased
+    queue.release_leases()
     
-    driver = webdriver.Edge(options=edge_options)
-    first_load = True  # Flag for first page load
+    driver = create_driver(profile='libris_listing')
+    waiter = AdaptiveWait(driver, 'libris')
+    limiter = RateLimiter()
+    # Popups are only handled when no consent was saved by an earlier run
+    first_load = not restore_consent(driver, 'libris')
+    # A listing page counts as one title; years have no known page count, so no ETA
+    metrics = ScraperMetrics('libris_listing')
+    metrics_port = serve_metrics()
+    log.info("starting", incremental=incremental, pending_years=queue.remaining(),
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
     
     try:
-        while current_year <= 2025:
+        for item in queue.items():
+            current_year = item['position']
+            current_page = item['payload']['page']
             # Calculate filter value (decreases by 1 for each year)
             filter_base = 820 - (current_year - 2002)
             filter_value = f"000{filter_base}{current_year}"
+            unchanged_pages = 0
             
             while True:  # Page loop
                 # Construct URL with year filter and page number
-                url = f"https://www.libris.ro/carti?ft&fsv_77563={filter_value}&iv.pg={current_page}&isf=1"
-                driver.get(url)
-                print(f"\nScraping year {current_year}, page {current_page}")
+                url = STORE_URLS['libris'] + LIBRIS_LISTING_PATH.format(filter_value=filter_value, page=current_page)
+                with metrics.phase('navigate'):
+                    limiter.wait(HOST)
+                    driver.get(url)
+                log.debug("scraping page", year=current_year, page=current_page)
                 
                 # Handle popups only on first page load
                 if first_load:
@@ -60,78 +108,141 @@ def scrape_libris():
                         )
                         if newsletter_close.is_displayed():
                             newsletter_close.click()
-                            time.sleep(5)  # Wait for page to load after closing popups
+                            waiter.until('popups closed', 5)  # Wait for page to load after closing popups
                     except:
-                        print("No popups found or already handled")
+                        log.debug("no popups found or already handled")
                     
+                    save_consent(driver, 'libris')
                     first_load = False  # Reset flag after handling popups
                 
                 # Check for "no products found" message
                 try:
                     no_products = driver.find_element(By.XPATH, "//div[contains(text(), 'Nu am gasit produse care sa corespunda filtrelor alese')]")
                     if no_products:
-                        print(f"No more products for year {current_year}")
-                        current_year += 1
-                        current_page = 1
-                        save_progress(current_year, current_page)
+                        log.info("year done", year=current_year, pages=current_page - 1)
+                        queue.complete(current_year)
                         break
                 except:
                     pass  # Continue if message not found
                 
                 # Wait for the products list
                 try:
-                    wait = WebDriverWait(driver, 10)
-                    products_list = wait.until(
-                        EC.presence_of_element_located((By.CLASS_NAME, "categ-prod-list"))
-                    )
-                    
-                    # Find all product items
-                    product_items = products_list.find_elements(By.CLASS_NAME, "categ-prod-item")
+                    with metrics.phase('extract'):
+                        wait = WebDriverWait(driver, 10)
+                        products_list = wait.until(
+                            EC.presence_of_element_located((By.CLASS_NAME, "categ-prod-list"))
+                        )
+                        
+                        archive.put('libris_listing', url, driver.page_source,
+                                    {'year': current_year, 'page': current_page})
+
+                        # Title, link and price of every product item in one script call
+                        product_items = libris_listing_items(driver, products_list)
                     
-                    # Extract titles
+                    # Extract titles and product links
                     page_titles = []
+                    page_links = []
                     for item in product_items:
-                        try:
-                            title_element = item.find_element(By.CLASS_NAME, "pr-title-categ-pg")
-                            page_titles.append(title_element.text)
-                        except Exception as e:
-                            print(f"Error extracting title: {e}")
+                        if not item['title']:
+                            log.warning("no title in item", year=current_year, page=current_page, item=item['position'])
+                            continue
+                        page_titles.append(item['title'])
+                        
+                        if item['url'] is None:
+                            log.warning("no link in item", year=current_year, page=current_page, item=item['position'])
                             continue
+                        page_links.append({
+                            'year': current_year,
+                            'page': current_page,
+                            'title': item['title'],
+                            'url': item['url'],
+                            'product_id': product_id(item['url'], item['attributes']),
+                            'price': item['price']
+                        })
                     
-                    # Save titles to file
-                    with open('Data\Libris\libris_titles.txt', 'a', encoding='utf-8') as f:
-                        for title in page_titles:
-                            f.write(f"{current_year},{current_page},{title}\n")
+                    _, new_titles = index.check(f"{current_year}/{current_page}", page_titles)
+                    if incremental:
+                        # Only titles no earlier crawl has seen are saved and queued. A new title
+                        # shifts every later page, so a page without new ones counts as unchanged
+                        unchanged_pages = 0 if new_titles else unchanged_pages + 1
+                        page_titles = new_titles
+                        page_links = [link for link in page_links if link['title'] in new_titles]
                     
-                    print(f"Found {len(page_titles)} titles on page {current_page}")
+                    with metrics.phase('write'):
+                        # Save titles to file
+                        with open('Data\Libris\libris_titles.txt', 'a', encoding='utf-8') as f:
+                            for title in page_titles:
+                                f.write(f"{current_year},{current_page},{title}\n")
+                        
+                        # Save product links next to the titles
+                        with open(LIBRIS_URLS_FILE, 'a', newline='', encoding='utf-8') as f:
+                            writer = csv.DictWriter(f, fieldnames=LIBRIS_URL_FIELDNAMES, delimiter=';')
+                            if f.tell() == 0:
+                                writer.writeheader()
+                            writer.writerows(page_links)
+                        
+                        # New titles go straight to the details queue
+                        if incremental and new_titles:
+                            first_position = count_lines('Data\Libris\libris_titles_unique.txt')
+                            lines = [f"{current_year},{current_page},{title}\n" for title in new_titles]
+                            with open('Data\Libris\libris_titles_unique.txt', 'a', encoding='utf-8') as f:
+                                f.writelines(lines)
+                            queue_new_titles('libris_details', first_position, lines,
+                                             lambda line: line.strip().split(',', 2)[-1])
+                        
+                        # Save current progress before moving to next page
+                        queue.checkpoint(current_year, {'page': current_page + 1})
                     
-                    # Save current progress before moving to next page
-                    save_progress(current_year, current_page-1)
+                    log.info("page done", year=current_year, page=current_page, titles=len(page_titles),
+                             new_titles=len(new_titles), transferred=format_bytes(page_bytes(driver)))
+                    limiter.record_page(HOST, driver)
+                    metrics.title_done()
                     
                     # Check if we've reached the end of this year's products
                     if len(product_items) < 40:
-                        print(f"Found {len(product_items)} items (less than 40) - last page for year {current_year}")
-                        current_year += 1
-                        current_page = 1
-                        save_progress(current_year, current_page)
+                        log.info("year done", year=current_year, pages=current_page, last_page_items=len(product_items))
+                        queue.complete(current_year)
+                        break
+                    
+                    if incremental and unchanged_pages >= UNCHANGED_PAGES:
+                        log.info("year unchanged, skipping the rest", year=current_year, unchanged_pages=unchanged_pages)
+                        queue.complete(current_year)
                         break
                     
                     # Move to next page
                     current_page += 1
                     
                 except Exception as e:
-                    print(f"Error processing page: {e}")
-                    # Don't update progress here - keep the last successful values
+                    limiter.record_page(HOST, driver, e)
+                    log.warning("page failed", year=current_year, page=current_page, error=first_line(e))
+                    metrics.title_failed(classify(e))
+                    # The year goes back to the queue at its last saved page
+                    queue.fail(current_year, e)
                     raise  # Re-raise the exception to trigger the finally block
                 
-                time.sleep(1)  # Small delay between pages
+                waiter.until('between pages', 1)  # Small delay between pages
                 
     except Exception as e:
-        print(f"An error occurred: {e}")
+        log.error("run stopped", error=first_line(e))
         
     finally:
+        queue.release_leases()
+        log.info("finished", pending_years=queue.remaining(), pages_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        archive.close()
+        index.close()
+        metrics.close()
         # Close the browser
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
-    scrape_libris()
+    parser = argparse.ArgumentParser(description="Scrape the Libris title listing, year by year.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Refresh run: save only new titles, queue them for details and stop a year "
+                             f"after {UNCHANGED_PAGES} unchanged pages")
+    args = parser.parse_args()
+
+    scrape_libris(args.incremental)
@@ -1,315 +1,297 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.keys import Keys
+from selenium.common.exceptions import TimeoutException
 import time
 import json
 import os
 import csv
-import signal
-from datetime import datetime, timedelta
+import sys
+from datetime import timedelta
 
-def load_progress():
-    if os.path.exists('Scrape\Libris\details_progress.json'):
-        with open('Scrape\Libris\details_progress.json', 'r') as f:
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from product_urls import LIBRIS_URLS_FILE, load_url_index, rebase_url
+from extractors import parse_libris_book_page
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from browser_factory import page_bytes, format_bytes
+from driver_watchdog import WatchedDriver
+from consent import open_store
+from page_scripts import libris_search_results
+from title_matching import best_match
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from adaptive_wait import AdaptiveWait, value_is
+from store_config import STORE_URLS, PREFETCH_TABS, PREFETCH_TIMEOUT
+from tab_prefetch import TabPrefetcher, with_lookahead
+from rate_limiter import RateLimiter, host_of
+from retry import TRANSIENT, NOT_FOUND, NotFound, classify, first_line, no_results, retry_call
+from driver_pool import SHARD_POSITION
+
+PROGRESS_FILE = 'Scrape\Libris\details_progress.json'
+DETAILS_FILE = 'Data\Libris\\book_details.csv'
+QUEUE_NAME = 'libris_details'
+HOST = host_of(STORE_URLS['libris'])
+
+log = get_logger(QUEUE_NAME)
+
+def load_progress(progress_file=PROGRESS_FILE, start_line=0):
+    if os.path.exists(progress_file):
+        with open(progress_file, 'r') as f:
             data = json.load(f)
             # Add default runtime if not present
             if 'total_runtime' not in data:
                 data['total_runtime'] = 0
             return data
-    return {'last_processed_line': 0, 'total_runtime': 0}
-
-def save_progress(line_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['last_processed_line'] = line_number
-    if runtime is not None:  # Only update runtime when explicitly provided
-        progress_data['total_runtime'] = runtime
-    with open('Scrape\Libris\details_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+    return {'last_processed_line': start_line, 'total_runtime': 0}
 
 def format_runtime(seconds):
     return str(timedelta(seconds=int(seconds)))
 
-def log_error(title, error):
-    # Strip error message at first tab space
-    error = str(error).split('\t')[0]
-    with open('Data\Libris\error_titles.txt', 'a', encoding='utf-8') as f:
-        f.write(f"{title}\n")
+def open_queue():
+    """Work queue of the title file, seeded on the first run (from details_progress.json if it exists)."""
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        progress = load_progress()
+        with open('Data\Libris\libris_titles_unique.txt', 'r', encoding='utf-8') as f:
+            queue.seed(((i, line.strip().split(',', 2)[-1], line) for i, line in enumerate(f)),
+                       progress['last_processed_line'], progress['total_runtime'])
+    return queue
 
-def scrape_book_details():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    start_line = progress['last_processed_line']
-    previous_runtime = progress['total_runtime']
+def search_book(driver, title, waiter, limiter):
+    """Search the title on Libris and return (matching result element, price).
+
+    The element is None when no result matches the title closely enough.
+    """
+    price = "null"
+    log.debug("searching", title=title)
+    # Search for the book from current page
+    search_box = WebDriverWait(driver, 15).until(
+        EC.presence_of_element_located((By.ID, "autoComplete"))
+    )
+    search_box.clear()
+    waiter.until('search box cleared', 1, value_is(search_box, ""), network_idle=False)
+    search_box.send_keys(title)
+    waiter.until('query typed', 0.5, value_is(search_box, title), network_idle=False)
+    limiter.wait(HOST)
+    search_box.send_keys(Keys.RETURN)
+
+    # Wait for search results with longer timeout
+    try:
+        WebDriverWait(driver, 15).until(
+            EC.presence_of_element_located((By.CLASS_NAME, "pr-title-categ-pg"))
+        )
+    except TimeoutException as e:
+        raise no_results(driver, e)
+
+    waiter.until('search results', 1)  # Wait for results to stabilize
+
+    # Titles, links and prices of every result in one round-trip; scored here
+    results = libris_search_results(driver)
+
+    # Best-scoring result by normalized title, if it is close enough
+    matching_result = None
+    match, match_score = best_match(results, title)
+    if match:
+        if match_score < 1:
+            log.info("closest match", score=f"{match_score:.2f}", result=match['title'])
+        matching_result = match['element']
+        price = match['price']
+        log.debug("price from search results", price=price)
+
+    return matching_result, price
+
+def scrape_title(driver, waiter, limiter, archive, metrics, year, page, title, listed=None, tabs=None):
+    """Open the title's product page and return its book_details row.
+
+    listed is the title's row from the listing URL file; when given the
+    product page is opened directly, from its prefetched tab if tabs has one.
+    Raises NotFound when no search result matches the title.
+    """
+    if listed:
+        # The listing scraper saved the product link, no search needed
+        log.debug("opening saved product link", url=listed['url'])
+        price = listed['price'] or "null"
+        # Saved links point at the store the listing ran against
+        product_url = rebase_url(STORE_URLS['libris'], listed['url'])
+        with metrics.phase('navigate'):
+            if not (tabs and tabs.take(product_url)):
+                limiter.wait(HOST)
+                driver.get(product_url)
+    else:
+        with metrics.phase('search'):
+            matching_result, price = search_book(driver, title, waiter, limiter)
+        if not matching_result:
+            raise NotFound("No matching search result")
+
+        with metrics.phase('navigate'):
+            # Wait for element to be clickable
+            WebDriverWait(driver, 15).until(
+                EC.element_to_be_clickable((By.CLASS_NAME, "pr-title-categ-pg"))
+            )
+            waiter.until('before click', 1)  # Additional wait before clicking
+            limiter.wait(HOST)
+            matching_result.click()
+
+    with metrics.phase('navigate'):
+        # Wait for the details list to be visible
+        WebDriverWait(driver, 15).until(EC.visibility_of_element_located((By.CLASS_NAME, "pr-lista-detalii")))
+        waiter.until('product page', 1)  # Wait for all elements to stabilize
+
+    # Initialize book_details dictionary
+    book_details = {
+        'year': year,
+        'page': page,
+        'title': title,
+        'average_score': "null",
+        'votes': "null",
+        'price': price,
+        'categories': "null",
+        'author': "null",
+        'publisher': "null",
+        'cover_type': "null",
+        'publication_year': "null",
+        'num_pages': "null",
+        'format': "null",
+        'code': "null"
+    }
+
+    # Review data and every pr-lista-item from one copy of the
+    # page source (the "show more" button only toggles visibility)
+    with metrics.phase('extract'):
+        page_source = driver.page_source
+        archive.put('libris_details', driver.current_url, page_source,
+                    {'year': year, 'page': page, 'title': title, 'price': price})
+        book_details.update(parse_libris_book_page(page_source))
+    return book_details
+
+def reload_home(driver, limiter, error=None):
+    # Back to a known state before the next attempt or title
+    if error is not None:
+        limiter.record_page(HOST, driver, error)
+    if driver.ensure_healthy():
+        return  # A new browser, already on the home page
+    log.debug("opening Libris.ro")
+    limiter.wait(HOST)
+    driver.get(STORE_URLS['libris'] + "/")
+
+def scrape_book_details(details_file=DETAILS_FILE, start_line=None, end_line=None, headless=True, prefetch=PREFETCH_TABS):
+    # The defaults scrape the whole title file; driver_pool.py passes a line
+    # range and a per-shard details file to run several browsers side by side
+    # One browser profile per line range, so driver_pool shards never share one
+    run_name = f"{QUEUE_NAME}_{start_line}" if start_line is not None else QUEUE_NAME
+    # Restarted between titles when it gets slow or big, and when a title hangs
+    limiter = RateLimiter()
+    driver = WatchedDriver('libris', profile=run_name, headless=headless, limiter=limiter)
+    waiter = AdaptiveWait(driver, 'libris')
+    metrics = ScraperMetrics(run_name)
+    metrics_port = serve_metrics()
+    queue = open_queue()
+    archive = HtmlArchive()
+    # Titles a crashed run of this range left leased
+    queue.release_leases(start_line, end_line)
+    previous_runtime = queue.runtime()
+    metrics.set_remaining(queue.remaining(start_line, end_line))
     
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
+    url_index = load_url_index(LIBRIS_URLS_FILE)
+    # The next prefetch titles' product pages load in background tabs
+    tabs = TabPrefetcher(driver, prefetch, PREFETCH_TIMEOUT, lambda: limiter.wait(HOST)) if prefetch else None
+    if tabs:
+        driver.on_restart.append(tabs.reset)
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), known_product_links=len(url_index),
+             prefetch_tabs=prefetch, metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
     
     try:
         # Open the main URL only once at the start
-        print("Opening Libris.ro...")
-        driver.get("https://www.libris.ro/")
-        
-        # Handle cookie popup
-        try:
-            print("Handling cookie popup...")
-            refuse_button = WebDriverWait(driver, 15).until(
-                EC.presence_of_element_located((By.XPATH, "//a[text()='Refuz toate']"))
-            )
-            if refuse_button.is_displayed():
-                refuse_button.click()
-                time.sleep(10)  # Wait for newsletter popup
-        except:
-            print("No cookie popup found or already handled")
-        
-        # Handle newsletter popup
-        try:
-            print("Handling newsletter popup...")
-            close_newsletter = WebDriverWait(driver, 15).until(
-                EC.element_to_be_clickable((By.CLASS_NAME, "modal-close-x-c-newsletter"))
-            )
-            if close_newsletter.is_displayed():
-                close_newsletter.click()
-                time.sleep(1)  # Wait for popup to close
-        except:
-            print("No newsletter popup found or already handled")
+        log.info("opening Libris.ro")
+        # Saved consent first; the popups are only handled when there is none
+        open_store(driver, 'libris', limiter=limiter)
 
-        with open('Data\Libris\\book_details.csv', 'a', newline='', encoding='utf-8') as csvfile:
+        with open(details_file, 'a', newline='', encoding='utf-8') as csvfile:
             fieldnames = ['year', 'page', 'title', 'average_score', 'votes', 'price', 
                          'categories', 'author', 'publisher', 'cover_type',
                          'publication_year', 'num_pages', 'format', 'code']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
+            if details_file != DETAILS_FILE:
+                # A driver_pool.py shard: the queue position lets the merge restore input order
+                fieldnames = fieldnames + [SHARD_POSITION]
+            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
             
-            if os.path.getsize('Data\Libris\\book_details.csv') == 0:
+            if os.path.getsize(details_file) == 0:
                 writer.writeheader()
             
-            with open('Data\Libris\libris_titles_unique.txt', 'r', encoding='utf-8') as f:
-                lines = f.readlines()[start_line:]
+            for item, upcoming in with_lookahead(queue.items(start_line, end_line), prefetch):
+                i, line = item['position'], item['payload']
+                year, page, title = line.strip().split(',', 2)
+                title_start = time.time()
+                driver.check_health()
+                if tabs:
+                    # The next titles' product pages load while this one is parsed and written
+                    next_urls = [rebase_url(STORE_URLS['libris'], url_index[next_item['key']]['url'])
+                                 for next_item in upcoming if next_item['key'] in url_index]
+                    # Tabs of titles already passed would hold their place forever
+                    tabs.keep(next_urls + ([rebase_url(STORE_URLS['libris'], url_index[title]['url'])]
+                                           if title in url_index else []))
+                    for next_url in next_urls:
+                        tabs.prefetch(next_url)
                 
-                for i, line in enumerate(lines, start=start_line):
-                    year, page, title = line.strip().split(',', 2)
-                    print(f"\n{'='*50}")
-                    print(f"Processing title {i+1}: {title}")
-                    print(f"{'='*50}")
-                    
-                    try:
-                        print("Searching for the book...")
-                        # Search for the book from current page
-                        search_box = WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.ID, "autoComplete"))
-                        )
-                        search_box.clear()
-                        time.sleep(1)  # Wait before typing
-                        search_box.send_keys(title)
-                        time.sleep(0.5)  # Wait before pressing Enter
-                        search_box.send_keys(Keys.RETURN)
-                        
-                        # Wait for search results with longer timeout
-                        WebDriverWait(driver, 15).until(
-                            EC.presence_of_element_located((By.CLASS_NAME, "pr-title-categ-pg"))
-                        )
-                        
-                        time.sleep(1)  # Wait for results to stabilize
-                        
-                        # Find all results
-                        results = driver.find_elements(By.CLASS_NAME, "pr-title-categ-pg")
-                        
-                        # Find first exact match and its price
-                        matching_result = None
-                        for result in results:
-                            if result.text.strip() == title.strip():
-                                matching_result = result
-                                try:
-                                    # Get the parent container and find the first anchor tag
-                                    parent_container = result.find_element(By.XPATH, "./ancestor::div[contains(@class, 'pr-history-item')]")
-                                    link = parent_container.find_element(By.TAG_NAME, "a")
-                                    html_content = link.get_attribute('outerHTML')
-                                    
-                                    # Extract price from data-price attribute
-                                    if 'data-price="' in html_content:
-                                        price = html_content.split('data-price="')[1].split('"')[0]
-                                        print(f"Found price from search results: {price}")
-                                    else:
-                                        price = "null"
-                                        print("Price attribute not found in HTML")
-                                        
-                                except Exception as e:
-                                    print(f"Could not find price in search results: {str(e)}")
-                                    price = "null"
-                                break
-                        
-                        if not matching_result:
-                            print(f"No exact matches found for: {title}")
-                            log_error(title, "No exact matches found")
-                            save_progress(i + 1)
-                            continue
-                        
-                        # Process the matching result
-                        try:
-                            # Wait for element to be clickable
-                            WebDriverWait(driver, 15).until(
-                                EC.element_to_be_clickable((By.CLASS_NAME, "pr-title-categ-pg"))
-                            )
-                            time.sleep(1)  # Additional wait before clicking
-                            matching_result.click()
-                            
-                            # Wait longer for page load
-                            wait = WebDriverWait(driver, 15)
-                            
-                            # Wait for the details list to be visible
-                            wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "pr-lista-detalii")))
-                            time.sleep(1)  # Wait for all elements to stabilize
+                try:
+                    book_details = retry_call(scrape_title, driver, waiter, limiter, archive, metrics,
+                                              year, page, title, url_index.get(title), tabs,
+                                              before_retry=lambda e: reload_home(driver, limiter, e))
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    if tabs:
+                        tabs.release()
+                    # Misses are expected; everything else is worth a look
+                    (log.info if kind == NOT_FOUND else log.warning)(
+                        "title failed", position=i+1, title=title, kind=kind, error=first_line(e))
+                    # Only transient failures come back; misses and parse errors are recorded once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining(start_line, end_line))
+                    if kind == TRANSIENT:
+                        reload_home(driver, limiter)
+                    continue
 
-                            # Initialize book_details dictionary
-                            book_details = {
-                                'year': year,
-                                'page': page,
-                                'title': title,
-                                'average_score': "null",
-                                'votes': "null",
-                                'price': price,
-                                'categories': "null",
-                                'author': "null",
-                                'publisher': "null",
-                                'cover_type': "null",
-                                'publication_year': "null",
-                                'num_pages': "null",
-                                'format': "null",
-                                'code': "null"
-                            }
-
-                            # Wait for page to load
-                            wait = WebDriverWait(driver, 10)
-                            
-
-                            # 2. Get review data
-                            try:
-                                print("Extracting review data...")
-                                try:
-                                    # Look for the feedback count element
-                                    feedback_element = wait.until(
-                                        EC.presence_of_element_located((By.CLASS_NAME, "pr-rg-feedback-count"))
-                                    )
-                                    feedback_text = feedback_element.text.strip()
-                                    
-                                    # Parse the text: "5 (1 review-uri)" -> score: "5", votes: "1"
-                                    score = feedback_text.split('(')[0].strip()
-                                    votes = feedback_text.split('(')[1].split('review')[0].strip()
-                                    
-                                    book_details['average_score'] = score or "null"
-                                    book_details['votes'] = votes or "null"
-                                    print(f"Found reviews - Score: {score}, Number of reviews: {votes}")
-                            
-                                except:
-                                    # If element not found, set default values
-                                    print("No reviews found for this book")
-                                    book_details['average_score'] = "0"
-                                    book_details['votes'] = "0"
-                                
-                            except Exception as e:
-                                print(f"Error processing review data: {str(e)}")
-                                book_details['average_score'] = "0"
-                                book_details['votes'] = "0"
-
-                            # 3. Click "show more" button
-                            try:
-                                print("Expanding details...")
-                                show_more = wait.until(
-                                    EC.element_to_be_clickable((By.CLASS_NAME, "afiseaza-mai-mult"))
-                                )
-                                show_more.click()
-                                time.sleep(1)  # Wait for animation
-                            except Exception as e:
-                                print(f"Could not expand details: {str(e)}")
-
-                            # 4. Extract all details from list items
-                            print("Extracting book details...")
-                            try:
-                                # Wait for list items to be visible
-                                items = wait.until(
-                                    EC.presence_of_all_elements_located((By.CLASS_NAME, "pr-lista-item"))
-                                )
-                                
-                                for item in items:
-                                    try:
-                                        text = item.text.strip()
-                                        
-                                        # Map the text to the corresponding field
-                                        if "Categoria:" in text:
-                                            book_details['categories'] = text.replace("Categoria:", "").strip()
-                                        elif "Autor:" in text:
-                                            book_details['author'] = text.replace("Autor:", "").strip()
-                                        elif "Editura:" in text:
-                                            book_details['publisher'] = text.replace("Editura:", "").strip()
-                                        elif "Editie:" in text:
-                                            book_details['cover_type'] = text.replace("Editie:", "").strip()
-                                        elif "An aparitie:" in text:
-                                            book_details['publication_year'] = text.replace("An aparitie:", "").strip()
-                                        elif "Nr. pagini:" in text:
-                                            book_details['num_pages'] = text.replace("Nr. pagini:", "").strip()
-                                        elif "Format:" in text:
-                                            book_details['format'] = text.replace("Format:", "").strip()
-                                        elif "Cod:" in text:
-                                            book_details['code'] = text.replace("Cod:", "").strip()
-                                    except Exception as e:
-                                        print(f"Error processing item: {str(e)}")
-                                        continue
-                                        
-                            except Exception as e:
-                                print(f"Error extracting details: {str(e)}")
-
-                            # Print found details
-                            print("\nFound book details:")
-                            print(f"Title: {title}")
-                            for key, value in book_details.items():
-                                if value != "null" and key not in ['year', 'page', 'title']:
-                                    print(f"{key.replace('_', ' ').title()}: {value}")
-                            
-                            print("\nSaving to CSV...")
-                            writer.writerow(book_details)
-                            save_progress(i + 1)  # Don't save runtime during normal processing
-                            
-                        except Exception as e:
-                            print(f"Error processing match: {e}")
-                            continue
-                        
-                    except Exception as e:
-                        print(f"Error processing title.")
-                        log_error(title, str(e))
-                        save_progress(i + 1)  # Don't save runtime during errors
-                        print("Opening Libris.ro...")
-                        driver.get("https://www.libris.ro/")
-                        continue
-                    
-                    time.sleep(1)  # Small delay between requests
+                log.debug("book details", **{key: value for key, value in book_details.items() if value != "null"})
+                with metrics.phase('write'):
+                    writer.writerow(dict(book_details, **{SHARD_POSITION: i}))
+                    csvfile.flush()
+                    queue.complete(i)
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining(start_line, end_line))
+                log.info("title done", position=i+1, title=title, seconds=f"{time.time() - title_start:.1f}",
+                         transferred=format_bytes(page_bytes(driver)))
+                if tabs:
+                    tabs.release()
+                
+                waiter.until('between titles', 1)  # Small delay between requests
 
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)  # Save current line number instead of start_line
+        log.warning("interrupted by user")
         
     except Exception as e:
-        print(f"An error occurred: {e}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(i + 1, total_runtime)  # Save current line number
+        log.error("run stopped", error=first_line(e))
         
     finally:
+        # Unfinished titles go back to pending for the next run
+        queue.release_leases(start_line, end_line)
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)  # Save current line number
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}", browser_restarts=driver.restarts,
+                 **(tabs.stats if tabs else {}))
+        flush_logs()
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
-    scrape_book_details() 
\ No newline at end of file
+    scrape_book_details()
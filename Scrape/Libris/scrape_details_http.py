@@ -0,0 +1,192 @@
+import requests
+import argparse
+import time
+import json
+import os
+import csv
+import sys
+from datetime import timedelta
+from urllib.parse import quote_plus
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from extractors import parse_libris_search_results, parse_libris_book_page
+from store_config import STORE_URLS, SEARCH_PATHS, HEADERS, LIBRIS_FIELDNAMES
+from product_urls import LIBRIS_URLS_FILE, load_url_index, rebase_url
+from work_queue import WorkQueue
+from html_archive import HtmlArchive
+from title_matching import best_match
+from rate_limiter import RateLimiter, host_of
+from retry import TRANSIENT, NOT_FOUND, classify, first_line, retry_call
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+
+BASE_URL = STORE_URLS['libris']
+SEARCH_PATH = SEARCH_PATHS['libris']
+
+# Same files and work queue as scrape_details.py, so the two modes can take over from each other
+PROGRESS_FILE = 'Scrape/Libris/details_progress.json'
+TITLES_FILE = 'Data/Libris/libris_titles_unique.txt'
+DETAILS_FILE = 'Data/Libris/book_details.csv'
+QUEUE_NAME = 'libris_details'
+
+log = get_logger('libris_details_http')
+
+def load_progress():
+    if os.path.exists(PROGRESS_FILE):
+        with open(PROGRESS_FILE, 'r') as f:
+            data = json.load(f)
+            if 'total_runtime' not in data:
+                data['total_runtime'] = 0
+            return data
+    return {'last_processed_line': 0, 'total_runtime': 0}
+
+def format_runtime(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+def open_queue():
+    """Work queue of the title file, seeded on the first run (from details_progress.json if it exists)."""
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        progress = load_progress()
+        with open(TITLES_FILE, 'r', encoding='utf-8') as f:
+            queue.seed(((i, line.strip().split(',', 2)[-1], line) for i, line in enumerate(f)),
+                       progress['last_processed_line'], progress['total_runtime'])
+    return queue
+
+def create_session():
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    return session
+
+def fetch_page(session, url, limiter=None, timeout=15):
+    host = host_of(url)
+    if limiter:
+        limiter.wait(host)
+    try:
+        response = session.get(url, timeout=timeout)
+    except requests.RequestException as e:
+        if limiter:
+            limiter.record(host, error=e)
+        raise
+    if limiter:
+        limiter.record(host, response.status_code, retry_after=response.headers.get('Retry-After'))
+    response.raise_for_status()
+    return response.text
+
+def scrape_title(session, base_url, metrics, year, page, title, listed=None, archive=None, limiter=None):
+    """Return the book_details row of one title, or None if no search result matches it.
+
+    listed is the title's row from the listing URL file; when given the
+    product page is fetched directly and the search is skipped.
+    """
+    if listed:
+        product_url, price = listed['url'], listed['price'] or "null"
+    else:
+        search_url = base_url + SEARCH_PATH.format(query=quote_plus(title))
+        with metrics.phase('search'):
+            results = parse_libris_search_results(fetch_page(session, search_url, limiter))
+            match, _ = best_match(results, title)
+        if not match or not match['href']:
+            return None
+        product_url, price = match['href'], match['price']
+
+    book_details = {field: "null" for field in LIBRIS_FIELDNAMES}
+    book_details.update({'year': year, 'page': page, 'title': title, 'price': price})
+
+    product_url = rebase_url(base_url, product_url)
+    with metrics.phase('navigate'):
+        product_html = fetch_page(session, product_url, limiter)
+    with metrics.phase('extract'):
+        if archive:
+            archive.put('libris_details', product_url, product_html,
+                        {'year': year, 'page': page, 'title': title, 'price': price})
+        book_details.update(parse_libris_book_page(product_html))
+    return book_details
+
+def scrape_book_details_http(base_url=BASE_URL, delay=0.0, max_rate=None):
+    session = create_session()
+    limiter = RateLimiter({host_of(base_url): {'max': max_rate}} if max_rate else None)
+    metrics = ScraperMetrics('libris_details_http')
+    metrics_port = serve_metrics()
+    queue = open_queue()
+    archive = HtmlArchive()
+    # Titles a crashed run left leased
+    queue.release_leases()
+    previous_runtime = queue.runtime()
+    url_index = load_url_index(LIBRIS_URLS_FILE)
+    metrics.set_remaining(queue.remaining())
+
+    start_time = time.time()
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), base_url=base_url,
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+
+    try:
+        with open(DETAILS_FILE, 'a', newline='', encoding='utf-8') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=LIBRIS_FIELDNAMES, delimiter=';')
+
+            if os.path.getsize(DETAILS_FILE) == 0:
+                writer.writeheader()
+
+            for item in queue.items():
+                i, line = item['position'], item['payload']
+                year, page, title = line.strip().split(',', 2)
+                title_start = time.time()
+
+                try:
+                    book_details = retry_call(scrape_title, session, base_url, metrics, year, page, title,
+                                              url_index.get(title), archive, limiter)
+                except Exception as e:
+                    # Any page the parser trips over (lxml's ParserError for an empty or
+                    # truncated one, KeyError, AttributeError...) fails the title, not the run
+                    kind = classify(e)
+                    log.warning("title failed", position=i+1, title=title, kind=kind, error=first_line(e))
+                    # Only transient failures come back; parse errors are recorded once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining())
+                    continue
+
+                if book_details is None:
+                    log.info("title failed", position=i+1, title=title, kind=NOT_FOUND, error="No matching search result")
+                    queue.fail(i, "No matching search result", retry=False, kind=NOT_FOUND)
+                    metrics.title_failed(NOT_FOUND)
+                    metrics.set_remaining(queue.remaining())
+                    continue
+
+                with metrics.phase('write'):
+                    writer.writerow(book_details)
+                    csvfile.flush()
+                    queue.complete(i)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining())
+                log.info("title done", position=i+1, title=title, seconds=f"{time.time() - title_start:.3f}")
+
+                if delay:
+                    time.sleep(delay)
+
+    except KeyboardInterrupt:
+        log.warning("interrupted by user")
+
+    finally:
+        queue.release_leases()
+        runtime = time.time() - start_time
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        archive.close()
+        metrics.close()
+        limiter.close()
+        session.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape Libris book details over plain HTTP (no browser).")
+    parser.add_argument('--base-url', default=BASE_URL,
+                        help="Store root to fetch from, e.g. a local fixture server")
+    parser.add_argument('--delay', type=float, default=0.0,
+                        help="Seconds to wait between titles")
+    parser.add_argument('--max-rate', type=float,
+                        help="Maximum requests per second (the limiter finds the rate the store sustains)")
+    args = parser.parse_args()
+    scrape_book_details_http(args.base_url.rstrip('/'), args.delay, args.max_rate)
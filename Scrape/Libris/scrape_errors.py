@@ -1,15 +1,34 @@
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.edge.options import Options
 from selenium.webdriver.common.keys import Keys
 import time
 import json
 import os
+import sys
 import csv
-import signal
-from datetime import datetime, timedelta
+from datetime import timedelta
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from browser_factory import create_driver, page_bytes, format_bytes
+from consent import open_store
+from adaptive_wait import AdaptiveWait, value_is
+from store_config import STORE_URLS
+from rate_limiter import RateLimiter, host_of
+from page_scripts import libris_search_results
+from title_matching import best_match
+from extractors import parse_libris_book_page
+from work_queue import WorkQueue
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from retry import TRANSIENT, NOT_FOUND, NotFound, classify, first_line
+
+QUEUE_NAME = 'libris_errors'
+# scrape_details.py's queue; the titles it gave up on are this script's input
+DETAILS_QUEUE = 'libris_details'
+HOST = host_of(STORE_URLS['libris'])
+
+log = get_logger(QUEUE_NAME)
 
 def load_progress():
     if os.path.exists('Scrape\Libris\error_progress.json'):
@@ -20,13 +39,21 @@ def load_progress():
             return data
     return {'last_processed_line': 0, 'total_runtime': 0}
 
-def save_progress(line_number, runtime=None):
-    progress_data = load_progress()
-    progress_data['last_processed_line'] = line_number
-    if runtime is not None:
-        progress_data['total_runtime'] = runtime
-    with open('Scrape\Libris\error_progress.json', 'w') as f:
-        json.dump(progress_data, f)
+def open_queue():
+    """The failed titles of the details queue, each at its position there.
+
+    Titles that failed since the last run are added every time, so this
+    replaces reading error_titles.txt (the runtime of error_progress.json
+    is carried over on the first run).
+    """
+    details = WorkQueue(DETAILS_QUEUE)
+    queue = WorkQueue(QUEUE_NAME)
+    if not queue.is_seeded():
+        queue.seed([], 0, load_progress()['total_runtime'])
+    for row in details.failed_items():
+        queue.add(row['position'], row['key'], json.loads(row['payload']))
+    details.close()
+    return queue
 
 def format_runtime(seconds):
     return str(timedelta(seconds=int(seconds)))
@@ -36,241 +63,153 @@ def log_waste(title):
         f.write(f"{title}\n")
 
 def scrape_error_books():
-    edge_options = Options()
-    edge_options.add_argument("--no-sandbox")
-    edge_options.add_argument("--disable-dev-shm-usage")
-    
-    driver = webdriver.Edge(options=edge_options)
-    progress = load_progress()
-    start_line = progress['last_processed_line']
-    previous_runtime = progress['total_runtime']
-    
+    driver = create_driver(profile='libris_errors')
+    waiter = AdaptiveWait(driver, 'libris')
+    limiter = RateLimiter()
+    queue = open_queue()
+    details_queue = WorkQueue(DETAILS_QUEUE)
+    # Titles a crashed run left leased
+    queue.release_leases()
+    previous_runtime = queue.runtime()
+    metrics = ScraperMetrics(QUEUE_NAME)
+    metrics_port = serve_metrics()
+    metrics.set_remaining(queue.remaining())
+
     start_time = time.time()
-    print(f"Previous total runtime: {format_runtime(previous_runtime)}")
-    
+    log.info("starting", previous_runtime=format_runtime(previous_runtime), titles_left=queue.remaining(),
+             metrics=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+
     try:
-        print("Opening Libris.ro...")
-        driver.get("https://www.libris.ro/")
-        
-        # Handle cookie popup
-        try:
-            print("Handling cookie popup...")
-            refuse_button = WebDriverWait(driver, 5).until(
-                EC.presence_of_element_located((By.XPATH, "//a[text()='Refuz toate']"))
-            )
-            if refuse_button.is_displayed():
-                refuse_button.click()
-                time.sleep(10)
-        except:
-            print("No cookie popup found or already handled")
-        
-        # Handle newsletter popup
-        try:
-            print("Handling newsletter popup...")
-            close_newsletter = WebDriverWait(driver, 5).until(
-                EC.element_to_be_clickable((By.CLASS_NAME, "modal-close-x-c-newsletter"))
-            )
-            if close_newsletter.is_displayed():
-                close_newsletter.click()
-                time.sleep(1)
-        except:
-            print("No newsletter popup found or already handled")
+        log.info("opening Libris.ro")
+        # Saved consent first; the popups are only handled when there is none
+        open_store(driver, 'libris', timeout=5, limiter=limiter)
 
         with open('Data\Libris\\book_details.csv', 'a', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['year', 'page', 'title', 'average_score', 'votes', 'price', 
+            fieldnames = ['year', 'page', 'title', 'average_score', 'votes', 'price',
                          'categories', 'author', 'publisher', 'cover_type',
                          'publication_year', 'num_pages', 'format', 'code']
             writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';')
-            
-            with open('Data\Libris\error_titles.txt', 'r', encoding='utf-8') as f:
-                lines = f.readlines()[start_line:]
-                
-                for i, line in enumerate(lines, start=start_line):
-                    title = line.strip()  # Error titles don't have year and page
-                    print(f"\n{'='*50}")
-                    print(f"Processing title {i+1}: {title}")
-                    print(f"{'='*50}")
-                    
-                    try:
-                        print("Searching for the book...")
+
+            for item in queue.items():
+                i = item['position']
+                # The title file's "year,page,title" line
+                year, page, title = item['payload'].strip().split(',', 2)
+                title_start = time.time()
+                log.debug("processing title", position=i+1, title=title)
+
+                try:
+                    with metrics.phase('search'):
+                        log.debug("searching", title=title)
                         search_box = WebDriverWait(driver, 5).until(
                             EC.presence_of_element_located((By.ID, "autoComplete"))
                         )
                         search_box.clear()
-                        time.sleep(1)
+                        waiter.until('search box cleared', 1, value_is(search_box, ""), network_idle=False)
                         search_box.send_keys(title)
-                        time.sleep(0.5)
+                        waiter.until('query typed', 0.5, value_is(search_box, title), network_idle=False)
+                        limiter.wait(HOST)
                         search_box.send_keys(Keys.RETURN)
-                        
+
                         WebDriverWait(driver, 15).until(
                             EC.presence_of_element_located((By.CLASS_NAME, "pr-title-categ-pg"))
                         )
-                        
-                        time.sleep(1)
-                        
-                        results = driver.find_elements(By.CLASS_NAME, "pr-title-categ-pg")
-                        
-                        matching_result = None
-                        for result in results:
-                            if result.text.strip() == title.strip():
-                                matching_result = result
-                                try:
-                                    parent_container = result.find_element(By.XPATH, "./ancestor::div[contains(@class, 'pr-history-item')]")
-                                    link = parent_container.find_element(By.TAG_NAME, "a")
-                                    html_content = link.get_attribute('outerHTML')
-                                    
-                                    if 'data-price="' in html_content:
-                                        price = html_content.split('data-price="')[1].split('"')[0]
-                                        print(f"Found price from search results: {price}")
-                                    else:
-                                        price = "null"
-                                        print("Price attribute not found in HTML")
-                                        
-                                except Exception as e:
-                                    print(f"Could not find price in search results: {str(e)}")
-                                    price = "null"
-                                break
-                        
-                        if not matching_result:
-                            print(f"No exact matches found for: {title}")
-                            log_waste(title)
-                            save_progress(i + 1)
-                            continue
-                        
-                        try:
-                            WebDriverWait(driver, 5).until(
-                                EC.element_to_be_clickable((By.CLASS_NAME, "pr-title-categ-pg"))
-                            )
-                            time.sleep(1)
-                            matching_result.click()
-                            
-                            wait = WebDriverWait(driver, 5)
-                            wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "pr-lista-detalii")))
-                            time.sleep(1)
 
-                            book_details = {
-                                'year': "null",  # No year info in error titles
-                                'page': "null",  # No page info in error titles
-                                'title': title,
-                                'average_score': "null",
-                                'votes': "null",
-                                'price': price,
-                                'categories': "null",
-                                'author': "null",
-                                'publisher': "null",
-                                'cover_type': "null",
-                                'publication_year': "null",
-                                'num_pages': "null",
-                                'format': "null",
-                                'code': "null"
-                            }
+                        waiter.until('search results', 1)
 
-                            # Get review data
-                            try:
-                                print("Extracting review data...")
-                                feedback_element = wait.until(
-                                    EC.presence_of_element_located((By.CLASS_NAME, "pr-rg-feedback-count"))
-                                )
-                                feedback_text = feedback_element.text.strip()
-                                score = feedback_text.split('(')[0].strip()
-                                votes = feedback_text.split('(')[1].split('review')[0].strip()
-                                
-                                book_details['average_score'] = score or "null"
-                                book_details['votes'] = votes or "null"
-                                print(f"Found reviews - Score: {score}, Number of reviews: {votes}")
-                            except:
-                                print("No reviews found for this book")
-                                book_details['average_score'] = "0"
-                                book_details['votes'] = "0"
+                        # Titles, links and prices of every result in one round-trip
+                        results = libris_search_results(driver)
 
-                            # Click "show more" button
-                            try:
-                                print("Expanding details...")
-                                show_more = wait.until(
-                                    EC.element_to_be_clickable((By.CLASS_NAME, "afiseaza-mai-mult"))
-                                )
-                                show_more.click()
-                                time.sleep(1)
-                            except Exception as e:
-                                print(f"Could not expand details: {str(e)}")
+                        # Best-scoring result by normalized title, if it is close enough
+                        match, match_score = best_match(results, title)
+                        if not match:
+                            raise NotFound("No matching search result")
+                        if match_score < 1:
+                            log.info("closest match", score=f"{match_score:.2f}", result=match['title'])
+                        price = match['price']
+                        log.debug("price from search results", price=price)
 
-                            # Extract details
-                            print("Extracting book details...")
-                            try:
-                                items = wait.until(
-                                    EC.presence_of_all_elements_located((By.CLASS_NAME, "pr-lista-item"))
-                                )
-                                
-                                for item in items:
-                                    try:
-                                        text = item.text.strip()
-                                        if "Categoria:" in text:
-                                            book_details['categories'] = text.replace("Categoria:", "").strip()
-                                        elif "Autor:" in text:
-                                            book_details['author'] = text.replace("Autor:", "").strip()
-                                        elif "Editura:" in text:
-                                            book_details['publisher'] = text.replace("Editura:", "").strip()
-                                        elif "Editie:" in text:
-                                            book_details['cover_type'] = text.replace("Editie:", "").strip()
-                                        elif "An aparitie:" in text:
-                                            book_details['publication_year'] = text.replace("An aparitie:", "").strip()
-                                        elif "Nr. pagini:" in text:
-                                            book_details['num_pages'] = text.replace("Nr. pagini:", "").strip()
-                                        elif "Format:" in text:
-                                            book_details['format'] = text.replace("Format:", "").strip()
-                                        elif "Cod:" in text:
-                                            book_details['code'] = text.replace("Cod:", "").strip()
-                                    except Exception as e:
-                                        print(f"Error processing item: {str(e)}")
-                                        continue
+                    with metrics.phase('navigate'):
+                        WebDriverWait(driver, 5).until(
+                            EC.element_to_be_clickable((By.CLASS_NAME, "pr-title-categ-pg"))
+                        )
+                        waiter.until('before click', 1)
+                        limiter.wait(HOST)
+                        match['element'].click()
+
+                        wait = WebDriverWait(driver, 5)
+                        wait.until(EC.visibility_of_element_located((By.CLASS_NAME, "pr-lista-detalii")))
+                        waiter.until('product page', 1)
+
+                    book_details = {
+                        'year': year,
+                        'page': page,
+                        'title': title,
+                        'average_score': "null",
+                        'votes': "null",
+                        'price': price,
+                        'categories': "null",
+                        'author': "null",
+                        'publisher': "null",
+                        'cover_type': "null",
+                        'publication_year': "null",
+                        'num_pages': "null",
+                        'format': "null",
+                        'code': "null"
+                    }
 
-                            except Exception as e:
-                                print(f"Error extracting details: {str(e)}")
+                    # Review data and every pr-lista-item from one copy of the
+                    # page source (the "show more" button only toggles visibility)
+                    with metrics.phase('extract'):
+                        book_details.update(parse_libris_book_page(driver.page_source))
 
-                            print("\nFound book details:")
-                            for key, value in book_details.items():
-                                if value != "null":
-                                    print(f"{key.replace('_', ' ').title()}: {value}")
-                            
-                            print("\nSaving to CSV...")
-                            writer.writerow(book_details)
-                            save_progress(i + 1)
-                            
-                        except Exception as e:
-                            print(f"Error processing match: {e}")
-                            log_waste(title)
-                            continue
-                        
-                    except Exception as e:
-                        print(f"Error processing title: {str(e)}")
+                except Exception as e:
+                    kind = classify(e)
+                    limiter.record_page(HOST, driver, e)
+                    (log.info if kind == NOT_FOUND else log.warning)(
+                        "title failed", position=i+1, title=title, kind=kind, error=first_line(e))
+                    # Transient failures come back later; the rest go to waste.txt once
+                    queue.fail(i, e, retry=kind == TRANSIENT, kind=kind)
+                    metrics.title_failed(kind)
+                    metrics.set_remaining(queue.remaining())
+                    if kind != TRANSIENT:
                         log_waste(title)
-                        save_progress(i + 1)
-                        # driver.get("https://www.libris.ro/")
-                        continue
-                    
-                    time.sleep(1)
+                    continue
+
+                log.debug("book details", **{key: value for key, value in book_details.items() if value != "null"})
+                with metrics.phase('write'):
+                    writer.writerow(book_details)
+                    csvfile.flush()
+                    queue.complete(i)
+                    # Found after all: the details queue no longer lists it as failed
+                    details_queue.complete(i)
+                limiter.record_page(HOST, driver)
+                metrics.title_done()
+                metrics.set_remaining(queue.remaining())
+                log.info("title done", position=i+1, title=title, seconds=f"{time.time() - title_start:.1f}",
+                         transferred=format_bytes(page_bytes(driver)))
+
+                waiter.until('between titles', 1)
 
     except KeyboardInterrupt:
-        print("\nScript interrupted by user!")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
-        
+        log.warning("interrupted by user")
+
     except Exception as e:
-        print(f"An error occurred: {e}")
-        runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        save_progress(i + 1, total_runtime)
-        
+        log.error("run stopped", error=first_line(e))
+
     finally:
+        # Unfinished titles go back to pending for the next run
+        queue.release_leases()
         runtime = time.time() - start_time
-        total_runtime = previous_runtime + runtime
-        print(f"\nSession runtime: {format_runtime(runtime)}")
-        print(f"Total runtime: {format_runtime(total_runtime)}")
-        save_progress(i + 1, total_runtime)
+        queue.add_runtime(runtime)
+        log.info("finished", session_runtime=format_runtime(runtime), total_runtime=format_runtime(queue.runtime()),
+                 titles_per_hour=f"{metrics.titles_per_hour():.0f}")
+        flush_logs()
+        queue.close()
+        details_queue.close()
+        metrics.close()
+        limiter.close()
+        waiter.close()
         driver.quit()
 
 if __name__ == "__main__":
-    scrape_error_books() 
\ No newline at end of file
+    scrape_error_books()
@@ -0,0 +1,118 @@
+import json
+import os
+import time
+from datetime import timedelta
+
+WAIT_STATS_FILE = 'Scrape/wait_stats.json'
+
+# How long the resource count must stay the same for the network to count as idle
+QUIET_SECONDS = 0.2
+# Waits a label needs before its learned latency replaces the old fixed delay as the cap
+MIN_SAMPLES = 5
+# Smoothing of the learned mean/deviation (like TCP's RTT estimate)
+ALPHA = 0.2
+
+NETWORK_STATE_SCRIPT = "return [document.readyState, performance.getEntriesByType('resource').length];"
+
+
+def value_is(element, text):
+    # The search box holds exactly this text (typed, or cleared when text is "")
+    return lambda driver: element.get_attribute('value') == text
+
+def element_present(by, value):
+    return lambda driver: len(driver.find_elements(by, value)) > 0
+
+
+class AdaptiveWait:
+    """Condition waits that replace the scrapers' fixed time.sleep() pauses.
+
+    until(label, fixed, condition) returns as soon as the condition holds and
+    the page has stopped loading resources, polling every poll seconds. It
+    never waits longer than the old fixed delay, and once a label has
+    MIN_SAMPLES waits it caps the wait at the learned latency for the store
+    (mean + 4 deviations), so a page that keeps polling the network does not
+    cost the full delay either. Learned latencies are kept in
+    wait_stats.json between runs; report() prints the time saved.
+    """
+
+    def __init__(self, driver, store, stats_path=WAIT_STATS_FILE, poll=0.05):
+        self.driver = driver
+        self.store = store
+        self.stats_path = stats_path
+        self.poll = poll
+        self.stats = load_stats(stats_path).get(store, {})
+        self.session = {}
+
+    def timeout(self, label, fixed):
+        learned = self.stats.get(label)
+        if not learned or learned['count'] < MIN_SAMPLES:
+            return fixed
+        return min(fixed, learned['mean'] + 4 * learned['dev'] + QUIET_SECONDS)
+
+    def network_idle(self, state):
+        # state carries the last resource count and since when it has not changed
+        try:
+            ready, resources = self.driver.execute_script(NETWORK_STATE_SCRIPT)
+        except Exception:
+            return True
+        now = time.time()
+        if ready != 'complete' or resources != state.get('resources'):
+            state.update(resources=resources, since=now)
+            return False
+        return now - state['since'] >= QUIET_SECONDS
+
+    def until(self, label, fixed, condition=None, network_idle=True):
+        """Wait for condition(driver) (and network idle) instead of time.sleep(fixed)."""
+        start = time.time()
+        deadline = start + self.timeout(label, fixed)
+        state = {}
+        while True:
+            try:
+                ready = condition is None or condition(self.driver)
+            except Exception:
+                ready = False
+            if ready and (not network_idle or self.network_idle(state)):
+                break
+            if time.time() >= deadline:
+                break
+            time.sleep(self.poll)
+        self.record(label, fixed, time.time() - start)
+
+    def record(self, label, fixed, elapsed):
+        learned = self.stats.setdefault(label, {'count': 0, 'mean': elapsed, 'dev': elapsed / 2})
+        learned['dev'] = (1 - ALPHA) * learned['dev'] + ALPHA * abs(elapsed - learned['mean'])
+        learned['mean'] = (1 - ALPHA) * learned['mean'] + ALPHA * elapsed
+        learned['count'] += 1
+        session = self.session.setdefault(label, {'waits': 0, 'waited': 0.0, 'fixed': 0.0})
+        session['waits'] += 1
+        session['waited'] += elapsed
+        session['fixed'] += fixed
+
+    def report(self):
+        saved = sum(s['fixed'] - s['waited'] for s in self.session.values())
+        print(f"\nAdaptive waits saved {timedelta(seconds=int(saved))} versus the fixed delays")
+        for label, s in sorted(self.session.items()):
+            print(f"  {label}: {s['waits']} waits, {s['waited'] / s['waits']:.2f} s average "
+                  f"instead of {s['fixed'] / s['waits']:.2f} s")
+        return saved
+
+    def save(self):
+        # Re-read first so parallel shards of other stores are not overwritten
+        stats = load_stats(self.stats_path)
+        stats[self.store] = self.stats
+        temp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(stats, f, indent=1)
+        os.replace(temp_path, self.stats_path)
+
+    def close(self):
+        if self.session:
+            self.report()
+        self.save()
+
+
+def load_stats(path=WAIT_STATS_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
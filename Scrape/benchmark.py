@@ -0,0 +1,333 @@
+import argparse
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    import psutil  # Optional: CPU and memory of every process of a run (browsers included)
+except ImportError:
+    psutil = None
+try:
+    import resource  # POSIX only; the fallback when psutil is missing
+except ImportError:
+    resource = None
+
+from store_config import DEFAULT_RATE_LIMIT
+from html_archive import ARCHIVE_DIR
+from mock_store import MOCK_STORES, Faults, RecordedPages, listing_title, book_for, serve_stores
+from rate_limiter import host_of
+
+# Runs every scraper against mock_store.py (recorded pages from the HTML
+# archive, synthetic pages for the rest) and keeps the numbers in a JSON
+# history, so a slower commit shows up next to the run before it.
+SCRAPE_DIR = os.path.dirname(os.path.abspath(__file__))
+HISTORY_FILE = 'Scrape/benchmark_history.json'
+
+# (store, stage, mode, script and arguments); {workers}, {base_url}, {host}
+# and {rate} are filled in per run
+SCENARIOS = [
+    ('libris', 'details', 'browser', ['Libris/scrape_details.py']),
+    ('libris', 'details', 'pool', ['driver_pool.py', 'libris', '--workers', '{workers}']),
+    ('libris', 'details', 'http', ['Libris/scrape_details_http.py', '--base-url', '{base_url}', '--max-rate', '{rate}']),
+    ('libris', 'details', 'async', ['crawl_all.py', 'details', '--stores', 'libris', '--workers', '{workers}',
+                                    '--max-rate', '{host}={rate}']),
+    ('bookline', 'details', 'browser', ['Bookline/bl_scr_det2.py']),
+    ('bookline', 'details', 'pool', ['driver_pool.py', 'bookline', '--workers', '{workers}']),
+    ('bookline', 'details', 'async', ['crawl_all.py', 'details', '--stores', 'bookline', '--workers', '{workers}',
+                                      '--max-rate', '{host}={rate}']),
+    ('carturesti', 'details', 'browser', ['Carturesti/carturesti_scrape_details.py']),
+    ('carturesti', 'details', 'pool', ['driver_pool.py', 'carturesti', '--workers', '{workers}']),
+    ('carturesti', 'details', 'http', ['Carturesti/carturesti_scrape_api.py', '--base-url', '{base_url}',
+                                       '--max-rate', '{rate}']),
+    ('carturesti', 'details', 'async', ['crawl_all.py', 'details', '--stores', 'carturesti', '--workers', '{workers}',
+                                        '--max-rate', '{host}={rate}']),
+    ('libris', 'listing', 'browser', ['Libris/libris.py']),
+    ('libris', 'listing', 'async', ['crawl_all.py', 'listing', '--stores', 'libris', '--workers', '{workers}',
+                                    '--max-rate', '{host}={rate}']),
+    ('bookline', 'listing', 'browser', ['Bookline/bookline_books.py']),
+    ('bookline', 'listing', 'async', ['crawl_all.py', 'listing', '--stores', 'bookline', '--workers', '{workers}',
+                                      '--max-rate', '{host}={rate}']),
+]
+MODES = ['browser', 'pool', 'http', 'async']
+# Modes that take a number of workers; the others always run one
+PARALLEL_MODES = {'pool', 'async'}
+
+# Log lines of a finished title (scrape_log key=value format) and the
+# listing scrapers' per-page counts
+TITLE_DONE = re.compile(r" (?:title|book) done .*?seconds=([\d.]+)")
+TITLE_FAILED = re.compile(r" (?:title|book) failed ")
+LISTING_TITLES = re.compile(r"\b(\d+) titles\b")
+
+# A drop in titles/sec larger than this against the previous run is flagged
+REGRESSION_THRESHOLD = 0.10
+SAMPLE_SECONDS = 0.5
+
+
+def fixture_titles(store, count, archive_root):
+    """count input rows for a detail scraper: archived titles first (their pages are replayed), then synthetic ones."""
+    rows = []
+    if archive_root:
+        recorded = RecordedPages(store, "", archive_root)
+        rows = [context for _, context in recorded.titles.values()][:count]
+    for i in range(len(rows), count):
+        rows.append({'year': 2020, 'page': i // 40 + 1, 'rank': i + 1,
+                     'title': f"{listing_title('fixture', store, i)} {i}"})
+    return rows
+
+def write_fixtures(workdir, store, count, archive_root):
+    # The input files the detail scrapers (and crawl_all) read, in a fresh working directory
+    rows = fixture_titles(store, count, archive_root)
+    if store == 'libris':
+        with open(os.path.join(workdir, 'Data', 'Libris', 'libris_titles_unique.txt'), 'w', encoding='utf-8') as f:
+            f.writelines(f"{row.get('year', 2020)},{row.get('page', 1)},{row['title']}\n" for row in rows)
+    elif store == 'bookline':
+        with open(os.path.join(workdir, 'Data', 'Bookline', 'Bookline_booktitles.csv'), 'w', encoding='utf-8') as f:
+            f.write("page;rank;title;publisher;url;product_id\n")
+            f.writelines(f"{row.get('page', 1)};{row.get('rank', i + 1)};{row['title']};;;\n"
+                         for i, row in enumerate(rows))
+    elif store == 'carturesti':
+        with open(os.path.join(workdir, 'Data', 'Carturesti', 'book_details_carturesti.csv'), 'w', encoding='utf-8') as f:
+            f.write("title,price,author\n")
+            for row in rows:
+                title = row['title'].replace('"', "'")
+                f.write(f"\"{title}\",0,\"{book_for(title)['author']}\"\n")
+
+def make_workdir(base_urls, rate):
+    """Empty copy of the repo layout the scrapers write into (queue, progress files, outputs)."""
+    workdir = tempfile.mkdtemp(prefix='scrape_bench_')
+    for path in ['Data/Libris', 'Data/Bookline', 'Data/Carturesti', 'Scrape/Libris', 'Scrape/Bookline',
+                 'Scrape/Carturesti']:
+        os.makedirs(os.path.join(workdir, path))
+    # Start every mock host at the benchmark rate instead of ramping up from the default
+    with open(os.path.join(workdir, 'Scrape', 'rate_limits.json'), 'w') as f:
+        json.dump({host_of(url): {'rate': rate, 'updated_at': time.time()} for url in base_urls.values()}, f)
+    return workdir
+
+def percentile(values, fraction):
+    # Nearest-rank percentile of a non-empty list
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+class ResourceSampler:
+    """CPU seconds and peak RSS of a process and all its children (browsers and pool workers).
+
+    Uses psutil when it is installed; otherwise only the POSIX rusage totals
+    of the finished run are available.
+    """
+
+    def __init__(self, pid):
+        self.process = psutil.Process(pid) if psutil else None
+        self.cpu = {}  # pid -> CPU seconds, kept after the process exits
+        self.peak_rss = 0
+
+    def sample(self):
+        if not self.process:
+            return
+        try:
+            processes = [self.process] + self.process.children(recursive=True)
+        except psutil.Error:
+            return
+        rss = 0
+        for process in processes:
+            try:
+                times = process.cpu_times()
+                self.cpu[process.pid] = times.user + times.system
+                rss += process.memory_info().rss
+            except psutil.Error:
+                pass
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def totals(self, usage_before):
+        if self.process:
+            return sum(self.cpu.values()), self.peak_rss / 1e6
+        if usage_before is None:
+            return None, None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu = usage.ru_utime + usage.ru_stime - usage_before.ru_utime - usage_before.ru_stime
+        # ru_maxrss is the largest single process, in KB on Linux and bytes on macOS
+        scale = 1e6 if sys.platform == 'darwin' else 1e3
+        return cpu, usage.ru_maxrss / scale
+
+
+def run_scenario(store, stage, mode, args, workers, base_urls, options):
+    workdir = make_workdir(base_urls, options.rate)
+    if stage == 'details':
+        write_fixtures(workdir, store, options.titles, options.archive)
+    host = host_of(base_urls[store])
+    values = {'workers': workers, 'base_url': base_urls[store], 'host': host, 'rate': options.rate}
+    command = [sys.executable, os.path.join(SCRAPE_DIR, args[0])] + [arg.format(**values) for arg in args[1:]]
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', SCRAPE_LOG_LEVEL='INFO')
+    env.update({f"SCRAPE_{name.upper()}_URL": url for name, url in base_urls.items()})
+
+    usage_before = resource.getrusage(resource.RUSAGE_CHILDREN) if resource else None
+
+    lines = []
+    start = time.time()
+    process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, encoding='utf-8', errors='replace')
+    reader = threading.Thread(target=lambda: lines.extend(process.stdout), daemon=True)
+    reader.start()
+    sampler = ResourceSampler(process.pid)
+    timed_out = False
+    while process.poll() is None:
+        sampler.sample()
+        if time.time() - start > options.timeout:
+            timed_out = True
+            stop_tree(process)
+            break
+        time.sleep(SAMPLE_SECONDS)
+    process.wait()
+    reader.join(timeout=5)
+    seconds = time.time() - start
+
+    latencies = [float(match.group(1)) for match in map(TITLE_DONE.search, lines) if match]
+    if stage == 'details':
+        titles = len(latencies)
+    else:
+        titles = sum(int(match.group(1)) for match in map(LISTING_TITLES.search, lines) if match)
+    cpu, rss = sampler.totals(usage_before)
+    result = {
+        'scenario': f"{store}/{stage}/{mode}",
+        'workers': workers,
+        'titles': titles,
+        'failed': sum(1 for line in lines if TITLE_FAILED.search(line)),
+        'seconds': round(seconds, 2),
+        'titles_per_second': round(titles / seconds, 3) if seconds else 0.0,
+        'p50_seconds': round(percentile(latencies, 0.5), 3) if latencies else None,
+        'p99_seconds': round(percentile(latencies, 0.99), 3) if latencies else None,
+        'cpu_seconds_per_worker': round(cpu / workers, 2) if cpu is not None else None,
+        'rss_mb_per_worker': round(rss / workers, 1) if rss is not None else None,
+        'returncode': process.returncode,
+        'timed_out': timed_out,
+    }
+    if process.returncode and not timed_out:
+        # Last lines of the run, usually the traceback
+        result['error'] = ''.join(lines[-3:]).strip()
+    if options.keep:
+        result['workdir'] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+def stop_tree(process):
+    children = []
+    if psutil:
+        try:
+            children = psutil.Process(process.pid).children(recursive=True)
+        except psutil.Error:
+            pass
+    process.kill()
+    for child in children:
+        try:
+            child.kill()
+        except psutil.Error:
+            pass
+
+
+def load_history(path=HISTORY_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return []
+
+def save_history(history, path=HISTORY_FILE):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(history, f, indent=1)
+    os.replace(temp_path, path)
+
+def previous_result(history, result):
+    for run in reversed(history):
+        for old in run['results']:
+            if old['scenario'] == result['scenario'] and old['workers'] == result['workers']:
+                return old
+    return None
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=SCRAPE_DIR).stdout.strip() or None
+    except OSError:
+        return None
+
+def format_value(value, spec):
+    return "-" if value is None else format(value, spec)
+
+def print_result(result, previous):
+    change = ""
+    if previous and previous['titles_per_second']:
+        ratio = result['titles_per_second'] / previous['titles_per_second'] - 1
+        change = f"{ratio:+.0%}" + (" REGRESSION" if ratio < -REGRESSION_THRESHOLD else "")
+    print(f"{result['scenario']:<28} {result['workers']:>3} {result['titles']:>6} "
+          f"{result['titles_per_second']:>9.2f} {format_value(result['p50_seconds'], '.3f'):>7} "
+          f"{format_value(result['p99_seconds'], '.3f'):>7} {format_value(result['cpu_seconds_per_worker'], '.1f'):>7} "
+          f"{format_value(result['rss_mb_per_worker'], '.0f'):>7}  {change}")
+    if result.get('error'):
+        print(f"    exited with {result['returncode']}: {result['error'].splitlines()[-1]}")
+    elif result['timed_out']:
+        print("    stopped at the time limit")
+
+
+def benchmark(options):
+    faults = Faults(latency=options.latency)
+    servers = serve_stores(MOCK_STORES, port=0, faults=faults, listing_pages=options.listing_pages,
+                           archive_root=options.archive)
+    base_urls = {store: server.base_url for store, server in servers.items()}
+    history = load_history(options.history)
+    results = []
+
+    print(f"{'scenario':<28} {'wrk':>3} {'titles':>6} {'titles/s':>9} {'p50 s':>7} {'p99 s':>7} "
+          f"{'cpu s':>7} {'rss MB':>7}  vs last run")
+    try:
+        for store, stage, mode, args in SCENARIOS:
+            if store not in options.stores or stage not in options.stages or mode not in options.modes:
+                continue
+            for workers in (options.workers if mode in PARALLEL_MODES else [1]):
+                result = run_scenario(store, stage, mode, args, workers, base_urls, options)
+                print_result(result, previous_result(history, result))
+                results.append(result)
+    finally:
+        for server in servers.values():
+            server.shutdown()
+        if results:
+            history.append({
+                'started_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'commit': git_commit(),
+                'options': {'titles': options.titles, 'latency': options.latency, 'rate': options.rate,
+                            'listing_pages': options.listing_pages,
+                            'archive': bool(options.archive), 'psutil': psutil is not None},
+                'results': results,
+            })
+            save_history(history, options.history)
+            print(f"\nSaved {len(results)} results to {options.history}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scrapers against the local mock stores.")
+    parser.add_argument('--stores', nargs='+', default=MOCK_STORES, choices=MOCK_STORES)
+    parser.add_argument('--stages', nargs='+', default=['details', 'listing'], choices=['details', 'listing'])
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES,
+                        help="browser: one Selenium scraper, pool: driver_pool.py, http: requests, async: crawl_all.py")
+    parser.add_argument('--workers', nargs='+', type=int, default=[1, 2, 4],
+                        help="Concurrency levels of the pool and async modes")
+    parser.add_argument('--titles', type=int, default=100, help="Titles per detail run")
+    parser.add_argument('--latency', type=float, default=0.05, help="Mean response time of the mock stores")
+    parser.add_argument('--listing-pages', type=int, default=2,
+                        help="Listing pages per Libris year and for Bookline")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE_LIMIT['max'],
+                        help="Requests per second per store the scrapers start at (and are capped at)")
+    parser.add_argument('--timeout', type=float, default=600, help="Seconds before a run is stopped")
+    parser.add_argument('--archive', default=ARCHIVE_DIR,
+                        help="HTML archive to replay; an empty value serves only synthetic pages")
+    parser.add_argument('--history', default=HISTORY_FILE)
+    parser.add_argument('--keep', action='store_true', help="Keep the working directories of the runs")
+    options = parser.parse_args()
+    options.archive = os.path.abspath(options.archive) if options.archive else None
+    benchmark(options)
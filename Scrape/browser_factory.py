@@ -0,0 +1,93 @@
+import json
+import os
+
+from selenium import webdriver
+from selenium.webdriver.edge.options import Options
+
+from store_config import NETWORK_LOG
+
+# One profile (cookies + disk cache) per scraper, reused across runs
+PROFILE_DIR = 'Scrape/browser_profiles'
+
+# Blocked at the network level, before a request is sent. None of the
+# scrapers read images, media or fonts, so only the HTML and the stores'
+# own scripts are downloaded.
+BLOCKED_RESOURCES = [
+    '*.jpg', '*.jpeg', '*.png', '*.gif', '*.webp', '*.avif', '*.svg', '*.ico', '*.bmp',
+    '*.mp4', '*.webm', '*.mp3', '*.ogg', '*.m3u8',
+    '*.woff', '*.woff2', '*.ttf', '*.otf', '*.eot',
+]
+# Third-party analytics, ads and chat widgets seen on the three stores
+BLOCKED_THIRD_PARTY = [
+    '*googletagmanager.com*', '*google-analytics.com*', '*googleadservices.com*',
+    '*doubleclick.net*', '*googlesyndication.com*', '*connect.facebook.net*',
+    '*facebook.com/tr*', '*hotjar.com*', '*clarity.ms*', '*tiktok.com*',
+    '*criteo.com*', '*criteo.net*', '*2performant.com*', '*retargeting.biz*',
+    '*smartsupp.com*', '*tawk.to*', '*youtube.com*', '*vimeo.com*',
+]
+# Stylesheets are off by default: the scrapers wait for elements to be
+# visible/clickable, which can change when the page has no CSS
+BLOCKED_STYLES = ['*.css']
+
+
+def create_driver(profile=None, headless=True, block_resources=True, block_styles=False, network_log=NETWORK_LOG):
+    """Edge with the lean scraping profile.
+
+    profile names a persistent user-data directory under PROFILE_DIR, so the
+    disk cache and cookies survive between runs. Two browsers must not use
+    the same profile at once; parallel shards pass different names.
+    network_log keeps the performance log page_bytes() reads.
+    """
+    edge_options = Options()
+    if headless:
+        edge_options.add_argument("--headless=new")
+    edge_options.add_argument("--no-sandbox")
+    edge_options.add_argument("--disable-dev-shm-usage")
+    edge_options.add_argument("--disable-extensions")
+    edge_options.add_argument("--mute-audio")
+    edge_options.add_argument("--window-size=1366,900")
+    if profile:
+        profile_path = os.path.abspath(os.path.join(PROFILE_DIR, profile))
+        os.makedirs(profile_path, exist_ok=True)
+        edge_options.add_argument(f"--user-data-dir={profile_path}")
+    if block_resources:
+        edge_options.add_argument("--blink-settings=imagesEnabled=false")
+        edge_options.add_experimental_option('prefs', {'profile.managed_default_content_settings.images': 2})
+    if network_log:
+        # Network events are read back by page_bytes()
+        edge_options.set_capability('ms:loggingPrefs', {'performance': 'ALL'})
+
+    driver = webdriver.Edge(options=edge_options)
+    driver.blocked_urls = []
+    if block_resources:
+        driver.blocked_urls += BLOCKED_RESOURCES + BLOCKED_THIRD_PARTY
+    if block_styles:
+        driver.blocked_urls += BLOCKED_STYLES
+    setup_tab(driver)
+    return driver
+
+def setup_tab(driver):
+    """Block the driver's URL patterns in the tab it is on.
+
+    CDP commands reach only the current tab, so every new tab (TabPrefetcher's
+    background tabs) needs this before it loads a page.
+    """
+    driver.execute_cdp_cmd('Network.enable', {})
+    if driver.blocked_urls:
+        driver.execute_cdp_cmd('Network.setBlockedURLs', {'urls': driver.blocked_urls})
+
+def page_bytes(driver):
+    """Bytes received from the network since the last call (0 for cache hits, or without network_log)."""
+    total = 0
+    try:
+        entries = driver.get_log('performance')
+    except Exception:
+        return 0
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        if message['method'] == 'Network.loadingFinished':
+            total += message['params'].get('encodedDataLength', 0)
+    return total
+
+def format_bytes(count):
+    return f"{count / 1024:.0f} KB" if count < 1024 * 1024 else f"{count / (1024 * 1024):.1f} MB"
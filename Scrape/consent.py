@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from urllib.parse import urlsplit
+
+from selenium.webdriver.common.by import By
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException
+
+from browser_factory import PROFILE_DIR
+from store_config import STORE_URLS
+from rate_limiter import host_of
+
+# Cookie/newsletter consent captured once per store and injected into every
+# new browser session, so the popups (and their fixed waits) are skipped
+CONSENT_FILE = os.path.join(PROFILE_DIR, '{store}_consent.json')
+
+COOKIE_FIELDS = ['name', 'value', 'domain', 'path', 'expires', 'secure', 'httpOnly', 'sameSite']
+
+
+def store_domain(store):
+    # Cookie domains have no port (a local mock store runs on one)
+    return urlsplit(STORE_URLS[store]).hostname.replace('www.', '')
+
+def save_consent(driver, store):
+    """Save the store's persistent cookies and localStorage after the popups were handled."""
+    domain = store_domain(store)
+    cookies = driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies']
+    cookies = [{field: cookie[field] for field in COOKIE_FIELDS if field in cookie}
+               for cookie in cookies if cookie['domain'].endswith(domain) and not cookie.get('session')]
+    try:
+        local_storage = driver.execute_script("return Object.assign({}, window.localStorage);")
+    except Exception:
+        local_storage = {}
+    if not cookies and not local_storage:
+        return
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(CONSENT_FILE.format(store=store), 'w', encoding='utf-8') as f:
+        json.dump({'saved_at': time.time(), 'cookies': cookies, 'local_storage': local_storage}, f, indent=1)
+    print(f"Saved {len(cookies)} consent cookies for {store}")
+
+def restore_consent(driver, store):
+    """Inject the saved consent into a new session; False if there is none (or it expired)."""
+    path = CONSENT_FILE.format(store=store)
+    if not os.path.exists(path):
+        return False
+    with open(path, 'r', encoding='utf-8') as f:
+        saved = json.load(f)
+    now = time.time()
+    cookies = [cookie for cookie in saved['cookies'] if cookie.get('expires', now + 1) > now]
+    if not cookies and not saved['local_storage']:
+        return False
+    if cookies:
+        # CDP sets cookies for any domain without opening the store first
+        driver.execute_cdp_cmd('Network.setCookies', {'cookies': cookies})
+    if saved['local_storage']:
+        # Filled in before the store's own scripts run, on every page of the store
+        script = (f"if (location.hostname.endsWith({json.dumps(store_domain(store))})) {{"
+                  f" const saved = {json.dumps(saved['local_storage'])};"
+                  " for (const [key, value] of Object.entries(saved))"
+                  " if (localStorage.getItem(key) === null) localStorage.setItem(key, value); }")
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {'source': script})
+    return True
+
+def wait_closed(driver, element, timeout=1):
+    # Until the clicked popup is gone, at most the fixed pause it replaces
+    try:
+        WebDriverWait(driver, timeout).until(EC.invisibility_of_element(element))
+    except TimeoutException:
+        pass
+
+# The Libris newsletter popup opens up to this long after the cookie bar is closed
+NEWSLETTER_DELAY = 10
+
+def dismiss_libris_popups(driver, timeout=15):
+    newsletter_timeout = timeout
+    # Handle cookie popup
+    try:
+        print("Handling cookie popup...")
+        refuse_button = WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.XPATH, "//a[text()='Refuz toate']"))
+        )
+        if refuse_button.is_displayed():
+            refuse_button.click()
+            # The newsletter wait below returns as soon as the popup is there
+            newsletter_timeout = timeout + NEWSLETTER_DELAY
+    except:
+        print("No cookie popup found or already handled")
+
+    # Handle newsletter popup
+    try:
+        print("Handling newsletter popup...")
+        close_newsletter = WebDriverWait(driver, newsletter_timeout).until(
+            EC.element_to_be_clickable((By.CLASS_NAME, "modal-close-x-c-newsletter"))
+        )
+        if close_newsletter.is_displayed():
+            close_newsletter.click()
+            wait_closed(driver, close_newsletter)
+    except:
+        print("No newsletter popup found or already handled")
+
+def dismiss_bookline_popups(driver, timeout=20):
+    try:
+        print("Handling cookie popup...")
+        cookie_button = WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.ID, "onetrust-accept-btn-handler"))
+        )
+        cookie_button.click()
+        wait_closed(driver, cookie_button)
+    except Exception as e:
+        error_msg = str(e).split('\n')[0]
+        print(f"Could not handle cookie popup: {error_msg}")
+
+def dismiss_carturesti_popups(driver, timeout=20):
+    try:
+        print("Handling cookie popup...")
+        cookie_button = WebDriverWait(driver, timeout).until(
+            EC.element_to_be_clickable((By.CLASS_NAME, "cc-deny"))
+        )
+        cookie_button.click()
+        wait_closed(driver, cookie_button)
+    except Exception as e:
+        error_msg = str(e).split('\n')[0]
+        print(f"Could not handle cookie popup: {error_msg}")
+
+POPUP_HANDLERS = {
+    'libris': dismiss_libris_popups,
+    'bookline': dismiss_bookline_popups,
+    'carturesti': dismiss_carturesti_popups,
+}
+
+def open_store(driver, store, url=None, timeout=None, limiter=None):
+    """Open a store page with the saved consent; the popups are only clicked when there is none."""
+    restored = restore_consent(driver, store)
+    url = url or STORE_URLS[store] + "/"
+    if limiter:
+        limiter.wait(host_of(url))
+    driver.get(url)
+    if restored:
+        print("Consent restored, skipping the popups")
+        return
+    if timeout is None:
+        POPUP_HANDLERS[store](driver)
+    else:
+        POPUP_HANDLERS[store](driver, timeout)
+    save_consent(driver, store)
@@ -0,0 +1,882 @@
+import asyncio
+import argparse
+import itertools
+import time
+import json
+import os
+import csv
+from datetime import timedelta
+from urllib.parse import quote, quote_plus, urlsplit
+
+from fetch_engine import AsyncFetcher, OrderedWriter
+from rate_limiter import RateLimiter
+from retry import TRANSIENT, NOT_FOUND, classify
+from title_matching import best_match, slug_title
+from store_config import (STORE_URLS, SEARCH_PATHS, LIBRIS_LISTING_PATH, BOOKLINE_LISTING_PATH,
+                          LIBRIS_FIELDNAMES, BOOKLINE_FIELDNAMES, CARTURESTI_FIELDNAMES, LIBRIS_PRICE_FILTER,
+                          LIBRIS_PRICE_BANDS, LIBRIS_SHARD_PLAN, libris_year_filter)
+from extractors import (parse_libris_listing, parse_libris_search_results, parse_libris_book_page,
+                        parse_bookline_listing, parse_bookline_search_results, parse_bookline_book_page,
+                        parse_carturesti_search_results, parse_carturesti_book_page)
+from product_urls import (LIBRIS_URLS_FILE, LIBRIS_URL_FIELDNAMES, existing_fieldnames, load_url_index,
+                          rebase_url)
+from work_queue import WorkQueue
+from metrics import ScraperMetrics, serve_metrics
+from scrape_log import get_logger, flush_logs
+from html_archive import HtmlArchive
+from listing_index import UNCHANGED_PAGES, ListingIndex, count_lines, queue_new_titles
+from driver_pool import shard_path
+
+LIBRIS_FIRST_YEAR = 2002
+LIBRIS_LAST_YEAR = 2025
+BOOKLINE_LAST_PAGE = 10000
+# A crawled Libris year (or Bookline page) stays leased until the ones leased
+# before it are written, which can take longer than the default lease
+LISTING_LEASE_SECONDS = 24 * 3600
+
+log = get_logger('crawl_all')
+
+def load_progress(path, default):
+    # Only read when a queue is seeded, to carry over a progress JSON file
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+            if 'total_runtime' not in data:
+                data['total_runtime'] = 0
+            return data
+    return dict(default, total_runtime=0)
+
+def open_queue(name, progress_path, default, read_items, done_key, **options):
+    """Open a scraper's work queue, seeding it from read_items() on the first run."""
+    queue = WorkQueue(name, **options)
+    if not queue.is_seeded():
+        progress = load_progress(progress_path, default)
+        queue.seed(read_items(progress), progress[done_key], progress['total_runtime'])
+    # Nothing else runs this queue while the crawl does, so old leases are stale
+    queue.release_leases()
+    return queue
+
+def open_index(store, titles_path, read_titles):
+    """Listing fingerprints, with the store's titles file as the known titles on the first run."""
+    index = ListingIndex(store)
+    if not index.has_titles() and os.path.exists(titles_path):
+        with open(titles_path, 'r', encoding='utf-8') as f:
+            index.add_titles(read_titles(f))
+    return index
+
+def format_runtime(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+def open_csv_writer(path, fieldnames):
+    csvfile = open(path, 'a', newline='', encoding='utf-8')
+    writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+    if os.path.getsize(path) == 0:
+        writer.writeheader()
+    return csvfile, writer
+
+def first_error_line(error):
+    return (str(error) or type(error).__name__).split('\n')[0]
+
+
+async def crawl_libris_listing(fetcher, base_url, workers, archive, incremental=False, stream=None):
+    """Async version of libris.py: years are crawled in parallel, pages of a year in order.
+
+    A year's rows are written once it is finished and every year leased
+    before it is written, so the titles files come out in libris.py's order.
+    incremental only saves titles no earlier crawl has seen, queues them for
+    the details crawl and leaves a year after UNCHANGED_PAGES unchanged pages.
+    With a stream the new titles are queued too, and handed to the detail
+    crawl running alongside as soon as their page is parsed.
+    """
+    def read_years(progress):
+        return ((year, str(year), {'page': progress['page'] if year == progress['year'] else 1})
+                for year in range(LIBRIS_FIRST_YEAR, LIBRIS_LAST_YEAR + 1))
+
+    queue = open_queue('libris_listing', 'Scrape/Libris/scraping_progress.json',
+                       {'year': LIBRIS_FIRST_YEAR, 'page': 1}, read_years, 'year',
+                       lease_seconds=LISTING_LEASE_SECONDS)
+    index = open_index('libris', 'Data/Libris/libris_titles.txt',
+                       lambda f: (line.strip().split(',', 2)[-1] for line in f))
+    if incremental:
+        queue.reset({'page': 1})
+    titles_file = open('Data/Libris/libris_titles.txt', 'a', encoding='utf-8')
+    urls_file, urls_writer = open_csv_writer(LIBRIS_URLS_FILE, LIBRIS_URL_FIELDNAMES)
+
+    def queue_libris_titles(rows):
+        # New titles go to the details input file and queue
+        if not rows:
+            return
+        unique_path = 'Data/Libris/libris_titles_unique.txt'
+        first_line = count_lines(unique_path)
+        lines = [f"{row['year']},{row['page']},{row['title']}\n" for row in rows]
+        with open(unique_path, 'a', encoding='utf-8') as f:
+            f.writelines(lines)
+        queue_new_titles('libris_details', first_line, lines, lambda line: line.strip().split(',', 2)[-1])
+        if stream:
+            stream.push({row['title']: row for row in rows})
+
+    def write_year(finished):
+        year, rows, page, error = finished
+        if incremental and not stream:
+            queue_libris_titles(rows)
+        titles_file.writelines(f"{row['year']},{row['page']},{row['title']}\n" for row in rows)
+        titles_file.flush()
+        urls_writer.writerows(rows)
+        urls_file.flush()
+        if error is None:
+            queue.complete(year)
+        else:
+            # The year is retried from this page after the other years
+            queue.checkpoint(year, {'page': page})
+            queue.fail(year, error)
+
+    # Years are written in the order they were leased
+    order = itertools.count()
+    writer = OrderedWriter(write_year)
+
+    async def crawl_year(item):
+        slot = next(order)
+        year, page = item['position'], item['payload']['page']
+        year_rows = []
+        error = None
+        unchanged_pages = 0
+        while True:
+            url = base_url + LIBRIS_LISTING_PATH.format(filter_value=libris_year_filter(year), page=page)
+            try:
+                page_html = await fetcher.fetch(url)
+                archive.put('libris_listing', url, page_html, {'year': year, 'page': page})
+                products, item_count = parse_libris_listing(page_html)
+            except Exception as e:
+                print(f"[libris] Error on year {year}, page {page}: {first_error_line(e)}")
+                error = first_error_line(e)
+                break
+            if products is None:
+                break
+            rows = [dict(product, year=year, page=page) for product in products]
+            _, new_titles = index.check(f"{year}/{page}", [row['title'] for row in rows])
+            new_rows = [row for row in rows if row['title'] in new_titles]
+            if stream:
+                # Streamed titles go to the detail crawl at once
+                queue_libris_titles(new_rows)
+            if incremental:
+                # A new title near the top shifts every later page, so only new titles count as a change
+                unchanged_pages = 0 if new_titles else unchanged_pages + 1
+                rows = new_rows
+            year_rows.extend(rows)
+            print(f"[libris] Year {year}, page {page}: {len(products)} titles, {len(new_titles)} new")
+            if item_count < 40:
+                break
+            if incremental and unchanged_pages >= UNCHANGED_PAGES:
+                print(f"[libris] Year {year}: {unchanged_pages} unchanged pages in a row, skipping the rest")
+                break
+            page += 1
+        writer.put(slot, (year, year_rows, page, error))
+
+    start_time = time.time()
+    try:
+        await drain_queue(queue, crawl_year, workers)
+    finally:
+        queue.release_leases()
+        queue.add_runtime(time.time() - start_time)
+        queue.close()
+        index.close()
+        titles_file.close()
+        urls_file.close()
+
+
+def libris_listing_url(base_url, year, band, page):
+    url = base_url + LIBRIS_LISTING_PATH.format(filter_value=libris_year_filter(year), page=page)
+    if band:
+        url += LIBRIS_PRICE_FILTER.format(low=band[0], high=band[1])
+    return url
+
+def shard_label(shard):
+    band = shard['band']
+    return f"year {shard['year']}" + (f", {band[0]}-{band[1]} lei" if band else "")
+
+async def probe_last_page(fetcher, base_url, year, band):
+    """Number of listing pages of a year (and price band).
+
+    Doubles the page until it runs past the end, then bisects, so N pages
+    cost about 2*log2(N) requests instead of N.
+    """
+    async def state(page):
+        products, item_count = parse_libris_listing(await fetcher.fetch(libris_listing_url(base_url, year, band, page)))
+        if products is None:
+            return 'empty'
+        return 'full' if item_count >= 40 else 'last'
+
+    full, page = 0, 1
+    while True:
+        page_state = await state(page)
+        if page_state == 'last':
+            return page
+        if page_state == 'empty':
+            break
+        full, page = page, page * 2
+    empty = page
+    while empty - full > 1:
+        middle = (full + empty) // 2
+        page_state = await state(middle)
+        if page_state == 'last':
+            return middle
+        if page_state == 'full':
+            full = middle
+        else:
+            empty = middle
+    return full
+
+async def plan_libris_shards(fetcher, base_url, shard_pages, split_pages=None):
+    """Cut every year's listing into ranges of shard_pages pages.
+
+    Years with more than split_pages pages are planned per price band
+    instead. The last range of each year (or band) is left open-ended, so
+    pages added since the probe are still crawled. Returns None when the
+    store ignores the price filter.
+    """
+    async def plan_year(year):
+        pages = await probe_last_page(fetcher, base_url, year, None)
+        parts = [(None, pages)]
+        if split_pages and pages > split_pages:
+            counts = await asyncio.gather(*(probe_last_page(fetcher, base_url, year, band)
+                                            for band in LIBRIS_PRICE_BANDS))
+            # The bands split the year's titles, so at most each band's last page
+            # is partly full. More pages means every band returned the whole year.
+            if sum(counts) > pages + len(LIBRIS_PRICE_BANDS) - 1:
+                print(f"[libris] Year {year}: the price bands have {sum(counts)} pages against {pages} "
+                      f"unfiltered, the store ignores the price filter")
+                return None
+            parts = list(zip(LIBRIS_PRICE_BANDS, counts))
+            print(f"[libris] Year {year}: {pages} pages, split into price bands of {', '.join(map(str, counts))} pages")
+        shards = []
+        for band, band_pages in parts:
+            for first in range(1, band_pages + 1, shard_pages):
+                shards.append({'year': year, 'band': list(band) if band else None, 'first': first,
+                               'last': min(first + shard_pages - 1, band_pages),
+                               'open_end': first + shard_pages > band_pages})
+        return shards
+
+    years = await asyncio.gather(*(plan_year(year) for year in range(LIBRIS_FIRST_YEAR, LIBRIS_LAST_YEAR + 1)))
+    if None in years:
+        return None
+    shards = [shard for year_shards in years for shard in year_shards]
+    for index, shard in enumerate(shards):
+        shard.update(index=index, next_page=shard['first'], bytes=0, done=False)
+    return {'shard_pages': shard_pages, 'split_pages': split_pages, 'shards': shards}
+
+def save_shard_plan(plan):
+    with open(LIBRIS_SHARD_PLAN + '.tmp', 'w') as f:
+        json.dump(plan, f, indent=1)
+    os.replace(LIBRIS_SHARD_PLAN + '.tmp', LIBRIS_SHARD_PLAN)
+
+def merge_libris_shards(plan):
+    """Append the shard rows to the titles and URL files in plan order, i.e. by year, price band and page.
+
+    A band shard's page column counts pages within its price band; pages are
+    renumbered to run on across a year's bands, so a year's page numbers stay
+    unique and increasing (they follow the band order, not the unfiltered listing).
+    """
+    rows = 0
+    year, band, offset, band_pages = None, None, 0, 0
+    urls_file, urls_writer = open_csv_writer(LIBRIS_URLS_FILE, LIBRIS_URL_FIELDNAMES)
+    with open('Data/Libris/libris_titles.txt', 'a', encoding='utf-8') as titles_file, urls_file:
+        for shard in plan['shards']:
+            if shard['year'] != year:
+                offset, band_pages = 0, 0
+            elif shard['band'] != band:
+                # The next band of the same year continues after this one's last page
+                offset, band_pages = offset + band_pages, 0
+            year, band = shard['year'], shard['band']
+            band_pages = max(band_pages, shard['last'])
+            path = shard_path(LIBRIS_URLS_FILE, shard['index'])
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                shard_rows = list(csv.DictReader(f, delimiter=';'))
+            for row in shard_rows:
+                # An open-ended shard may have run past the probed page count
+                band_pages = max(band_pages, int(row['page']))
+                row['page'] = int(row['page']) + offset
+            titles_file.writelines(f"{row['year']},{row['page']},{row['title']}\n" for row in shard_rows)
+            urls_writer.writerows(shard_rows)
+            rows += len(shard_rows)
+    os.remove(LIBRIS_SHARD_PLAN)
+    for shard in plan['shards']:
+        path = shard_path(LIBRIS_URLS_FILE, shard['index'])
+        if os.path.exists(path):
+            os.remove(path)
+    print(f"[libris] Merged {len(plan['shards'])} shards, {rows} titles")
+
+async def crawl_libris_listing_sharded(fetcher, base_url, workers, archive, shard_pages, split_pages=None):
+    """libris.py as a grid of (year, page range) shards crawled concurrently.
+
+    The grid is planned up front by probing each year's page count, and kept
+    in LIBRIS_SHARD_PLAN with every shard's next page, so an interrupted run
+    resumes each shard where it stopped. Shards write their own files; once
+    all are done they are merged into libris_titles.txt in the order
+    libris.py would have written them.
+    """
+    if os.path.exists(LIBRIS_SHARD_PLAN):
+        with open(LIBRIS_SHARD_PLAN, 'r') as f:
+            plan = json.load(f)
+        print(f"[libris] Resuming the sharded listing planned with {plan['shard_pages']} pages per shard")
+    else:
+        plan = await plan_libris_shards(fetcher, base_url, shard_pages, split_pages)
+        if plan is None:
+            print("[libris] Not sharding the listing, run again without --split-pages")
+            return
+        save_shard_plan(plan)
+    pending = [shard for shard in plan['shards'] if not shard['done']]
+    print(f"[libris] {len(plan['shards'])} shards, {len(pending)} to crawl")
+    index = open_index('libris', 'Data/Libris/libris_titles.txt',
+                       lambda f: (line.strip().split(',', 2)[-1] for line in f))
+    slots = asyncio.Semaphore(workers)
+
+    async def crawl_shard(shard):
+        year, band = shard['year'], shard['band']
+        path = shard_path(LIBRIS_URLS_FILE, shard['index'])
+        if os.path.exists(path):
+            # Drop rows written after the last saved page
+            with open(path, 'r+b') as f:
+                f.truncate(shard['bytes'])
+        csvfile, writer = open_csv_writer(path, LIBRIS_URL_FIELDNAMES)
+        try:
+            page = shard['next_page']
+            while page <= shard['last'] or shard['open_end']:
+                url = libris_listing_url(base_url, year, band, page)
+                try:
+                    page_html = await fetcher.fetch(url)
+                    archive.put('libris_listing', url, page_html, {'year': year, 'page': page})
+                    products, item_count = parse_libris_listing(page_html)
+                except Exception as e:
+                    print(f"[libris] Error on {shard_label(shard)}, page {page}: {first_error_line(e)}; "
+                          f"the shard resumes there on the next run")
+                    return
+                if products is None:
+                    break
+                rows = [dict(product, year=year, page=page) for product in products]
+                page_key = f"{year}/{page}" if band is None else f"{year}/{band[0]}-{band[1]}/{page}"
+                _, new_titles = index.check(page_key, [row['title'] for row in rows])
+                writer.writerows(rows)
+                csvfile.flush()
+                shard.update(next_page=page + 1, bytes=os.path.getsize(path))
+                save_shard_plan(plan)
+                print(f"[libris] {shard_label(shard).capitalize()}, page {page}: "
+                      f"{len(products)} titles, {len(new_titles)} new")
+                if item_count < 40:
+                    break
+                page += 1
+            shard['done'] = True
+            save_shard_plan(plan)
+        finally:
+            csvfile.close()
+
+    async def run_shard(shard):
+        async with slots:
+            await crawl_shard(shard)
+
+    try:
+        await asyncio.gather(*(run_shard(shard) for shard in pending))
+    finally:
+        index.close()
+    unfinished = sum(1 for shard in plan['shards'] if not shard['done'])
+    if unfinished:
+        print(f"[libris] {unfinished} shards are not finished; run again to complete and merge them")
+        return
+    merge_libris_shards(plan)
+
+
+async def crawl_bookline_listing(fetcher, base_url, workers, archive, incremental=False, stream=None):
+    """Async version of bookline_books.py: pages are fetched in parallel.
+
+    A page's rows are written once every page leased before it is written,
+    so bookline_titles.csv comes out in bookline_books.py's page order.
+    incremental only saves titles no earlier crawl has seen, queues them for
+    bookline_scrape_details.py and stops after UNCHANGED_PAGES unchanged pages.
+    With a stream the new titles also go to Bookline_booktitles.csv, the
+    details crawl's input, and straight to the detail crawl running alongside.
+    """
+    def read_pages(progress):
+        return ((page, str(page), None) for page in range(1, BOOKLINE_LAST_PAGE + 1))
+
+    queue = open_queue('bookline_listing', 'Scrape/Bookline/scraping_progress.json',
+                       {'current_page': 1}, read_pages, 'current_page',
+                       lease_seconds=LISTING_LEASE_SECONDS)
+    titles_path = 'Data/Bookline/bookline_titles.csv'
+    index = open_index('bookline', titles_path,
+                       lambda f: (row['title'] for row in csv.DictReader(f, delimiter=';')))
+    if incremental:
+        queue.reset()
+    fieldnames = existing_fieldnames(titles_path, ['page', 'title', 'url', 'product_id'])
+    csvfile, csv_writer = open_csv_writer(titles_path, fieldnames)
+    if stream:
+        details_path = 'Data/Bookline/Bookline_booktitles.csv'
+        details_fieldnames = existing_fieldnames(details_path, ['page', 'rank', 'title', 'publisher', 'url', 'product_id'])
+        details_file, details_writer = open_csv_writer(details_path, details_fieldnames)
+        details_file.flush()
+    unchanged = set()
+
+    def stream_bookline_titles(rows):
+        # Ranks continue the file's line numbers, as bookline_sorted.py counts them
+        if not rows:
+            return
+        first_line = count_lines(details_path, header=True)
+        rows = [dict(row, rank=first_line + offset + 1, publisher="") for offset, row in enumerate(rows)]
+        details_writer.writerows(rows)
+        details_file.flush()
+        queue_new_titles('bookline_details2', first_line,
+                         [';'.join(str(row.get(field, '')) for field in details_fieldnames) + '\n' for row in rows],
+                         lambda line: line.split(';')[2])
+        stream.push({row['title']: row for row in rows})
+
+    def write_page(finished):
+        if finished is None:
+            return  # A failed page or one past the end, nothing to write
+        page, rows = finished
+        if incremental:
+            first_line = count_lines(titles_path, header=True)
+        csv_writer.writerows(rows)
+        csvfile.flush()
+        if incremental:
+            queue_new_titles('bookline_details', first_line,
+                             [';'.join(str(row.get(field, '')) for field in fieldnames) + '\n' for row in rows],
+                             lambda line: line.split(';')[1])
+        queue.complete(page)
+
+    # Pages are written in the order they were leased
+    order = itertools.count()
+    writer = OrderedWriter(write_page)
+
+    async def crawl_page(item):
+        slot = next(order)
+        page = item['position']
+        url = base_url + BOOKLINE_LISTING_PATH.format(page=page)
+        try:
+            page_html = await fetcher.fetch(url)
+            archive.put('bookline_listing', url, page_html, {'page': page})
+            page_titles = parse_bookline_listing(page_html)
+        except Exception as e:
+            print(f"[bookline] Error on page {page}: {first_error_line(e)}")
+            queue.fail(page, first_error_line(e))
+            writer.put(slot, None)
+            return
+        if not page_titles:
+            # Left pending (with the pages after it) so a later run checks again
+            print(f"[bookline] No more products after page {page - 1}")
+            writer.put(slot, None)
+            return False
+        _, new_titles = index.check(page, [product['title'] for product in page_titles])
+        print(f"[bookline] Page {page}: {len(page_titles)} titles, {len(new_titles)} new")
+        if stream:
+            stream_bookline_titles([dict(product, page=page) for product in page_titles
+                                    if product['title'] in new_titles])
+        if incremental:
+            page_titles = [product for product in page_titles if product['title'] in new_titles]
+        writer.put(slot, (page, [dict(product, page=page) for product in page_titles]))
+        if incremental and not new_titles:
+            # Pages finish out of order, so look for a run of page numbers without new titles
+            unchanged.add(page)
+            if all(p in unchanged for p in range(page - UNCHANGED_PAGES + 1, page + 1)):
+                print(f"[bookline] Pages {page - UNCHANGED_PAGES + 1}-{page} unchanged, the rest is already known")
+                # reset() made every page pending again; the next full run must not crawl them twice
+                queue.complete_range(page + 1)
+                return False
+
+    start_time = time.time()
+    try:
+        await drain_queue(queue, crawl_page, workers)
+    finally:
+        queue.release_leases()
+        queue.add_runtime(time.time() - start_time)
+        queue.close()
+        index.close()
+        csvfile.close()
+        if stream:
+            details_file.close()
+
+
+class TitleStream:
+    """New titles handed from a listing crawl to the detail crawl running beside it.
+
+    The listing crawl queues the titles, then push()es them; detail workers
+    that found the queue empty wait() for the next push and stop once the
+    listing crawl is over and close() was called.
+    """
+
+    def __init__(self):
+        self.closed = False
+        self.rows = {}
+        self.found_at = {}
+        self.latencies = []
+        self._added = asyncio.Event()
+
+    def push(self, rows):
+        now = time.time()
+        self.rows.update(rows)
+        for title in rows:
+            self.found_at.setdefault(title, now)
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        # A fresh event per push, so a worker never misses one between lease() and wait()
+        added, self._added = self._added, asyncio.Event()
+        added.set()
+
+    async def wait(self):
+        # Closed while the worker was busy: it looks at the queue once more and stops
+        if not self.closed:
+            await self._added.wait()
+
+    def done(self, title):
+        """Seconds from the title's listing page to its details on disk, or None if it was not streamed."""
+        self.rows.pop(title, None)
+        found_at = self.found_at.pop(title, None)
+        if found_at is None:
+            return None
+        latency = time.time() - found_at
+        self.latencies.append(latency)
+        return latency
+
+
+async def drain_queue(queue, handler, workers, stream=None):
+    """Run handler(item) over the queue's items with a fixed number of workers.
+
+    Returning False from handler stops every worker after its current item.
+    With a stream, workers that run out of items wait for the listing crawl
+    to add more instead of stopping, until the stream is closed.
+    """
+    stopped = False
+
+    async def worker():
+        nonlocal stopped
+        while True:
+            # Checked before the last look at the queue, so nothing pushed before close() is left
+            finished = stream is None or stream.closed
+            for item in queue.items():
+                if stopped:
+                    return
+                if await handler(item) is False:
+                    stopped = True
+            if stopped or finished:
+                return
+            await stream.wait()
+
+    await asyncio.gather(*(worker() for _ in range(workers)))
+
+
+async def crawl_details(store, queue, scrape_row, output_path, fieldnames, workers, stream=None):
+    """Shared driver for the detail crawls.
+
+    scrape_row(row) returns the CSV row, or None when the book was not found.
+    Rows are written in the order their titles were leased, as the Selenium
+    scrapers write them, and a title is done in the queue once its row is on
+    disk. Until then its lease is renewed, so a slow title leased earlier
+    cannot get the finished ones behind it handed out again. With a stream it keeps waiting for titles until the listing crawl
+    is over.
+    """
+    csvfile, csv_writer = open_csv_writer(output_path, fieldnames)
+    # Only the write phase is timed here; fetches overlap across workers
+    metrics = ScraperMetrics(f"{store}_crawl")
+    metrics.set_remaining(queue.remaining())
+
+    def write_row(finished):
+        if finished is None:
+            return  # A failed title, already recorded
+        item, book_details, title_start = finished
+        i = item['position']
+        with metrics.phase('write'):
+            csv_writer.writerow(book_details)
+            csvfile.flush()
+            queue.complete(i)
+        held.discard(i)
+        metrics.title_done()
+        metrics.set_remaining(queue.remaining())
+        latency = stream.done(item['key']) if stream else None
+        log.info("title done", store=store, position=i+1, title=item['key'],
+                 seconds=f"{time.time() - title_start:.3f}",
+                 **({'latency': f"{latency:.1f}"} if latency is not None else {}))
+
+    order = itertools.count()
+    writer = OrderedWriter(write_row)
+    # Titles leased and not yet written
+    held = set()
+
+    async def renew_leases():
+        while True:
+            await asyncio.sleep(queue.lease_seconds / 3)
+            for i in list(held):
+                queue.renew(i)
+
+    async def handle(item):
+        slot = next(order)
+        i, row = item['position'], item['payload']
+        held.add(i)
+        title_start = time.time()
+        try:
+            book_details = await scrape_row(row)
+        except Exception as e:
+            # The fetcher already retried transient errors with backoff
+            kind = classify(e)
+            log.warning("title failed", store=store, position=i+1, title=item['key'], kind=kind,
+                        error=first_error_line(e))
+            queue.fail(i, first_error_line(e), retry=kind == TRANSIENT, kind=kind)
+            metrics.title_failed(kind)
+            metrics.set_remaining(queue.remaining())
+            held.discard(i)
+            writer.put(slot, None)
+            return
+        if book_details is None:
+            log.info("title failed", store=store, position=i+1, title=item['key'], kind=NOT_FOUND)
+            queue.fail(i, "No match found", retry=False, kind=NOT_FOUND)
+            metrics.title_failed(NOT_FOUND)
+            metrics.set_remaining(queue.remaining())
+            held.discard(i)
+            writer.put(slot, None)
+            return
+        writer.put(slot, (item, book_details, title_start))
+
+    start_time = time.time()
+    renewer = asyncio.create_task(renew_leases())
+    try:
+        await drain_queue(queue, handle, workers, stream)
+    finally:
+        renewer.cancel()
+        queue.release_leases()
+        queue.add_runtime(time.time() - start_time)
+        queue.close()
+        csvfile.close()
+        metrics.close()
+
+
+def read_lines(path, key_of, skip_header=False):
+    # (position, key, line) items of a title file, as the detail scripts seed them
+    def read(progress):
+        if not os.path.exists(path):
+            return []  # A pipeline crawl writes it as titles are found
+        with open(path, 'r', encoding='utf-8') as f:
+            if skip_header:
+                next(f)
+            return [(i, key_of(line), line) for i, line in enumerate(f)]
+    return read
+
+
+async def crawl_libris_details(fetcher, base_url, workers, archive, stream=None):
+    url_index = load_url_index(LIBRIS_URLS_FILE)
+    queue = open_queue('libris_details', 'Scrape/Libris/details_progress.json', {'last_processed_line': 0},
+                       read_lines('Data/Libris/libris_titles_unique.txt', lambda line: line.strip().split(',', 2)[-1]),
+                       'last_processed_line')
+
+    async def scrape_row(line):
+        year, page, title = line.strip().split(',', 2)
+        # Titles streamed from the listing crawl are not in the links file read at the start
+        listed = url_index.get(title) or (stream.rows.get(title) if stream else None)
+        if listed:
+            # Product link saved by the listing crawl, no search needed
+            product_url, price = listed['url'], listed['price'] or "null"
+        else:
+            search_url = base_url + SEARCH_PATHS['libris'].format(query=quote_plus(title))
+            results = parse_libris_search_results(await fetcher.fetch(search_url))
+            match, _ = best_match([r for r in results if r['href']], title)
+            if not match:
+                return None
+            product_url, price = match['href'], match['price']
+
+        book_details = {field: "null" for field in LIBRIS_FIELDNAMES}
+        book_details.update({'year': year, 'page': page, 'title': title, 'price': price})
+        product_url = rebase_url(base_url, product_url)
+        product_html = await fetcher.fetch(product_url)
+        archive.put('libris_details', product_url, product_html,
+                    {'year': year, 'page': page, 'title': title, 'price': price})
+        book_details.update(parse_libris_book_page(product_html))
+        return book_details
+
+    await crawl_details('libris', queue, scrape_row, 'Data/Libris/book_details.csv', LIBRIS_FIELDNAMES, workers,
+                        stream)
+
+
+async def crawl_bookline_details(fetcher, base_url, workers, archive, stream=None):
+    queue = open_queue('bookline_details2', 'Scrape/Bookline/details2_progress.json', {'last_processed_line': 0},
+                       read_lines('Data/Bookline/Bookline_booktitles.csv',
+                                  lambda line: line.split(';')[2] if line.count(';') > 1 else line.strip(),
+                                  skip_header=True),
+                       'last_processed_line')
+
+    async def scrape_row(line):
+        parts = line.strip().split(';')
+        row = {'page': parts[0], 'rank': parts[1], 'title': parts[2],
+               'publisher': parts[3] if len(parts) > 3 else "",
+               'url': parts[4] if len(parts) > 4 else ""}
+        if row['url']:
+            product_url = row['url']
+        else:
+            search_url = base_url + SEARCH_PATHS['bookline'].format(query=quote_plus(row['title']))
+            results = parse_bookline_search_results(await fetcher.fetch(search_url))
+            # Closest title (and publisher, when known) among the results
+            match, _ = best_match([r for r in results if r['href']], row['title'], publisher=row['publisher'])
+            if not match:
+                return None
+            product_url = match['href']
+
+        book_details = {
+            'page': row['page'], 'rank': row['rank'], 'title': row['title'], 'author': "null",
+            'publisher': "null", 'price': "null", 'score': "null", 'reviews': "null",
+            'language': "null", 'pages': "N/A", 'edition': "N/A", 'code': "N/A", 'category': "N/A"
+        }
+        product_url = rebase_url(base_url, product_url)
+        product_html = await fetcher.fetch(product_url)
+        archive.put('bookline_details2', product_url, product_html,
+                    {'page': row['page'], 'rank': row['rank'], 'title': row['title']})
+        book_details.update(parse_bookline_book_page(product_html))
+        return book_details
+
+    await crawl_details('bookline', queue, scrape_row, 'Data/Bookline/Book_bookdetails2.csv',
+                        BOOKLINE_FIELDNAMES, workers, stream)
+
+
+async def crawl_carturesti_details(fetcher, base_url, workers, archive):
+    def read_rows(progress):
+        with open('Data/Carturesti/book_details_carturesti.csv', 'r', encoding='utf-8') as f:
+            csv_reader = csv.reader(f, delimiter=',', quotechar='"')
+            next(csv_reader)  # Skip header
+            return [(i, f"{row[0]} - {row[2]}" if len(row) == 3 else f"CSV parsing error - {','.join(row)}", row)
+                    for i, row in enumerate(csv_reader)]
+
+    queue = open_queue('carturesti_details', 'Scrape/Carturesti/details_progress.json', {'last_processed_line': 0},
+                       read_rows, 'last_processed_line')
+
+    async def scrape_row(row):
+        if len(row) != 3:
+            return None
+        csv_title, csv_price, csv_author = row
+        query = f"{csv_title.replace('%', '')} {csv_author.replace('%', '')}"
+        search_url = base_url + SEARCH_PATHS['carturesti'].format(query=quote(query, safe=''))
+        hrefs = parse_carturesti_search_results(await fetcher.fetch(search_url))
+        # Result titles are matched by their product URL slug
+        match, _ = best_match([{'title': slug_title(href), 'href': href} for href in hrefs], csv_title, csv_author)
+        if not match:
+            return None
+
+        book_details = {field: "N/A" for field in CARTURESTI_FIELDNAMES}
+        product_url = rebase_url(base_url, match['href'])
+        product_html = await fetcher.fetch(product_url)
+        archive.put('carturesti_details', product_url, product_html,
+                    {'csv_title': csv_title, 'csv_author': csv_author})
+        book_details.update(parse_carturesti_book_page(product_html))
+        return book_details
+
+    await crawl_details('carturesti', queue, scrape_row, 'Data/Carturesti/book_details.csv',
+                        CARTURESTI_FIELDNAMES, workers)
+
+
+JOBS = {
+    ('listing', 'libris'): crawl_libris_listing,
+    ('listing', 'bookline'): crawl_bookline_listing,
+    ('details', 'libris'): crawl_libris_details,
+    ('details', 'bookline'): crawl_bookline_details,
+    ('details', 'carturesti'): crawl_carturesti_details,
+}
+
+async def stream_store(store, fetcher, base_url, workers, archive, incremental=False):
+    """Listing and details crawl of a store at the same time.
+
+    New titles reach the detail workers as soon as their listing page is
+    parsed, instead of after the listing, remove_duplicates.py and a
+    separate details run.
+    """
+    stream = TitleStream()
+    details = asyncio.create_task(JOBS[('details', store)](fetcher, base_url, workers, archive, stream=stream))
+    # Let the detail crawl open (and seed) its queue before the first titles are queued
+    await asyncio.sleep(0)
+    try:
+        await JOBS[('listing', store)](fetcher, base_url, workers, archive, incremental=incremental, stream=stream)
+    finally:
+        stream.close()
+        await details
+        if stream.latencies:
+            latencies = sorted(stream.latencies)
+            print(f"[{store}] {len(latencies)} streamed titles, listing to details on disk: "
+                  f"median {format_runtime(latencies[len(latencies) // 2])}, max {format_runtime(latencies[-1])}")
+
+
+async def crawl(stage, stores, base_urls, host_limits, workers=None, incremental=False, max_rates=None,
+                shard_pages=None, split_pages=None):
+    start_time = time.time()
+    archive = HtmlArchive()
+    limiter = RateLimiter({host: {'max': rate} for host, rate in (max_rates or {}).items()})
+    if stage in ('details', 'pipeline'):
+        metrics_port = serve_metrics()
+        log.info("metrics", url=f"http://127.0.0.1:{metrics_port}/metrics" if metrics_port else "off")
+    async with AsyncFetcher(host_limits=host_limits, limiter=limiter) as fetcher:
+        jobs = []
+        for store in stores:
+            needed = [('listing', store), ('details', store)] if stage == 'pipeline' else [(stage, store)]
+            if any(job not in JOBS for job in needed):
+                print(f"No {stage} crawl for {store}, skipping")
+                continue
+            base_url = base_urls[store]
+            # One worker per allowed connection keeps the host limit saturated
+            store_workers = workers or fetcher.limit_for(urlsplit(base_url).netloc)
+            if stage == 'pipeline':
+                jobs.append(stream_store(store, fetcher, base_url, store_workers, archive, incremental))
+                continue
+            if stage == 'listing' and store == 'libris' and shard_pages:
+                jobs.append(crawl_libris_listing_sharded(fetcher, base_url, store_workers, archive,
+                                                         shard_pages, split_pages))
+                continue
+            options = {'incremental': incremental} if stage == 'listing' else {}
+            jobs.append(JOBS[(stage, store)](fetcher, base_url, store_workers, archive, **options))
+
+        try:
+            await asyncio.gather(*jobs)
+        finally:
+            archive.close()
+            flush_logs()
+            print(f"\nSession runtime: {format_runtime(time.time() - start_time)}")
+            for host, stats in fetcher.stats.items():
+                print(f"{host}: {stats['requests']} requests, {stats['errors']} errors, "
+                      f"{stats['bytes'] / 1e6:.1f} MB")
+            limiter.close()
+
+def parse_key_values(pairs, value_type=str):
+    values = {}
+    for pair in pairs or []:
+        key, value = pair.split('=', 1)
+        values[key] = value_type(value)
+    return values
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl the bookstores concurrently over HTTP.")
+    parser.add_argument('stage', choices=['listing', 'details', 'pipeline'],
+                        help="pipeline runs listing and details together, details starting as titles are found")
+    parser.add_argument('--stores', nargs='+', default=list(STORE_URLS),
+                        choices=list(STORE_URLS))
+    parser.add_argument('--host-limit', action='append', metavar='HOST=N',
+                        help="Maximum simultaneous requests for a host, e.g. bookline.ro=2")
+    parser.add_argument('--max-rate', action='append', metavar='HOST=N',
+                        help="Maximum requests per second for a host, e.g. bookline.ro=5")
+    parser.add_argument('--base-url', action='append', metavar='STORE=URL',
+                        help="Override a store root, e.g. libris=http://127.0.0.1:8000")
+    parser.add_argument('--workers', type=int,
+                        help="Workers per store (defaults to the store's host limit)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Listing refresh: save and queue only new titles, stop at unchanged pages")
+    parser.add_argument('--shard-pages', type=int,
+                        help="Libris listing: plan the years as shards of this many pages and crawl them concurrently")
+    parser.add_argument('--split-pages', type=int,
+                        help="With --shard-pages: split years with more pages than this by price band")
+    args = parser.parse_args()
+    if args.shard_pages and (args.stage != 'listing' or args.incremental):
+        parser.error("--shard-pages is for a full listing crawl (not --incremental or pipeline)")
+
+    base_urls = dict(STORE_URLS)
+    base_urls.update({store: url.rstrip('/') for store, url in parse_key_values(args.base_url).items()})
+    try:
+        asyncio.run(crawl(args.stage, args.stores, base_urls,
+                          parse_key_values(args.host_limit, int), args.workers, args.incremental,
+                          parse_key_values(args.max_rate, float), args.shard_pages, args.split_pages))
+    except KeyboardInterrupt:
+        print("\nScript interrupted by user!")
@@ -0,0 +1,285 @@
+import argparse
+import importlib
+import multiprocessing
+import json
+import os
+import csv
+import sys
+
+from listing_index import count_lines
+
+SCRAPE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Extra column of detail shard files: the row's work queue position
+SHARD_POSITION = 'queue_position'
+
+# Detail scrapers that can run as a pool of browsers
+STORES = {
+    'libris': {
+        'dir': os.path.join(SCRAPE_DIR, 'Libris'),
+        'module': 'scrape_details',
+        'input': 'Data/Libris/libris_titles_unique.txt',
+        'has_header': False,
+        'plan': 'Scrape/Libris/pool_plan.json',
+    },
+    'bookline': {
+        'dir': os.path.join(SCRAPE_DIR, 'Bookline'),
+        'module': 'bl_scr_det2',
+        'input': 'Data/Bookline/Bookline_booktitles.csv',
+        'has_header': True,
+        'plan': 'Scrape/Bookline/pool_plan.json',
+    },
+    'carturesti': {
+        'dir': os.path.join(SCRAPE_DIR, 'Carturesti'),
+        'module': 'carturesti_scrape_details',
+        'input': 'Data/Carturesti/book_details_carturesti.csv',
+        'has_header': True,
+        'csv_rows': True,  # The scraper reads this file with csv.reader
+        'plan': 'Scrape/Carturesti/pool_plan.json',
+    },
+}
+
+# Listing scrapers that can run as a pool of browsers, each crawling a range of pages
+LISTINGS = {
+    'bookline_books': {
+        'dir': os.path.join(SCRAPE_DIR, 'Bookline'),
+        'module': 'bookline_books',
+        'plan': 'Scrape/Bookline/pool_plan_books.json',
+    },
+    'bookline_sorted': {
+        'dir': os.path.join(SCRAPE_DIR, 'Bookline'),
+        'module': 'bookline_sorted',
+        'product_type': 'books',
+        'plan': 'Scrape/Bookline/pool_plan_sorted.json',
+    },
+    'bookline_antiq': {
+        'dir': os.path.join(SCRAPE_DIR, 'Bookline'),
+        'module': 'bookline_sorted',
+        'product_type': 'antiquarian',
+        'plan': 'Scrape/Bookline/pool_plan_antiq.json',
+    },
+}
+STORES.update({name: dict(config, listing=True) for name, config in LISTINGS.items()})
+
+def load_store_module(store):
+    config = STORES[store]
+    if config['dir'] not in sys.path:
+        sys.path.insert(0, config['dir'])
+    return importlib.import_module(config['module'])
+
+def count_titles(store):
+    config = STORES[store]
+    if config.get('listing'):
+        # Queue positions are page numbers, 1 to LAST_PAGE
+        return load_store_module(store).LAST_PAGE + 1
+    with open(config['input'], 'r', encoding='utf-8') as f:
+        if config.get('csv_rows'):
+            count = sum(1 for _ in csv.reader(f, delimiter=',', quotechar='"'))
+        else:
+            count = sum(1 for _ in f)
+    return count - 1 if config['has_header'] else count
+
+def shard_path(path, index):
+    root, ext = os.path.splitext(path)
+    return f"{root}_shard{index}{ext}"
+
+def split_range(start, end, workers):
+    """Split [start, end) into `workers` contiguous ranges of near-equal size.
+
+    Each shard covers one stretch of the input. Retries still write a shard's
+    rows out of order, so merge_rows() sorts them back: detail rows by queue
+    position (SHARD_POSITION), listing rows by page, renumbering their ranks.
+    """
+    size, remainder = divmod(end - start, workers)
+    ranges = []
+    for index in range(workers):
+        shard_end = start + size + (1 if index < remainder else 0)
+        ranges.append((start, shard_end))
+        start = shard_end
+    return ranges
+
+def load_plan(store):
+    path = STORES[store]['plan']
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return None
+
+def listing_options(store):
+    # bookline_sorted.py crawls one listing per product type
+    config = STORES[store]
+    return {'product_type': config['product_type']} if 'product_type' in config else {}
+
+def open_store_queue(store, module):
+    return module.open_queue(**listing_options(store))
+
+def output_file(store, module):
+    config = STORES[store]
+    if not config.get('listing'):
+        return module.DETAILS_FILE
+    if 'product_type' in config:
+        return module.PRODUCT_TYPES[config['product_type']]['titles_file']
+    return module.TITLES_FILE
+
+def create_plan(store, workers, last_page=None):
+    module = load_store_module(store)
+    queue = open_store_queue(store, module)
+    # Continue where the single-browser run stopped
+    first_line = queue.next_position()
+    queue.close()
+    total = count_titles(store)
+    if last_page:
+        # Listings are shorter than LAST_PAGE; without a bound the last shards find nothing
+        total = min(total, last_page + 1)
+    if first_line is None:
+        first_line = total
+
+    shards = []
+    for index, (start, end) in enumerate(split_range(first_line, total, workers)):
+        shards.append({
+            'index': index,
+            'start_line': start,
+            'end_line': end,
+            'details_file': shard_path(output_file(store, module), index),
+        })
+
+    plan = {'store': store, 'workers': workers, 'shards': shards}
+    with open(STORES[store]['plan'], 'w') as f:
+        json.dump(plan, f, indent=2)
+    return plan
+
+def shard_remaining(store, module, shard):
+    # Titles of the shard that are neither done nor failed in the work queue
+    queue = open_store_queue(store, module)
+    remaining = queue.remaining(shard['start_line'], shard['end_line'])
+    queue.close()
+    return remaining
+
+def run_shard(store, shard, headless):
+    module = load_store_module(store)
+    if STORES[store].get('listing'):
+        module.scrape_bookline(
+            titles_file=shard['details_file'],
+            **listing_options(store),
+            start_page=shard['start_line'],
+            end_page=shard['end_line'],
+            headless=headless
+        )
+        return
+    module.scrape_book_details(
+        details_file=shard['details_file'],
+        start_line=shard['start_line'],
+        end_line=shard['end_line'],
+        headless=headless
+    )
+
+def run_pool(store, workers, headless=True, last_page=None):
+    plan = load_plan(store)
+    if plan is None:
+        plan = create_plan(store, workers, last_page)
+    elif plan['workers'] != workers:
+        print(f"Resuming the existing {plan['workers']}-browser plan for {store} "
+              f"(merge it first to change the number of browsers)")
+
+    module = load_store_module(store)
+    processes = []
+    for shard in plan['shards']:
+        remaining = shard_remaining(store, module, shard)
+        if remaining == 0:
+            print(f"Shard {shard['index']} already finished")
+            continue
+        if STORES[store].get('listing'):
+            print(f"Shard {shard['index']}: pages {shard['start_line']}-{shard['end_line'] - 1}, {remaining} left")
+        else:
+            print(f"Shard {shard['index']}: lines {shard['start_line'] + 1}-{shard['end_line']}, {remaining} left")
+        process = multiprocessing.Process(target=run_shard, args=(store, shard, headless),
+                                          name=f"{store}-shard{shard['index']}")
+        process.start()
+        processes.append(process)
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\nWaiting for the browsers to save their progress...")
+        for process in processes:
+            process.join()
+
+    if all(shard_remaining(store, module, shard) == 0 for shard in plan['shards']):
+        merge_shards(store)
+    else:
+        print("Some shards are unfinished; run again to resume them")
+
+def merge_rows(store, module, plan):
+    """Write the shard rows onto the output file in input order.
+
+    The work queue retries a failed item after the rest of its range, so
+    shard files are not in order: detail rows are sorted by the queue
+    position their shard file records, listing rows by page (their ranks
+    are renumbered in that order).
+    """
+    target = output_file(store, module)
+    rows, fieldnames = [], None
+    for shard in plan['shards']:
+        if os.path.exists(shard['details_file']):
+            with open(shard['details_file'], 'r', encoding='utf-8', newline='') as f:
+                reader = csv.DictReader(f, delimiter=';')
+                rows.extend(reader)
+                fieldnames = fieldnames or [name for name in reader.fieldnames if name != SHARD_POSITION]
+    if not rows:
+        return 0
+    if STORES[store].get('listing'):
+        rows.sort(key=lambda row: int(row['page']))
+    else:
+        # Shard files written before positions were recorded keep their order
+        rows.sort(key=lambda row: int(row.get(SHARD_POSITION) or 0))
+
+    needs_header = not os.path.exists(target) or os.path.getsize(target) == 0
+    if not needs_header:
+        with open(target, 'r', encoding='utf-8', newline='') as f:
+            fieldnames = next(csv.reader(f, delimiter=';'))
+    if STORES[store].get('listing') and 'rank' in fieldnames:
+        # Ranks continue the file's line numbers, as the scrapers count them
+        for rank, row in enumerate(rows, count_lines(target, header=True) + 1):
+            row['rank'] = rank
+    with open(target, 'a', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=';', extrasaction='ignore')
+        if needs_header:
+            writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
+
+def merge_shards(store):
+    """Append the shard outputs, in input order, to the store's book details or titles file."""
+    plan = load_plan(store)
+    if plan is None:
+        print(f"No pool run to merge for {store}")
+        return
+
+    module = load_store_module(store)
+    unfinished = [shard['index'] for shard in plan['shards'] if shard_remaining(store, module, shard) > 0]
+    if unfinished:
+        print(f"Shards {unfinished} are not finished; run the pool again to complete them")
+        return
+
+    # Progress and failures are already in the work queue; only the rows need merging
+    rows = merge_rows(store, module, plan)
+    for shard in plan['shards']:
+        if os.path.exists(shard['details_file']):
+            os.remove(shard['details_file'])
+    os.remove(STORES[store]['plan'])
+    print(f"Merged {len(plan['shards'])} shards, {rows} rows, into {output_file(store, module)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a detail or listing scraper as a pool of browsers.")
+    parser.add_argument('store', choices=list(STORES))
+    parser.add_argument('--workers', type=int, default=4, help="Number of browsers")
+    parser.add_argument('--show', action='store_true', help="Show the browser windows")
+    parser.add_argument('--merge', action='store_true', help="Only merge the shard files")
+    parser.add_argument('--last-page', type=int,
+                        help="Listings: split pages up to this one instead of up to LAST_PAGE")
+    args = parser.parse_args()
+
+    if args.merge:
+        merge_shards(args.store)
+    else:
+        run_pool(args.store, args.workers, headless=not args.show, last_page=args.last_page)
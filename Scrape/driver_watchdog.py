@@ -0,0 +1,176 @@
+import threading
+import time
+
+try:
+    import psutil  # Optional: memory of the browser processes, and killing all of them
+except ImportError:
+    psutil = None
+
+from browser_factory import create_driver
+from consent import open_store
+from scrape_log import get_logger
+from store_config import BROWSER_MAX_PAGES, BROWSER_MAX_RSS_MB, BROWSER_MAX_LATENCY, BROWSER_STALL_SECONDS
+
+log = get_logger('driver_watchdog')
+
+# How often the monitor thread looks for a stalled title
+MONITOR_SECONDS = 5
+# quit() of a stuck browser can hang too; its processes are killed after this long
+QUIT_SECONDS = 15
+
+
+class WatchedDriver:
+    """An Edge driver that is replaced by a fresh one when it gets slow, big or stuck.
+
+    Stands in for the WebDriver: attribute access goes to the current browser,
+    so AdaptiveWait, the rate limiter and TabPrefetcher keep working across
+    restarts. The scraper calls check_health() before each title, which
+    restarts the browser between titles after max_pages titles, above
+    max_rss_mb or when a ping takes longer than max_latency seconds. A title
+    running longer than stall_seconds gets its browser killed by a monitor
+    thread, so the hung call fails; the error path then calls ensure_healthy()
+    and the title is retried on a new browser. A restart reopens the store
+    with the saved consent cookies, waiting for limiter (the scraper's
+    RateLimiter) first, then calls the on_restart callbacks.
+    """
+
+    def __init__(self, store, profile=None, headless=True, max_pages=BROWSER_MAX_PAGES,
+                 max_rss_mb=BROWSER_MAX_RSS_MB, max_latency=BROWSER_MAX_LATENCY, stall_seconds=BROWSER_STALL_SECONDS,
+                 limiter=None):
+        self.store = store
+        self.limiter = limiter
+        self.profile = profile
+        self.headless = headless
+        self.max_pages = max_pages
+        self.max_rss_mb = max_rss_mb
+        self.max_latency = max_latency
+        self.stall_seconds = stall_seconds
+        self.on_restart = []
+        self.pages = 0
+        self.restarts = 0
+        self.stalled = None
+        self.last_progress = time.monotonic()
+        self.browser = create_driver(profile=profile, headless=headless)
+        self._stop = threading.Event()
+        self._monitor = threading.Thread(target=self._watch, name='driver-watchdog', daemon=True)
+        self._monitor.start()
+
+    def __getattr__(self, name):
+        # Only called for names WatchedDriver itself does not have
+        if name == 'browser':
+            raise AttributeError(name)  # create_driver() failed in __init__
+        return getattr(self.browser, name)
+
+    def rss_mb(self):
+        """Memory of the driver and every browser process it started, or None without psutil."""
+        processes = self._processes()
+        if not processes:
+            return None
+        total = 0
+        for process in processes:
+            try:
+                total += process.memory_info().rss
+            except psutil.Error:
+                pass
+        return total / 1e6
+
+    def ping(self):
+        # Seconds a trivial command takes, or None if the browser does not answer
+        start = time.perf_counter()
+        try:
+            self.browser.execute_script("return document.readyState")
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    def check_health(self):
+        """Called before each title: restart the browser if it is due. Returns True if it was restarted."""
+        self.last_progress = time.monotonic()
+        self.pages += 1
+        reason = self.stalled
+        if reason is None:
+            latency = self.ping()
+            rss = self.rss_mb()
+            if latency is None:
+                reason = "browser not responding"
+            elif latency > self.max_latency:
+                reason = f"slow commands ({latency:.1f} s)"
+            elif rss is not None and rss > self.max_rss_mb:
+                reason = f"memory {rss:.0f} MB"
+            elif self.pages > self.max_pages:
+                reason = f"{self.max_pages} pages"
+        if reason is None:
+            return False
+        self.restart(reason)
+        self.pages = 1
+        return True
+
+    def ensure_healthy(self):
+        """Called on the error path: restart a stalled or dead browser. Returns True if it was restarted."""
+        if self.stalled is None and self.ping() is not None:
+            return False
+        self.restart(self.stalled or "browser not responding")
+        return True
+
+    def restart(self, reason):
+        self.restarts += 1
+        log.warning("restarting browser", store=self.store, reason=reason, pages=self.pages, restarts=self.restarts)
+        self._quit_browser()
+        self.browser = create_driver(profile=self.profile, headless=self.headless)
+        self.stalled = None
+        self.pages = 0
+        self.last_progress = time.monotonic()
+        open_store(self.browser, self.store, limiter=self.limiter)
+        for callback in self.on_restart:
+            callback()
+
+    def quit(self):
+        self._stop.set()
+        self._quit_browser()
+
+    def _watch(self):
+        while not self._stop.wait(MONITOR_SECONDS):
+            idle = time.monotonic() - self.last_progress
+            if self.stalled is None and idle > self.stall_seconds:
+                self.stalled = f"title stalled for {idle:.0f} s"
+                log.warning("browser stalled, killing it", store=self.store, seconds=f"{idle:.0f}")
+                self._kill()
+
+    def _processes(self):
+        service = getattr(self.browser, 'service', None)
+        process = getattr(service, 'process', None)
+        if psutil is None or process is None:
+            return []
+        try:
+            driver_process = psutil.Process(process.pid)
+            return [driver_process] + driver_process.children(recursive=True)
+        except psutil.Error:
+            return []
+
+    def _kill(self):
+        processes = self._processes()
+        if processes:
+            for process in processes:
+                try:
+                    process.kill()
+                except psutil.Error:
+                    pass
+            psutil.wait_procs(processes, timeout=5)
+            return
+        # Without psutil only the driver process can be killed; its browser exits with it or is orphaned
+        process = getattr(getattr(self.browser, 'service', None), 'process', None)
+        if process is not None:
+            process.kill()
+
+    def _quit_browser(self):
+        def quit_browser():
+            try:
+                self.browser.quit()
+            except Exception:
+                pass  # Already dead
+        quitter = threading.Thread(target=quit_browser, daemon=True)
+        quitter.start()
+        quitter.join(QUIT_SECONDS)
+        if quitter.is_alive():
+            log.warning("browser did not quit, killing it", store=self.store)
+            self._kill()
@@ -0,0 +1,479 @@
+import json
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from product_urls import product_id, product_id_from_url
+
+
+def has_class(class_name):
+    # XPath predicate that matches one class inside a multi-class attribute
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+def clean_text(element):
+    """Return the whitespace-normalized text of an element (like WebElement.text)."""
+    if element is None:
+        return ""
+    return " ".join(element.text_content().split())
+
+def parse_html(page_html):
+    return lxml_html.fromstring(page_html)
+
+
+# Libris selectors
+LIBRIS_RESULT_TITLES = etree.XPath(f"//*[{has_class('pr-title-categ-pg')}]")
+LIBRIS_RESULT_CONTAINER = etree.XPath(f"ancestor::div[{has_class('pr-history-item')}][1]")
+LIBRIS_RESULT_LINK = etree.XPath(".//a[1]")
+LIBRIS_FEEDBACK = etree.XPath(f"//*[{has_class('pr-rg-feedback-count')}]")
+LIBRIS_DETAIL_ITEMS = etree.XPath(f"//*[{has_class('pr-lista-item')}]")
+
+# Label -> column, checked in this order for every pr-lista-item
+LIBRIS_DETAIL_LABELS = [
+    ("Categoria:", 'categories'),
+    ("Autor:", 'author'),
+    ("Editura:", 'publisher'),
+    ("Editie:", 'cover_type'),
+    ("An aparitie:", 'publication_year'),
+    ("Nr. pagini:", 'num_pages'),
+    ("Format:", 'format'),
+    ("Cod:", 'code'),
+]
+
+
+def parse_libris_search_results(page_html):
+    """Return a list of {'title', 'href', 'price'} dicts for a Libris search page."""
+    tree = parse_html(page_html)
+    results = []
+    for title_element in LIBRIS_RESULT_TITLES(tree):
+        href = title_element.get('href')
+        price = "null"
+        containers = LIBRIS_RESULT_CONTAINER(title_element)
+        if containers:
+            links = LIBRIS_RESULT_LINK(containers[0])
+            if links:
+                price = links[0].get('data-price') or "null"
+                href = href or links[0].get('href')
+        if not href:
+            # The title itself may sit inside the product anchor
+            anchors = title_element.xpath("ancestor::a[@href][1]")
+            href = anchors[0].get('href') if anchors else None
+        results.append({
+            'title': clean_text(title_element),
+            'href': href,
+            'price': price
+        })
+    return results
+
+def parse_libris_feedback(feedback_text):
+    # "5 (1 review-uri)" -> ("5", "1")
+    score = feedback_text.split('(')[0].strip()
+    votes = feedback_text.split('(')[1].split('review')[0].strip()
+    return score, votes
+
+def parse_libris_book_page(page_html):
+    """Extract review data and the pr-lista-item details from a Libris product page.
+
+    Only the parsed columns are returned; the caller merges them into the
+    book_details row. Reviews default to "0" like the Selenium scraper does
+    when the feedback element is missing.
+    """
+    tree = parse_html(page_html)
+    details = {}
+
+    feedback = LIBRIS_FEEDBACK(tree)
+    try:
+        score, votes = parse_libris_feedback(clean_text(feedback[0]))
+        details['average_score'] = score or "null"
+        details['votes'] = votes or "null"
+    except (IndexError, ValueError):
+        details['average_score'] = "0"
+        details['votes'] = "0"
+
+    # The "afiseaza-mai-mult" button only toggles visibility, so every
+    # pr-lista-item is already present in the HTML
+    for item in LIBRIS_DETAIL_ITEMS(tree):
+        text = clean_text(item)
+        for label, column in LIBRIS_DETAIL_LABELS:
+            if label in text:
+                details[column] = text.replace(label, "").strip()
+                break
+
+    return details
+
+
+# Libris listing page (libris.py)
+LIBRIS_NO_PRODUCTS = etree.XPath("//div[contains(text(), 'Nu am gasit produse care sa corespunda filtrelor alese')]")
+LIBRIS_LISTING_ITEMS = etree.XPath(f"//*[{has_class('categ-prod-list')}]//*[{has_class('categ-prod-item')}]")
+LIBRIS_ITEM_TITLE = etree.XPath(f".//*[{has_class('pr-title-categ-pg')}]")
+
+
+def parse_libris_listing(page_html):
+    """Return (products, item_count) for a Libris listing page, or (None, 0) when
+    the "no products" message is shown.
+
+    Each product is a {'title', 'url', 'product_id', 'price'} dict.
+    """
+    tree = parse_html(page_html)
+    if LIBRIS_NO_PRODUCTS(tree):
+        return None, 0
+
+    items = LIBRIS_LISTING_ITEMS(tree)
+    products = []
+    for item in items:
+        title_elements = LIBRIS_ITEM_TITLE(item)
+        if not title_elements:
+            continue
+        links = item.xpath(".//a[@href]")
+        url = links[0].get('href') if links else ""
+        products.append({
+            'title': clean_text(title_elements[0]),
+            'url': url,
+            'product_id': product_id(url, item.attrib),
+            'price': links[0].get('data-price', "") if links else ""
+        })
+    return products, len(items)
+
+
+# Bookline listing page (bookline_books.py)
+BOOKLINE_LISTING_PRODUCTS = etree.XPath(
+    "//div[@class='l-flex__item l-flex__item--12@small'][.//h2[@class='c-product-title']]"
+)
+BOOKLINE_ITEM_TITLE_LINK = etree.XPath(f".//*[{has_class('c-product-title')}]//a")
+BOOKLINE_ITEM_AUTHORS = etree.XPath(f".//*[{has_class('o-product__authors')}]")
+BOOKLINE_ITEM_PUBLISHER = etree.XPath(f".//*[{has_class('o-product__publisher')}]")
+
+
+def parse_bookline_listing(page_html):
+    """Return the products of a Bookline search listing page.
+
+    Each product is a {'title', 'url', 'product_id'} dict where title is the
+    "author: title" string bookline_books.py saves.
+    """
+    tree = parse_html(page_html)
+    page_titles = []
+    for product in BOOKLINE_LISTING_PRODUCTS(tree):
+        links = BOOKLINE_ITEM_TITLE_LINK(product)
+        if not links:
+            continue
+        book_title = clean_text(links[0])
+        authors = BOOKLINE_ITEM_AUTHORS(product)
+        author = clean_text(authors[0]) if authors else ""
+
+        full_title = f"{author}: {book_title}" if author else book_title
+        if full_title:
+            url = links[0].get('href', "")
+            page_titles.append({'title': full_title, 'url': url, 'product_id': product_id_from_url(url)})
+    return page_titles
+
+
+# Shown instead of products for a page number past the end of the listing
+BOOKLINE_NO_RESULTS = etree.XPath("//*[contains(text(), 'Nincs találat')]")
+
+
+def bookline_listing_ended(page_html):
+    """True when a Bookline listing page has no products because the listing ended.
+
+    A page that is merely slow or broken has neither products nor the "no
+    results" message, and should be retried rather than taken as the end.
+    """
+    tree = parse_html(page_html)
+    return bool(BOOKLINE_NO_RESULTS(tree)) and not BOOKLINE_LISTING_PRODUCTS(tree)
+
+
+# Bookline search results and product page (bl_scr_det2.py)
+BOOKLINE_RESULT_TITLES = etree.XPath(f"//*[{has_class('c-product-title')}]")
+BOOKLINE_RESULT_PUBLISHER = etree.XPath(
+    f"ancestor::div[{has_class('t-product-detailed')}][1]//div[{has_class('o-product__publisher')}]"
+)
+BOOKLINE_TITLE = etree.XPath("//h1[@class='c-product__title']")
+BOOKLINE_AUTHOR = etree.XPath("//div[@class='o-product-authors']//span[@itemprop='name']")
+BOOKLINE_PRICE = etree.XPath("//p[@class='o-prices-block__price1']//span[@class='price']")
+BOOKLINE_PRICE_BLOCK = etree.XPath("//p[@class='o-prices-block__price1']")
+BOOKLINE_RATING = etree.XPath("//div[contains(@class, 'o-rating-block-simple')]")
+BOOKLINE_PUBLISHER = etree.XPath("//a[@class='c-product__publisher']")
+BOOKLINE_CATEGORY_CONTAINER = etree.XPath(
+    "//div[contains(@class, 'l-container') and contains(@class, 'l-gutter-2x-px')]"
+)
+BOOKLINE_BREADCRUMB = etree.XPath(".//ol[@class='o-breadcrumb ']")
+BOOKLINE_CATEGORY_NAMES = etree.XPath(".//span[@itemprop='name']")
+BOOKLINE_DETAILS = etree.XPath("//div[contains(@class, 'o-h5')]")
+
+
+def parse_bookline_search_results(page_html):
+    """Return a list of {'title', 'href', 'publisher'} dicts for a Bookline search page."""
+    tree = parse_html(page_html)
+    results = []
+    for title_element in BOOKLINE_RESULT_TITLES(tree):
+        links = title_element.xpath(".//a[@href]") or title_element.xpath("ancestor::a[@href][1]")
+        publishers = BOOKLINE_RESULT_PUBLISHER(title_element)
+        results.append({
+            'title': clean_text(title_element),
+            'href': links[0].get('href') if links else None,
+            'publisher': clean_text(publishers[0]) if publishers else ""
+        })
+    return results
+
+def parse_bookline_details_text(details_text):
+    """Split the "･"-separated o-h5 line into language, pages, edition and code."""
+    details = {}
+    # Check if details start with a number (pages)
+    if details_text[0].isdigit():
+        details['language'] = "magyar"
+        if '･' in details_text:
+            parts = details_text.split('･')
+            details['pages'] = parts[0].replace(" oldal", "").strip()
+            details['edition'] = parts[1].strip()
+            if len(parts) > 2:
+                details['code'] = parts[2].replace("ISBN:", "").strip()
+    else:
+        # If starts with language
+        details['language'] = details_text.split('･')[0].strip() if '･' in details_text else details_text
+        if '･' in details_text:
+            parts = details_text.split('･')
+            if len(parts) > 1:
+                details['pages'] = parts[1].replace(" oldal", "").strip() if "oldal" in parts[1] else "N/A"
+            if len(parts) > 2:
+                details['edition'] = parts[2].strip()
+            if len(parts) > 3:
+                details['code'] = parts[3].replace("ISBN:", "").strip()
+    return details
+
+def parse_bookline_book_page(page_html):
+    """Extract the Book_bookdetails2.csv columns found on a Bookline product page.
+
+    Columns that are not on the page are left out so the caller's defaults stay.
+    """
+    tree = parse_html(page_html)
+    details = {}
+
+    titles = BOOKLINE_TITLE(tree)
+    if titles:
+        details['title'] = clean_text(titles[0])
+
+    authors = BOOKLINE_AUTHOR(tree)
+    if authors:
+        details['author'] = clean_text(authors[0])
+
+    prices = BOOKLINE_PRICE(tree)
+    if prices:
+        price = clean_text(prices[0])
+        if price:
+            details['price'] = price.replace("RON", "").strip()
+        else:
+            # Check for alternative text
+            details['price'] = clean_text(BOOKLINE_PRICE_BLOCK(tree)[0])
+
+    ratings = BOOKLINE_RATING(tree)
+    if ratings:
+        details['score'] = ratings[0].get("data-stars") or "null"
+        details['reviews'] = ratings[0].get("data-favcount") or "null"
+
+    publishers = BOOKLINE_PUBLISHER(tree)
+    if publishers:
+        details['publisher'] = clean_text(publishers[0])
+
+    details['category'] = "N/A"
+    containers = BOOKLINE_CATEGORY_CONTAINER(tree)
+    if containers and BOOKLINE_BREADCRUMB(containers[0]):
+        categories = [clean_text(elem) for elem in BOOKLINE_CATEGORY_NAMES(containers[0])]
+        details['category'] = " > ".join(categories) if categories else "N/A"
+
+    details_elements = BOOKLINE_DETAILS(tree)
+    if details_elements:
+        details_text = clean_text(details_elements[0])
+        try:
+            details.update(parse_bookline_details_text(details_text))
+        except IndexError:
+            pass
+
+    return details
+
+
+# Carturesti search results and product page (carturesti_scrape_details.py)
+CARTURESTI_RESULTS = etree.XPath(
+    "//a[@class='clean-a select-item-event' and contains(@data-ng-click, 'onProductClick')]"
+)
+CARTURESTI_TITLE = etree.XPath("//h1[@class='titluProdus']")
+CARTURESTI_AUTHOR = etree.XPath("//a[contains(@href, '/autor/')]")
+CARTURESTI_SCORE = etree.XPath("//span[@data-ng-bind='h.numberFormat(agregateRating,1)']")
+CARTURESTI_VOTES = etree.XPath("//span[@data-ng-bind='votes']")
+CARTURESTI_PRICE = etree.XPath("//span[@class='pret']")
+CARTURESTI_PRICE_BANI = etree.XPath(".//span[@class='bani']")
+CARTURESTI_CATEGORIES = etree.XPath("//div[@class='linkuriCategorii']/a")
+# Column -> label of its productAttr row (also the attribute names of the JSON API)
+CARTURESTI_ATTRIBUTE_LABELS = {
+    'language': "Limba",
+    'publish_date': "Data publicarii",
+    'publisher': "Editura",
+    'pages': "Nr. pagini",
+    'translator': "Traducatori",
+    'edition': "Tip coperta",
+}
+CARTURESTI_ATTRIBUTES = {
+    key: etree.XPath(f"//div[@class='productAttr'][contains(., '{label}:')]//div")
+    for key, label in CARTURESTI_ATTRIBUTE_LABELS.items()
+}
+
+
+def parse_carturesti_search_results(page_html):
+    """Return the product hrefs of a Carturesti search page, in page order."""
+    tree = parse_html(page_html)
+    return [link.get('href') for link in CARTURESTI_RESULTS(tree) if link.get('href')]
+
+def parse_carturesti_book_page(page_html):
+    """Extract the Carturesti book_details.csv columns found on a product page."""
+    tree = parse_html(page_html)
+    details = {}
+
+    titles = CARTURESTI_TITLE(tree)
+    if titles:
+        details['title'] = clean_text(titles[0])
+
+    authors = CARTURESTI_AUTHOR(tree)
+    if authors:
+        details['author'] = clean_text(authors[0])
+
+    scores = CARTURESTI_SCORE(tree)
+    votes = CARTURESTI_VOTES(tree)
+    if scores and votes:
+        details['score'] = clean_text(scores[0])
+        details['reviews'] = clean_text(votes[0])
+
+    prices = CARTURESTI_PRICE(tree)
+    if prices:
+        bani = CARTURESTI_PRICE_BANI(prices[0])
+        if bani:
+            bani_text = clean_text(bani[0])
+            details['price'] = f"{clean_text(prices[0]).replace(bani_text, '')}.{bani_text}"
+
+    for index, link in enumerate(CARTURESTI_CATEGORIES(tree)[:4], 1):
+        details[f'category_{index}'] = clean_text(link)
+
+    for attr_key, selector in CARTURESTI_ATTRIBUTES.items():
+        elements = selector(tree)
+        if elements:
+            details[attr_key] = clean_text(elements[0])
+
+    return details
+
+
+# Carturesti JSON API (carturesti_scrape_api.py). The payload layout is only
+# known from captures, so values are looked up by key wherever they sit, under
+# the names the product page's Angular bindings use (agregateRating, votes)
+CARTURESTI_API_KEYS = {
+    'title': ['name', 'title'],
+    'author': ['authors', 'author'],
+    'score': ['agregateRating', 'aggregateRating', 'rating'],
+    'reviews': ['votes', 'reviewCount'],
+    'price': ['price', 'pret'],
+    'categories': ['categories', 'breadcrumbs'],
+    'attributes': ['attributes', 'specifications'],
+    'href': ['url', 'link', 'href'],
+    'product_id': ['id', 'productId', 'product_id'],
+}
+
+
+def find_value(data, names):
+    """The first non-empty value under any of names, searching the JSON breadth-first."""
+    level = [data]
+    while level:
+        next_level = []
+        for node in level:
+            if isinstance(node, dict):
+                for name in names:
+                    if node.get(name) not in (None, "", [], {}):
+                        return node[name]
+                next_level.extend(node.values())
+            elif isinstance(node, list):
+                next_level.extend(node)
+        level = next_level
+    return None
+
+def api_text(value):
+    # "Name", {"name": "Name"} or a list of either -> "Name" (the first one)
+    if isinstance(value, list):
+        value = value[0] if value else None
+    if isinstance(value, dict):
+        value = find_value(value, ['name', 'title', 'label', 'value'])
+    if value is None:
+        return ""
+    return " ".join(str(value).split())
+
+def api_number(value, decimals):
+    try:
+        return f"{float(value):.{decimals}f}"
+    except (TypeError, ValueError):
+        return api_text(value)
+
+def api_products(data):
+    # The first list of objects with a title: the search results
+    level = [data]
+    while level:
+        next_level = []
+        for node in level:
+            if isinstance(node, list):
+                if node and all(isinstance(item, dict) and find_value(item, CARTURESTI_API_KEYS['title'])
+                                for item in node):
+                    return node
+                next_level.extend(node)
+            elif isinstance(node, dict):
+                next_level.extend(node.values())
+        level = next_level
+    return []
+
+def parse_carturesti_api_search(payload_text):
+    """Return the products of a Carturesti search response as {'title', 'author', 'href', 'product_id'} dicts."""
+    results = []
+    for product in api_products(json.loads(payload_text)):
+        href = api_text(find_value(product, CARTURESTI_API_KEYS['href']))
+        results.append({
+            'title': api_text(product.get('name') or product.get('title')),
+            'author': api_text(find_value(product, CARTURESTI_API_KEYS['author'])),
+            'href': href,
+            'product_id': api_text(find_value(product, CARTURESTI_API_KEYS['product_id'])) or product_id_from_url(href),
+        })
+    return results
+
+def parse_carturesti_api_product(payload_text):
+    """Extract the Carturesti book_details.csv columns found in a product response.
+
+    Values come out formatted as parse_carturesti_book_page reads them off
+    the rendered page, so both modes write the same rows.
+    """
+    data = json.loads(payload_text)
+    details = {}
+
+    title = api_text(find_value(data, CARTURESTI_API_KEYS['title']))
+    if title:
+        details['title'] = title
+
+    author = api_text(find_value(data, CARTURESTI_API_KEYS['author']))
+    if author:
+        details['author'] = author
+
+    score = find_value(data, CARTURESTI_API_KEYS['score'])
+    votes = find_value(data, CARTURESTI_API_KEYS['reviews'])
+    if score is not None and votes is not None:
+        details['score'] = api_number(score, 1)
+        details['reviews'] = api_text(votes)
+
+    price = find_value(data, CARTURESTI_API_KEYS['price'])
+    if price is not None:
+        details['price'] = api_number(price, 2)
+
+    categories = find_value(data, CARTURESTI_API_KEYS['categories']) or []
+    for index, category in enumerate(categories[:4] if isinstance(categories, list) else [], 1):
+        details[f'category_{index}'] = api_text(category)
+
+    # [{"name": "Editura", "value": "Humanitas"}, ...] or {"Editura": "Humanitas", ...}
+    attributes = find_value(data, CARTURESTI_API_KEYS['attributes']) or {}
+    if isinstance(attributes, list):
+        attributes = {api_text(attribute.get('name') or attribute.get('label')): attribute.get('value')
+                      for attribute in attributes if isinstance(attribute, dict)}
+    labels = {label.rstrip(':').strip().lower(): value for label, value in attributes.items()}
+    for attr_key, label in CARTURESTI_ATTRIBUTE_LABELS.items():
+        value = api_text(labels.get(label.lower()))
+        if value:
+            details[attr_key] = value
+
+    return details
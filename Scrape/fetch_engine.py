@@ -0,0 +1,105 @@
+import asyncio
+import aiohttp
+from urllib.parse import urlsplit
+
+from store_config import DEFAULT_HOST_CONCURRENCY, HEADERS
+from rate_limiter import RateLimiter
+from retry import backoff_delay
+
+
+class AsyncFetcher:
+    """Shared aiohttp session with a concurrency limit per host.
+
+    One connection pool (with keep-alive) is shared by every store, and each
+    host gets its own semaphore so a crawl can run the three stores at the
+    same time without sending more than host_limits[host] requests to any of
+    them at once. Within that limit requests are paced by the limiter's
+    per-host rate, which backs off on timeouts, 429s and 5xx.
+    """
+
+    def __init__(self, host_limits=None, default_limit=DEFAULT_HOST_CONCURRENCY,
+                 timeout=30, retries=2, limiter=None):
+        self.host_limits = host_limits or {}
+        self.limiter = limiter or RateLimiter()
+        self.default_limit = default_limit
+        self.timeout = timeout
+        self.retries = retries
+        self.session = None
+        self.semaphores = {}
+        self.stats = {}
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=0,  # Limits are enforced per host by the semaphores
+            keepalive_timeout=60,
+            ttl_dns_cache=300
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    def limit_for(self, host):
+        return self.host_limits.get(host, self.default_limit)
+
+    def _semaphore(self, host):
+        if host not in self.semaphores:
+            self.semaphores[host] = asyncio.Semaphore(self.limit_for(host))
+            self.stats[host] = {'requests': 0, 'errors': 0, 'bytes': 0}
+        return self.semaphores[host]
+
+    async def fetch(self, url):
+        """GET url and return the body text, retrying 429/5xx and network errors with backoff."""
+        host = urlsplit(url).netloc
+        semaphore = self._semaphore(host)
+        stats = self.stats[host]
+
+        for attempt in range(self.retries + 1):
+            try:
+                async with semaphore:
+                    await self.limiter.wait_async(host)
+                    async with self.session.get(url) as response:
+                        stats['requests'] += 1
+                        await self.limiter.record_async(host, response.status,
+                                                        retry_after=response.headers.get('Retry-After'))
+                        if response.status == 429 or response.status >= 500:
+                            raise aiohttp.ClientResponseError(
+                                response.request_info, response.history,
+                                status=response.status, message=response.reason
+                            )
+                        response.raise_for_status()
+                        body = await response.read()
+                        stats['bytes'] += len(body)
+                        return body.decode(response.get_encoding() or 'utf-8', errors='replace')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                stats['errors'] += 1
+                if not isinstance(e, aiohttp.ClientResponseError):
+                    await self.limiter.record_async(host, error=e)
+                retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status == 429 or e.status >= 500
+                if not retryable or attempt == self.retries:
+                    raise
+                await asyncio.sleep(backoff_delay(attempt + 1))
+
+
+class OrderedWriter:
+    """Write results in input order although they complete out of order.
+
+    put(index, rows) stores a finished item; every time the next expected index
+    is available the contiguous run is handed to write_rows.
+    """
+
+    def __init__(self, write_rows, start_index=0):
+        self.write_rows = write_rows
+        self.next_index = start_index
+        self.pending = {}
+
+    def put(self, index, rows):
+        self.pending[index] = rows
+        while self.next_index in self.pending:
+            self.write_rows(self.pending.pop(self.next_index))
+            self.next_index += 1
@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+ARCHIVE_DIR = 'Data/html_archive'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    id INTEGER PRIMARY KEY,
+    dataset TEXT NOT NULL,
+    url TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    sha256 TEXT NOT NULL,
+    context TEXT
+);
+CREATE INDEX IF NOT EXISTS pages_dataset ON pages (dataset, url, fetched_at);
+"""
+
+
+class HtmlArchive:
+    """Compressed archive of every fetched page, so parsers can be re-run offline.
+
+    Page bodies are stored once per content hash under objects/ (gzip), and
+    index.db records which dataset fetched which URL when, together with the
+    row context that is not on the page (e.g. the Libris year/page/price).
+    """
+
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(root, 'index.db'), timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def object_path(self, sha256):
+        return os.path.join(self.root, 'objects', sha256[:2], f"{sha256}.html.gz")
+
+    def put(self, dataset, url, page_html, context=None):
+        """Store a fetched page and return its content hash."""
+        body = page_html.encode('utf-8')
+        sha256 = hashlib.sha256(body).hexdigest()
+        path = self.object_path(sha256)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a reader never sees half a file
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with gzip.open(temp_path, 'wb', compresslevel=6) as f:
+                f.write(body)
+            os.replace(temp_path, path)
+        self.db.execute(
+            "INSERT INTO pages (dataset, url, fetched_at, sha256, context) VALUES (?, ?, ?, ?, ?)",
+            (dataset, url, time.time(), sha256, json.dumps(context or {}))
+        )
+        return sha256
+
+    def latest(self, dataset):
+        """The newest fetch of every (URL, context) pair in a dataset, in first-fetch order."""
+        rows = self.db.execute(
+            "SELECT pages.url, pages.sha256, pages.context, pages.fetched_at FROM pages JOIN "
+            "(SELECT MIN(id) AS first_id, MAX(id) AS last_id FROM pages WHERE dataset = ? GROUP BY url, context) AS fetches "
+            "ON pages.id = fetches.last_id ORDER BY fetches.first_id",
+            (dataset,)
+        ).fetchall()
+        return [{'url': row['url'], 'sha256': row['sha256'], 'fetched_at': row['fetched_at'],
+                 'context': json.loads(row['context'])} for row in rows]
+
+    def datasets(self):
+        rows = self.db.execute("SELECT dataset, COUNT(*) AS n FROM pages GROUP BY dataset ORDER BY dataset")
+        return {row['dataset']: row['n'] for row in rows}
+
+
+def read_object(root, sha256):
+    # Module-level so worker processes can read pages without opening the index
+    with gzip.open(os.path.join(root, 'objects', sha256[:2], f"{sha256}.html.gz"), 'rb') as f:
+        return f.read().decode('utf-8')
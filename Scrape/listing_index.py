@@ -0,0 +1,121 @@
+import hashlib
+import os
+import sqlite3
+import time
+
+from work_queue import QUEUE_DB, WorkQueue
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS listing_pages (
+    store TEXT NOT NULL,
+    page_key TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    title_count INTEGER NOT NULL,
+    checked_at REAL,
+    changed_at REAL,
+    PRIMARY KEY (store, page_key)
+);
+CREATE TABLE IF NOT EXISTS listing_titles (
+    store TEXT NOT NULL,
+    title TEXT NOT NULL,
+    first_seen REAL,
+    PRIMARY KEY (store, title)
+);
+"""
+
+# An incremental run stops walking a listing after this many pages in a row
+# without new titles (a new title shifts the fingerprint of every later page)
+UNCHANGED_PAGES = 3
+
+
+def fingerprint(titles):
+    # The ordered title list: a new book anywhere on the page changes it
+    return hashlib.sha256('\n'.join(titles).encode('utf-8')).hexdigest()
+
+
+class ListingIndex:
+    """Fingerprint of every listing page and every title seen, per store.
+
+    Kept in the work queue database. check() tells a listing scraper whether
+    a page changed since the last crawl and which of its titles are new, so
+    a refresh only writes (and queues for detail scraping) the new ones.
+    """
+
+    def __init__(self, store, path=QUEUE_DB):
+        self.store = store
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def has_titles(self):
+        return self.db.execute(
+            "SELECT 1 FROM listing_titles WHERE store = ? LIMIT 1", (self.store,)
+        ).fetchone() is not None
+
+    def add_titles(self, titles):
+        # Baseline from a titles file written before the index existed
+        self.db.execute("BEGIN IMMEDIATE")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO listing_titles (store, title, first_seen) VALUES (?, ?, ?)",
+            ((self.store, title, time.time()) for title in titles)
+        )
+        self.db.execute("COMMIT")
+
+    def check(self, page_key, titles):
+        """Record a crawled page; return (changed, titles not seen before on any page)."""
+        now = time.time()
+        page_fingerprint = fingerprint(titles)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.db.execute(
+                "SELECT fingerprint FROM listing_pages WHERE store = ? AND page_key = ?",
+                (self.store, str(page_key))
+            ).fetchone()
+            changed = row is None or row[0] != page_fingerprint
+            self.db.execute(
+                "INSERT INTO listing_pages (store, page_key, fingerprint, title_count, checked_at, changed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(store, page_key) DO UPDATE SET "
+                "fingerprint = excluded.fingerprint, title_count = excluded.title_count, checked_at = excluded.checked_at, "
+                "changed_at = CASE WHEN listing_pages.fingerprint = excluded.fingerprint "
+                "THEN listing_pages.changed_at ELSE excluded.changed_at END",
+                (self.store, str(page_key), page_fingerprint, len(titles), now, now)
+            )
+            new_titles = []
+            for title in titles:
+                cursor = self.db.execute(
+                    "INSERT OR IGNORE INTO listing_titles (store, title, first_seen) VALUES (?, ?, ?)",
+                    (self.store, title, now)
+                )
+                if cursor.rowcount:
+                    new_titles.append(title)
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return changed, new_titles
+
+
+def count_lines(path, header=False):
+    # Data lines in a title file, i.e. the line number the next appended title gets
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = sum(1 for _ in f)
+    return max(lines - 1, 0) if header else lines
+
+def queue_new_titles(queue_name, first_position, lines, key_of):
+    """Add titles found by an incremental listing run to a detail scraper's queue.
+
+    first_position is the line number the first of them got in the detail
+    input file, so positions keep matching line numbers. A queue that is not
+    seeded yet picks them up from the file when it is.
+    """
+    queue = WorkQueue(queue_name)
+    if queue.is_seeded():
+        for offset, line in enumerate(lines):
+            queue.add(first_position + offset, key_of(line), line)
+    queue.close()
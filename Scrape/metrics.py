@@ -0,0 +1,155 @@
+import bisect
+import http.server
+import threading
+import time
+from contextlib import contextmanager
+
+from store_config import METRICS_PORT
+
+PHASES = ['search', 'navigate', 'extract', 'write']
+# Upper bounds (seconds) of the phase latency buckets
+BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+# Later ports are tried when one is taken (driver_pool shards, parallel stores)
+PORT_ATTEMPTS = 20
+
+_registry = []
+_server = None
+_lock = threading.Lock()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+    def samples(self):
+        # Cumulative (le, count) pairs, the last one being +Inf
+        total = 0
+        for bound, count in zip(BUCKETS + ['+Inf'], self.counts):
+            total += count
+            yield bound, total
+
+
+class ScraperMetrics:
+    """Counters of one scraper run, served by serve_metrics() in Prometheus text format.
+
+    The scraper calls phase(name) around each step of a title, title_done()
+    or title_failed(kind) after it and set_remaining() with its queue depth;
+    titles/hour and the ETA are worked out from those when scraped.
+    """
+
+    def __init__(self, scraper):
+        self.scraper = scraper
+        self.started = time.time()
+        self.titles = {'done': 0, 'failed': 0}
+        self.errors = {}
+        self.phases = {phase: Histogram() for phase in PHASES}
+        self.remaining = None
+        with _lock:
+            _registry.append(self)
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name].observe(time.perf_counter() - start)
+
+    def title_done(self):
+        self.titles['done'] += 1
+
+    def title_failed(self, kind):
+        self.titles['failed'] += 1
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def set_remaining(self, count):
+        self.remaining = count
+
+    def titles_per_hour(self):
+        elapsed = time.time() - self.started
+        return sum(self.titles.values()) * 3600 / elapsed if elapsed > 0 else 0.0
+
+    def eta_seconds(self):
+        rate = self.titles_per_hour()
+        if self.remaining is None or rate == 0:
+            return None
+        return self.remaining * 3600 / rate
+
+    def close(self):
+        with _lock:
+            if self in _registry:
+                _registry.remove(self)
+
+
+def labels(**values):
+    return '{' + ','.join(f'{key}="{value}"' for key, value in values.items()) + '}'
+
+def render():
+    """All registered scrapers in the Prometheus text exposition format."""
+    with _lock:
+        scrapers = list(_registry)
+    families = [
+        ('scraper_titles_total', 'counter', "Titles finished in this run, by result",
+         [(labels(scraper=m.scraper, result=result), count) for m in scrapers for result, count in m.titles.items()]),
+        ('scraper_errors_total', 'counter', "Failed titles by failure kind",
+         [(labels(scraper=m.scraper, kind=kind), count) for m in scrapers for kind, count in m.errors.items()]),
+        ('scraper_titles_per_hour', 'gauge', "Titles finished per hour in this run",
+         [(labels(scraper=m.scraper), round(m.titles_per_hour(), 2)) for m in scrapers]),
+        ('scraper_queue_remaining', 'gauge', "Titles left in the scraper's work queue",
+         [(labels(scraper=m.scraper), m.remaining) for m in scrapers if m.remaining is not None]),
+        ('scraper_eta_seconds', 'gauge', "Estimated seconds until the queue is empty",
+         [(labels(scraper=m.scraper), round(m.eta_seconds())) for m in scrapers if m.eta_seconds() is not None]),
+    ]
+    lines = []
+    for name, kind, help_text, samples in families:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        lines += [f"{name}{sample_labels} {value}" for sample_labels, value in samples]
+
+    lines += ["# HELP scraper_phase_seconds Time spent per title in each phase",
+              "# TYPE scraper_phase_seconds histogram"]
+    for m in scrapers:
+        for phase, histogram in m.phases.items():
+            for bound, count in histogram.samples():
+                lines.append(f"scraper_phase_seconds_bucket{labels(scraper=m.scraper, phase=phase, le=bound)} {count}")
+            lines.append(f"scraper_phase_seconds_sum{labels(scraper=m.scraper, phase=phase)} {histogram.sum:.3f}")
+            lines.append(f"scraper_phase_seconds_count{labels(scraper=m.scraper, phase=phase)} {sum(histogram.counts)}")
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass  # Prometheus scrapes every few seconds
+
+
+def serve_metrics(port=METRICS_PORT):
+    """Serve /metrics from a background thread on the first free port from port on.
+
+    Returns the port, or None if none was free. Only one server runs per process.
+    """
+    global _server
+    if _server is not None:
+        return _server.server_address[1]
+    for candidate in range(port, port + PORT_ATTEMPTS):
+        try:
+            _server = http.server.ThreadingHTTPServer(('127.0.0.1', candidate), MetricsHandler)
+        except OSError:
+            continue
+        threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+        return candidate
+    return None
@@ -0,0 +1,516 @@
+import argparse
+import html
+import http.server
+import json
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, parse_qs, unquote
+
+from store_config import LIVE_STORE_URLS
+from html_archive import ARCHIVE_DIR, HtmlArchive, read_object
+from title_matching import normalize
+
+# Local stand-in for the three bookstores, so the scrapers can be tested and
+# load-tested without touching the live sites. Each store gets its own port
+# (libris on MOCK_PORT, then bookline, then carturesti); run the scrapers with
+# SCRAPE_<STORE>_URL pointing at it (see store_config.py).
+MOCK_PORT = 8801
+MOCK_STORES = ['libris', 'bookline', 'carturesti']
+
+# Synthetic listings: pages per Libris year / in the Bookline listing
+LISTING_PAGES = 3
+LIBRIS_PAGE_SIZE = 40  # libris.py stops at the first page with fewer items
+BOOKLINE_PAGE_SIZE = 20
+
+AUTHORS = ["Mircea Cartarescu", "Ana Blandiana", "Marin Preda", "Szabo Magda", "Ion Creanga",
+           "Herta Muller", "Kanyadi Sandor", "Liviu Rebreanu", "Nora Iuga", "Eugen Ovidiu Chirovici"]
+PUBLISHERS = ["Humanitas", "Polirom", "Nemira", "Art", "Litera", "Corint", "Magveto", "Europa"]
+CATEGORIES = ["Literatura", "Beletristica", "Istorie", "Biografii", "Stiinte", "Carti pentru copii"]
+WORDS = ["noapte", "orasul", "drumul", "lumina", "tacerea", "casa", "apa", "timpul", "umbra",
+         "vantul", "muntele", "amintiri", "poveste", "ultima", "gradina", "copilaria", "iarna"]
+
+CONSENT_COOKIE = 'mock_consent'
+
+
+def seed_of(text):
+    return zlib.crc32(text.encode('utf-8'))
+
+def slugify(text):
+    return '-'.join(normalize(text).split()) or 'carte'
+
+def book_for(title):
+    """The made-up (but stable) details of a title; the same title always gets the same book."""
+    rng = random.Random(seed_of(title))
+    return {
+        'id': seed_of(title) % 10**7,
+        'title': title,
+        'author': rng.choice(AUTHORS),
+        'publisher': rng.choice(PUBLISHERS),
+        'category': rng.choice(CATEGORIES),
+        'price': f"{rng.randint(19, 129)}.{rng.choice(['00', '50', '90', '99'])}",
+        'score': f"{rng.randint(30, 50) / 10:.1f}",
+        'votes': rng.randint(0, 250),
+        'pages': rng.randint(64, 960),
+        'year': rng.randint(1990, 2025),
+        'isbn': f"978{rng.randint(10**9, 10**10 - 1)}",
+    }
+
+def listing_title(*key):
+    rng = random.Random(seed_of('/'.join(map(str, key))))
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).capitalize()
+
+def page_html(body, title="Mock store"):
+    return f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(title)}</title></head><body>{body}</body></html>"
+
+def esc(value):
+    return html.escape(str(value))
+
+
+class Faults:
+    """Latency, errors, dropped connections and throttling injected into a mock store's responses.
+
+    latency is the mean delay in seconds (uniformly 0.5-1.5x); error_rate and
+    drop_rate are the share of requests answered with a 503 or a closed
+    connection; above throttle requests per second the store answers 429.
+    """
+
+    def __init__(self, latency=0.0, error_rate=0.0, drop_rate=0.0, throttle=None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.throttle = throttle
+        self.tokens = float(throttle or 0)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def delay(self):
+        return random.uniform(0.5, 1.5) * self.latency if self.latency else 0.0
+
+    def throttled(self):
+        if not self.throttle:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.updated) * self.throttle, max(self.throttle, 1.0))
+            self.updated = now
+            if self.tokens < 1:
+                return True
+            self.tokens -= 1
+            return False
+
+    def outcome(self):
+        """'drop', 'error' or None (serve the page) for the next request."""
+        roll = random.random()
+        if roll < self.drop_rate:
+            return 'drop'
+        if roll < self.drop_rate + self.error_rate:
+            return 'error'
+        return None
+
+
+class RecordedPages:
+    """Pages of one store kept in the HTML archive, replayed with their links pointed at the mock."""
+
+    DATASETS = {
+        'libris': (['libris_details'], 'libris_listing'),
+        'bookline': (['bookline_details2', 'bookline_details'], 'bookline_listing'),
+        'carturesti': (['carturesti_details', 'carturesti_api_search', 'carturesti_api'], None),
+    }
+
+    def __init__(self, store, base_url, root=ARCHIVE_DIR):
+        self.root = root
+        self.products = {}   # path (with query) -> sha256
+        self.titles = {}     # normalized title -> (path, context)
+        self.listings = {}   # (year, page) for Libris, page for Bookline -> sha256
+        domain = re.escape(urlsplit(LIVE_STORE_URLS[store]).hostname.replace('www.', ''))
+        self.live_url = re.compile(rf"https?://(?:www\.)?{domain}")
+        self.base_url = base_url
+        if not os.path.exists(os.path.join(root, 'index.db')):
+            return
+        archive = HtmlArchive(root)
+        try:
+            detail_datasets, listing_dataset = self.DATASETS[store]
+            for dataset in detail_datasets:
+                for page in archive.latest(dataset):
+                    path = path_of(page['url'])
+                    self.products.setdefault(path, page['sha256'])
+                    if page['context'].get('title'):
+                        self.titles.setdefault(normalize(page['context']['title']), (path, page['context']))
+            if listing_dataset:
+                for page in archive.latest(listing_dataset):
+                    context = page['context']
+                    if 'product_type' in context:
+                        continue  # bookline_sorted.py's sorted listings, not the pages the mock serves
+                    key = (context.get('year'), context.get('page')) if store == 'libris' else context.get('page')
+                    self.listings[key] = page['sha256']
+        finally:
+            archive.close()
+
+    def __len__(self):
+        return len(self.products) + len(self.listings)
+
+    def read(self, sha256):
+        return self.live_url.sub(self.base_url, read_object(self.root, sha256))
+
+
+def path_of(url):
+    parts = urlsplit(url)
+    return parts.path + (f"?{parts.query}" if parts.query else "")
+
+
+class MockStore:
+    """Pages of one store with the DOM hooks its scrapers wait for and read."""
+
+    def __init__(self, store, base_url, faults=None, listing_pages=LISTING_PAGES, archive_root=ARCHIVE_DIR):
+        self.store = store
+        self.base_url = base_url
+        self.faults = faults or Faults()
+        self.listing_pages = listing_pages
+        self.recorded = RecordedPages(store, base_url, archive_root) if archive_root else None
+        self.books = {}  # product path -> book, for the product page after a search or listing
+        self.ids = {}    # product id -> book, for the Carturesti API's product calls
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'dropped': 0, 'throttled': 0}
+
+    def product_path(self, book):
+        if self.store == 'bookline':
+            path = f"/product/home.action?id={book['id']}&_v={slugify(book['title'])}"
+        else:
+            path = f"/carte/{slugify(book['title'])}-{book['id']}"
+        with self.lock:
+            self.books[path] = book
+            self.ids[str(book['id'])] = book
+        return path
+
+    def book_at(self, path):
+        with self.lock:
+            if path in self.books:
+                return self.books[path]
+        # A product link from an earlier run of the mock: rebuild the book from its slug
+        parts = urlsplit(path)
+        slug = parse_qs(parts.query).get('_v', [parts.path.rsplit('/', 1)[-1]])[0]
+        return book_for(re.sub(r'-\d+$', '', slug).replace('-', ' ').capitalize())
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def respond(self, path, cookies):
+        """(status, body) of a GET request, or None for an unknown path."""
+        parts = urlsplit(path)
+        query = {key: values[0] for key, values in parse_qs(parts.query, keep_blank_values=True).items()}
+        if self.recorded and path in self.recorded.products:
+            return 200, self.recorded.read(self.recorded.products[path])
+        consent = CONSENT_COOKIE in cookies
+        return getattr(self, f"{self.store}_page")(parts.path, query, path, consent)
+
+    # Libris
+
+    def libris_page(self, path, query, full_path, consent):
+        if path == '/':
+            return 200, self.libris_layout("", consent)
+        if path == '/search':
+            return 200, self.libris_layout(self.libris_search(query.get('q', '')), consent)
+        if path == '/carti':
+            filter_value, page = query.get('fsv_77563', ''), int(query.get('iv.pg') or 1)
+            year = int(filter_value[-4:]) if filter_value[-4:].isdigit() else 0
+            if self.recorded and (year, page) in self.recorded.listings:
+                return 200, self.recorded.read(self.recorded.listings[(year, page)])
+            return 200, self.libris_layout(self.libris_listing(year, page), consent)
+        if path.startswith('/carte/'):
+            return 200, self.libris_layout(self.libris_product(self.book_at(full_path)), consent)
+        return None
+
+    def libris_layout(self, content, consent):
+        popups = "" if consent else (
+            "<div id='cookie-bar'><a href='#' onclick=\"document.cookie='" + CONSENT_COOKIE +
+            "=refused; max-age=31536000; path=/'; document.getElementById('cookie-bar').remove(); return false;\">Refuz toate</a></div>"
+            "<div id='newsletter'><span class='modal-close-x-c-newsletter close_news_modal'"
+            " onclick=\"document.getElementById('newsletter').remove()\">x</span></div>"
+        )
+        search = "<form action='/search' method='get'><input id='autoComplete' name='q' type='text'></form>"
+        return page_html(popups + search + content, "Libris")
+
+    def libris_result(self, book, css_class, price=None):
+        return (f"<div class='{css_class}'><a href='{esc(self.product_path(book))}' data-price='{esc(price or book['price'])}'>"
+                f"<h2 class='pr-title-categ-pg'>{esc(book['title'])}</h2></a></div>")
+
+    def libris_search(self, title):
+        results = []
+        recorded = self.recorded.titles.get(normalize(title)) if self.recorded else None
+        if recorded:
+            path, context = recorded
+            results.append(f"<div class='pr-history-item'><a href='{esc(path)}' data-price='{esc(context.get('price', ''))}'>"
+                           f"<h2 class='pr-title-categ-pg'>{esc(context['title'])}</h2></a></div>")
+        elif title.strip():
+            results.append(self.libris_result(book_for(title), 'pr-history-item'))
+        results += [self.libris_result(book_for(decoy), 'pr-history-item') for decoy in decoys(title)]
+        return "<div class='search-results'>" + ''.join(results) + "</div>"
+
+    def libris_listing(self, year, page):
+        if not year or page > self.listing_pages:
+            return "<div>Nu am gasit produse care sa corespunda filtrelor alese</div>"
+        count = LIBRIS_PAGE_SIZE if page < self.listing_pages else LIBRIS_PAGE_SIZE // 2
+        items = []
+        for i in range(count):
+            book = book_for(listing_title('libris', year, page, i))
+            items.append(f"<div class='categ-prod-item' data-product-id='{book['id']}'>"
+                         f"<a href='{esc(self.product_path(book))}' data-price='{esc(book['price'])}'></a>"
+                         f"<h2 class='pr-title-categ-pg'>{esc(book['title'])}</h2></div>")
+        return "<div class='categ-prod-list'>" + ''.join(items) + "</div>"
+
+    def libris_product(self, book):
+        details = [("Categoria:", book['category']), ("Autor:", book['author']), ("Editura:", book['publisher']),
+                   ("Editie:", "Paperback"), ("An aparitie:", book['year']), ("Nr. pagini:", book['pages']),
+                   ("Format:", "13x20"), ("Cod:", book['isbn'])]
+        items = ''.join(f"<li class='pr-lista-item'>{label} {esc(value)}</li>" for label, value in details)
+        return (f"<h1>{esc(book['title'])}</h1>"
+                f"<div class='pr-rg-feedback-count'>{book['score']} ({book['votes']} review-uri)</div>"
+                f"<ul class='pr-lista-detalii'>{items}</ul>")
+
+    # Bookline
+
+    def bookline_page(self, path, query, full_path, consent):
+        if path == '/':
+            return 200, self.bookline_layout("", consent)
+        if path == '/search/search.action':
+            if 'page' in query:
+                page = int(query['page'] or 1)
+                if self.recorded and page in self.recorded.listings:
+                    return 200, self.recorded.read(self.recorded.listings[page])
+                return 200, self.bookline_layout(self.bookline_listing(page), consent)
+            return 200, self.bookline_layout(self.bookline_search(query.get('searchfield', '')), consent)
+        if path == '/product/home.action':
+            return 200, self.bookline_layout(self.bookline_product(self.book_at(full_path)), consent)
+        return None
+
+    def bookline_layout(self, content, consent):
+        popup = "" if consent else (
+            "<div id='onetrust-banner'><button id='onetrust-accept-btn-handler' onclick=\"document.cookie='" +
+            CONSENT_COOKIE + "=accepted; max-age=31536000; path=/'; document.getElementById('onetrust-banner').remove();\">"
+            "Elfogadom</button></div>"
+        )
+        search = ("<form action='/search/search.action' method='get'>"
+                  "<input class='c-simple-search__input' name='searchfield' type='text'></form>")
+        filters = ("<label onclick=\"this.classList.toggle('is-checked')\">Könyv</label>"
+                   "<a href='#'>Relevancia szerint</a> <a href='#'>Eladott darabszám szerint</a>")
+        return page_html(popup + search + filters + content, "Bookline")
+
+    def bookline_product_block(self, book):
+        return (f"<div class='l-flex__item l-flex__item--12@small'><div class='t-product-detailed'>"
+                f"<div class='o-product__authors'>{esc(book['author'])}</div>"
+                f"<h2 class='c-product-title'><a href='{esc(self.product_path(book))}'>{esc(book['title'])}</a></h2>"
+                f"<div class='o-product__publisher'>{esc(book['publisher'])}</div>"
+                f"<p class='o-prices-block__price1'><span class='price'>{book['price']} RON</span></p></div></div>")
+
+    def bookline_search(self, title):
+        books = ([book_for(title)] if title.strip() else []) + [book_for(decoy) for decoy in decoys(title)]
+        return "<div class='l-flex'>" + ''.join(self.bookline_product_block(book) for book in books) + "</div>"
+
+    def bookline_listing(self, page):
+        if page > self.listing_pages:
+            return "<div class='l-flex'><p>Nincs találat</p></div>"
+        blocks = [self.bookline_product_block(book_for(listing_title('bookline', page, i)))
+                  for i in range(BOOKLINE_PAGE_SIZE)]
+        pagination = (f"<div class='o-pagination'><span class='o-pagination__btn is-current-page'>{page}</span>"
+                      f"<a href='/search/search.action?page={page + 1}&searchfield=*'>{page + 1}</a></div>")
+        return "<div class='l-flex'>" + ''.join(blocks) + "</div>" + pagination
+
+    def bookline_product(self, book):
+        return (f"<div class='l-container l-gutter-2x-px'><ol class='o-breadcrumb '>"
+                f"<li><span itemprop='name'>Könyv</span></li><li><span itemprop='name'>{esc(book['category'])}</span></li></ol></div>"
+                f"<h1 class='c-product__title'>{esc(book['title'])}</h1>"
+                f"<div class='o-product-authors'><span itemprop='name'>{esc(book['author'])}</span></div>"
+                f"<a class='c-product__publisher' href='#'>{esc(book['publisher'])}</a>"
+                f"<p class='o-prices-block__price1'><span class='price'>{book['price']} RON</span></p>"
+                f"<div class='o-rating-block-simple' data-stars='{book['score']}' data-favcount='{book['votes']}'></div>"
+                f"<div class='o-h5'>magyar･{book['pages']} oldal･puhatáblás･ISBN: {book['isbn']}</div>")
+
+    # Carturesti
+
+    def carturesti_page(self, path, query, full_path, consent):
+        if path == '/':
+            return 200, self.carturesti_layout("", consent)
+        if path.startswith('/product/search/'):
+            search_query = urlsplit(full_path).path[len('/product/search/'):]
+            return 200, self.carturesti_layout(self.carturesti_search(unquote(search_query)), consent)
+        if path.startswith('/carte/'):
+            return 200, self.carturesti_layout(self.carturesti_product(self.book_at(full_path)), consent)
+        # The default CARTURESTI_API_PATHS, for carturesti_scrape_api.py
+        if path == '/api/search':
+            return 200, json.dumps(self.carturesti_api_search(query.get('q', '')))
+        if path.startswith('/api/product/'):
+            with self.lock:
+                book = self.ids.get(path[len('/api/product/'):])
+            return (200, json.dumps({'product': self.carturesti_api_product(book)})) if book else None
+        return None
+
+    def carturesti_layout(self, content, consent):
+        popup = "" if consent else (
+            "<div id='cc-banner'><button class='cc-deny' onclick=\"document.cookie='" + CONSENT_COOKIE +
+            "=denied; max-age=31536000; path=/'; document.getElementById('cc-banner').remove();\">Refuz</button></div>"
+        )
+        search = ("<form onsubmit=\"location.href='/product/search/' + encodeURIComponent("
+                  "document.getElementById('search-input').value); return false;\">"
+                  "<input id='search-input' type='text'></form>")
+        return page_html(popup + search + content, "Carturesti")
+
+    def carturesti_search(self, search_query):
+        # The search query is "title author"; result titles are read from the URL slug
+        books = ([book_for(search_query)] if search_query.strip() else []) + [book_for(d) for d in decoys(search_query)]
+        links = [f"<a class='clean-a select-item-event' data-ng-click='onProductClick(product)' "
+                 f"href='{esc(self.product_path(book))}'>{esc(book['title'])}</a>" for book in books]
+        return "<div class='products'>" + ''.join(links) + "</div>"
+
+    def carturesti_product(self, book):
+        whole, bani = book['price'].split('.')
+        attributes = [("Limba:", "Romana"), ("Data publicarii:", book['year']), ("Editura:", book['publisher']),
+                      ("Nr. pagini:", book['pages']), ("Tip coperta:", "Paperback")]
+        return (f"<h1 class='titluProdus'>{esc(book['title'])}</h1>"
+                f"<a href='/autor/{slugify(book['author'])}'>{esc(book['author'].upper())}</a>"
+                f"<span data-ng-bind='h.numberFormat(agregateRating,1)'>{book['score']}</span>"
+                f"<span data-ng-bind='votes'>{book['votes']}</span>"
+                f"<span class='pret'>{whole}<span class='bani'>{bani}</span></span> lei"
+                f"<div class='linkuriCategorii'><a>Carte</a><a>{esc(book['category'])}</a></div>"
+                + ''.join(f"<div class='productAttr'>{label} <div>{esc(value)}</div></div>" for label, value in attributes))
+
+
+    def carturesti_api_product(self, book, full=True):
+        product = {'id': book['id'], 'name': book['title'], 'url': self.product_path(book),
+                   'authors': [{'name': book['author']}], 'price': float(book['price'])}
+        if full:
+            product.update({
+                'agregateRating': float(book['score']), 'votes': book['votes'],
+                'categories': [{'name': "Carte"}, {'name': book['category']}],
+                'attributes': [{'name': "Limba", 'value': "Romana"}, {'name': "Data publicarii", 'value': book['year']},
+                               {'name': "Editura", 'value': book['publisher']},
+                               {'name': "Nr. pagini", 'value': book['pages']},
+                               {'name': "Tip coperta", 'value': "Paperback"}],
+            })
+        return product
+
+    def carturesti_api_search(self, search_query):
+        products = [self.carturesti_api_product(book_for(d), full=False) for d in decoys(search_query)]
+        if search_query.strip():
+            # The query is "title author" and the mock cannot tell them apart, so the
+            # wanted book has no authors and is matched on title and author together
+            wanted = self.carturesti_api_product(book_for(search_query), full=False)
+            del wanted['authors']
+            products.insert(0, wanted)
+        return {'total': len(products), 'products': products}
+
+
+def decoys(title):
+    # Near misses every search returns next to the wanted book
+    title = title.strip() or "carte"
+    return [f"{title} vol. 2", f"{listing_title('decoy', title)} {title.split()[0]}"]
+
+
+class MockStoreHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out as separate writes; with Nagle on, keep-alive
+    # clients would wait for a delayed ACK (~40 ms) on every request
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        store = self.server.store
+        faults = store.faults
+        store.count('requests')
+        time.sleep(faults.delay())
+
+        if faults.throttled():
+            store.count('throttled')
+            self.send_text(429, "Too Many Requests", {'Retry-After': '1'})
+            return
+        outcome = faults.outcome()
+        if outcome == 'drop':
+            store.count('dropped')
+            self.close_connection = True
+            self.connection.close()
+            return
+        if outcome == 'error':
+            store.count('errors')
+            self.send_text(503, "Service Unavailable")
+            return
+
+        cookies = self.headers.get('Cookie', '')
+        response = store.respond(self.path, cookies)
+        if response is None:
+            self.send_text(404, "Not Found")
+        elif response[1].lstrip()[:1] in ('{', '['):
+            self.send_text(*response, content_type='application/json; charset=utf-8')
+        else:
+            self.send_text(*response, content_type='text/html; charset=utf-8')
+
+    def send_text(self, status, body, headers=None, content_type='text/plain; charset=utf-8'):
+        data = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_stores(stores=MOCK_STORES, port=MOCK_PORT, host='127.0.0.1', faults=None, listing_pages=LISTING_PAGES,
+                 archive_root=ARCHIVE_DIR):
+    """Start one mock server per store on consecutive ports, each on a daemon thread.
+
+    Returns {store: server}; server.store is its MockStore and
+    server.base_url the value for SCRAPE_<STORE>_URL.
+    """
+    servers = {}
+    for store in stores:
+        # port=0 picks free ports
+        server_port = port + MOCK_STORES.index(store) if port else 0
+        server = http.server.ThreadingHTTPServer((host, server_port), MockStoreHandler)
+        server.daemon_threads = True
+        server.base_url = f"http://{host}:{server.server_address[1]}"
+        server.store = MockStore(store, server.base_url, faults or Faults(), listing_pages, archive_root)
+        threading.Thread(target=server.serve_forever, name=f"mock-{store}", daemon=True).start()
+        servers[store] = server
+    return servers
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve local copies of the bookstores for testing the scrapers.")
+    parser.add_argument('--stores', nargs='+', default=MOCK_STORES, choices=MOCK_STORES)
+    parser.add_argument('--port', type=int, default=MOCK_PORT,
+                        help="Port of libris; bookline and carturesti use the next two")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Mean response delay in seconds")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Share of requests answered with 503")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="Share of requests whose connection is closed without an answer")
+    parser.add_argument('--throttle', type=float,
+                        help="Requests per second above which a store answers 429")
+    parser.add_argument('--listing-pages', type=int, default=LISTING_PAGES,
+                        help="Synthetic listing pages per Libris year and for Bookline")
+    parser.add_argument('--archive', default=ARCHIVE_DIR,
+                        help="HTML archive whose recorded pages are replayed")
+    parser.add_argument('--no-replay', action='store_true',
+                        help="Only serve synthetic pages")
+    args = parser.parse_args()
+
+    faults = Faults(args.latency, args.error_rate, args.drop_rate, args.throttle)
+    servers = serve_stores(args.stores, args.port, faults=faults, listing_pages=args.listing_pages,
+                           archive_root=None if args.no_replay else args.archive)
+    for store, server in servers.items():
+        recorded = len(server.store.recorded) if server.store.recorded else 0
+        print(f"{store}: {server.base_url} ({recorded} recorded pages)")
+        print(f"  export SCRAPE_{store.upper()}_URL={server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for store, server in servers.items():
+            print(f"{store}: {server.store.stats}")
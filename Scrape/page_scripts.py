@@ -0,0 +1,124 @@
+# In-page scripts for the Selenium scrapers. Each one collects everything a
+# scraper needs from a page in a single execute_script round-trip, instead of
+# one WebDriver call per element, attribute or text.
+
+LIBRIS_SEARCH_RESULTS = """
+return Array.from(document.getElementsByClassName('pr-title-categ-pg')).map(function (title) {
+    var container = title.closest('div[class*="pr-history-item"]');
+    var link = container ? container.querySelector('a') : null;
+    var anchor = title.closest('a[href]');
+    return {
+        title: title.innerText,
+        href: title.getAttribute('href') || (link && link.getAttribute('href')) || (anchor && anchor.getAttribute('href')),
+        price: link ? link.getAttribute('data-price') : null,
+        element: title
+    };
+});
+"""
+
+
+def libris_search_results(driver):
+    """Every result on a Libris search page as {'title', 'href', 'price', 'element'}.
+
+    element is the title's WebElement, so the match can be clicked without
+    looking it up again.
+    """
+    results = driver.execute_script(LIBRIS_SEARCH_RESULTS) or []
+    for result in results:
+        result['title'] = result['title'] or ""
+        result['price'] = result['price'] or "null"
+    return results
+
+
+BOOKLINE_SEARCH_RESULTS = """
+return Array.from(document.getElementsByClassName('c-product-title')).map(function (title) {
+    var product = title.closest('div[class*="t-product-detailed"]');
+    var publisher = product ? product.querySelector('[class*="o-product__publisher"]') : null;
+    var authors = product ? product.querySelector('[class*="o-product__authors"]') : null;
+    return {
+        title: title.innerText,
+        author: authors ? authors.innerText : '',
+        publisher: publisher ? publisher.innerText : '',
+        element: title
+    };
+});
+"""
+
+CARTURESTI_SEARCH_RESULTS = """
+return Array.from(document.querySelectorAll('a.clean-a.select-item-event[data-ng-click*="onProductClick"]')).map(function (link) {
+    return {href: link.href, element: link};
+});
+"""
+
+
+def bookline_search_results(driver):
+    """Every result on a Bookline search page as {'title', 'author', 'publisher', 'element'}."""
+    results = driver.execute_script(BOOKLINE_SEARCH_RESULTS) or []
+    for result in results:
+        result['title'] = strip_text(result['title'])
+        result['author'] = strip_text(result['author'])
+        result['publisher'] = strip_text(result['publisher'])
+    return results
+
+def carturesti_search_results(driver):
+    """Every product link on a Carturesti search page as {'href', 'element'}, in page order."""
+    return [result for result in driver.execute_script(CARTURESTI_SEARCH_RESULTS) or [] if result['href']]
+
+
+# arguments[0] is the categ-prod-list element libris.py already waited for
+LIBRIS_LISTING_ITEMS = """
+return Array.from(arguments[0].getElementsByClassName('categ-prod-item')).map(function (item, index) {
+    var title = item.getElementsByClassName('pr-title-categ-pg')[0];
+    var link = item.querySelector('a');
+    return {
+        position: index + 1,
+        title: title ? title.innerText : null,
+        url: link ? link.href : null,
+        price: link ? link.getAttribute('data-price') : null,
+        attributes: {'data-product-id': item.getAttribute('data-product-id'), 'data-id': item.getAttribute('data-id')}
+    };
+});
+"""
+
+# arguments[0] is the list of product blocks bookline_books.py already waited for
+BOOKLINE_LISTING_ITEMS = """
+return arguments[0].map(function (product, index) {
+    var title = product.getElementsByClassName('c-product-title')[0];
+    var link = title ? title.querySelector('a') : null;
+    var authors = product.getElementsByClassName('o-product__authors')[0];
+    var price = product.querySelector('.o-prices-block__price1 .price, .price');
+    return {
+        position: index + 1,
+        title: link ? link.innerText : null,
+        author: authors ? authors.innerText : '',
+        url: link ? link.href : '',
+        price: price ? price.innerText : null
+    };
+});
+"""
+
+
+def strip_text(value):
+    # WebElement.text trims the rendered text; innerText does not
+    return value.strip() if value else ""
+
+def libris_listing_items(driver, products_list):
+    """Every categ-prod-item of a Libris listing page as one dict each.
+
+    title is "" when the item has no title element and url is None when it
+    has no link, the two cases the per-element loop reported as errors.
+    """
+    items = driver.execute_script(LIBRIS_LISTING_ITEMS, products_list) or []
+    for item in items:
+        item['title'] = strip_text(item['title'])
+        item['price'] = item['price'] or ""
+    return items
+
+def bookline_listing_items(driver, products):
+    """Title link, authors, price and position of every Bookline product block."""
+    items = driver.execute_script(BOOKLINE_LISTING_ITEMS, products) or []
+    for item in items:
+        item['title'] = strip_text(item['title'])
+        item['author'] = strip_text(item['author'])
+        item['price'] = strip_text(item['price'])
+    return items
@@ -0,0 +1,62 @@
+import csv
+import os
+import re
+from urllib.parse import urlsplit, urljoin, parse_qs
+
+# Product URLs captured by the listing scrapers, so the detail scrapers can
+# open a book directly instead of searching for its title
+LIBRIS_URLS_FILE = 'Data/Libris/libris_title_urls.csv'
+LIBRIS_URL_FIELDNAMES = ['year', 'page', 'title', 'url', 'product_id', 'price']
+
+ID_ATTRIBUTES = ['data-product-id', 'data-id', 'data-sku']
+
+
+def product_id_from_url(url):
+    """Best-effort product ID: an id= query parameter (Bookline) or the last number in the path."""
+    if not url:
+        return ""
+    parts = urlsplit(url)
+    query = parse_qs(parts.query)
+    if 'id' in query:
+        return query['id'][0]
+    numbers = re.findall(r'\d+', parts.path)
+    return numbers[-1] if numbers else ""
+
+def rebase_url(base_url, url):
+    """Point a saved product URL (or a relative href) at base_url, e.g. a local fixture server."""
+    parts = urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+    return urljoin(base_url + "/", path)
+
+def product_id(url, attributes):
+    # Prefer an explicit data attribute of the product element
+    for name in ID_ATTRIBUTES:
+        if attributes.get(name):
+            return attributes[name]
+    return product_id_from_url(url)
+
+def existing_fieldnames(path, fieldnames):
+    """Return the header already in a CSV file, or fieldnames for a new/empty file.
+
+    Listing files started before the url columns existed keep their old
+    layout instead of getting rows that do not match their header.
+    """
+    if os.path.exists(path) and os.path.getsize(path) > 0:
+        with open(path, 'r', encoding='utf-8') as f:
+            header = next(csv.reader(f, delimiter=';'), None)
+        if header:
+            if header != fieldnames:
+                print(f"{path} has no url columns; new rows keep the old layout")
+            return header
+    return fieldnames
+
+def load_url_index(path, key='title'):
+    """Map key -> row for a file with url columns (first occurrence wins)."""
+    index = {}
+    if not os.path.exists(path):
+        return index
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f, delimiter=';'):
+            if row.get('url') and row[key] not in index:
+                index[row[key]] = row
+    return index
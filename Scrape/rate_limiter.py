@@ -0,0 +1,266 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from store_config import STORE_URLS, DEFAULT_RATE_LIMIT, RATE_LIMITS
+
+RATE_STATS_FILE = 'Scrape/rate_limits.json'
+# Live bucket state, one row per host, shared by every scraper process
+RATE_DB = 'Scrape/work_queue.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    host TEXT PRIMARY KEY,
+    rate REAL NOT NULL,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL,
+    paused_until REAL NOT NULL DEFAULT 0,
+    last_decrease REAL NOT NULL DEFAULT 0
+);
+"""
+
+# Responses that mean "slow down": rate limited, or the server is struggling
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+# HTTP status of the page the browser shows (0 when the browser does not report it)
+PAGE_STATUS_SCRIPT = """
+var entry = performance.getEntriesByType('navigation')[0];
+return entry && entry.responseStatus ? entry.responseStatus : 0;
+"""
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+def store_of(host):
+    for store, url in STORE_URLS.items():
+        if host_of(url) == host:
+            return store
+    return None
+
+def is_timeout(error):
+    # aiohttp/asyncio, requests and Selenium each have their own timeout class
+    return isinstance(error, TimeoutError) or 'Timeout' in type(error).__name__
+
+def is_throttled(status=None, error=None):
+    return status in THROTTLE_STATUSES or (error is not None and is_timeout(error))
+
+def retry_after_seconds(value):
+    """Seconds asked for by a Retry-After header (a number or an HTTP date), or None."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class HostBucket:
+    """Token bucket of one host whose rate follows AIMD.
+
+    Every successful request adds increase / rate to the rate, i.e. `increase`
+    requests per second for each second of error-free traffic, up to max. A
+    timeout, 429 or 5xx multiplies it by `decrease` (at most once per
+    cooldown, so a burst of failures from requests already in flight counts
+    once), down to min. burst tokens can be spent back to back. Times are
+    wall-clock seconds, so the state can be shared between processes.
+    """
+
+    STATE = ['rate', 'tokens', 'updated', 'paused_until', 'last_decrease']
+
+    def __init__(self, host, config, rate=None):
+        self.host = host
+        self.config = config
+        self.rate = self.clamp(rate or config['start'])
+        self.tokens = float(config['burst'])
+        self.updated = time.time()
+        self.paused_until = 0.0
+        self.last_decrease = 0.0
+        self.stats = {'requests': 0, 'throttled': 0, 'decreases': 0, 'waited': 0.0, 'peak_rate': self.rate}
+
+    def clamp(self, rate):
+        return min(max(rate, self.config['min']), self.config['max'])
+
+    def load(self, row):
+        # The state another process left; this process's limits still apply
+        for field in self.STATE:
+            setattr(self, field, row[field])
+        self.rate = self.clamp(self.rate)
+
+    def state(self):
+        return [self.host] + [getattr(self, field) for field in self.STATE]
+
+    def reserve(self):
+        """Take a token and return how long to wait before using it."""
+        now = time.time()
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.config['burst'])
+        self.updated = now
+        self.tokens -= 1
+        # A negative balance is a token reserved ahead of time
+        delay = max(-self.tokens / self.rate, self.paused_until - now, 0.0)
+        self.stats['requests'] += 1
+        self.stats['waited'] += delay
+        return delay
+
+    def success(self):
+        self.rate = min(self.rate + self.config['increase'] / self.rate, self.config['max'])
+        self.stats['peak_rate'] = max(self.stats['peak_rate'], self.rate)
+
+    def throttle(self, reason, retry_after=None):
+        now = time.time()
+        self.stats['throttled'] += 1
+        if retry_after:
+            self.paused_until = max(self.paused_until, now + retry_after)
+        if now - self.last_decrease < self.config['cooldown']:
+            return
+        old_rate = self.rate
+        self.rate = max(self.rate * self.config['decrease'], self.config['min'])
+        self.last_decrease = now
+        self.stats['decreases'] += 1
+        print(f"{self.host}: {reason}, rate {old_rate:.2f} -> {self.rate:.2f} req/s")
+
+
+class RateLimiter:
+    """Politeness limits for every store, shared by all fetch paths and processes.
+
+    Call wait(host) (or await wait_async(host)) before a request and
+    record(host, ...) (or await record_async(host, ...)) with its outcome. A host's bucket lives in a row of
+    RATE_DB that every change reads and writes in one transaction, so the
+    browsers of a driver_pool.py run and the scrapers of different stores
+    together stay within one rate per host. A new host starts at the rate it
+    last sustained (kept in rate_limits.json) and settles at the highest rate
+    it answers without throttling. Limits come from
+    store_config.DEFAULT_RATE_LIMIT and RATE_LIMITS, and
+    overrides={host: {'max': ...}} for one run.
+    """
+
+    def __init__(self, overrides=None, stats_path=RATE_STATS_FILE, db_path=RATE_DB):
+        self.overrides = overrides or {}
+        self.stats_path = stats_path
+        self.db_path = db_path
+        self.db = None
+        self.saved = load_rates(stats_path)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def config_for(self, host):
+        config = dict(DEFAULT_RATE_LIMIT)
+        config.update(RATE_LIMITS.get(store_of(host), {}))
+        config.update(self.overrides.get(host, {}))
+        return config
+
+    def bucket(self, host):
+        if host not in self.buckets:
+            saved = self.saved.get(host, {}).get('rate')
+            self.buckets[host] = HostBucket(host, self.config_for(host), saved)
+        return self.buckets[host]
+
+    def connect(self):
+        # Opened on first use; fetchers that are never used create no database
+        if self.db is None:
+            self.db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None, check_same_thread=False)
+            self.db.row_factory = sqlite3.Row
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.executescript(SCHEMA)
+        return self.db
+
+    def shared(self, host, update):
+        """Return update(bucket) run on the host's bucket as every process sees it."""
+        with self.lock:
+            db = self.connect()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                bucket = self.bucket(host)
+                row = db.execute("SELECT * FROM rate_limits WHERE host = ?", (host,)).fetchone()
+                if row is not None:
+                    bucket.load(row)
+                result = update(bucket)
+                db.execute("INSERT OR REPLACE INTO rate_limits (host, rate, tokens, updated, paused_until, "
+                           "last_decrease) VALUES (?, ?, ?, ?, ?, ?)", bucket.state())
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return result
+
+    def reserve(self, host):
+        return self.shared(host, HostBucket.reserve)
+
+    def wait(self, host):
+        delay = self.reserve(host)
+        if delay:
+            time.sleep(delay)
+
+    async def wait_async(self, host):
+        # The shared bucket's transaction can wait on another process's lock,
+        # so it runs in a thread instead of blocking the event loop
+        delay = await asyncio.to_thread(self.reserve, host)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def record(self, host, status=None, error=None, retry_after=None):
+        """Adjust the host's rate after a request; returns True if it was throttled."""
+        throttled = is_throttled(status, error)
+        if throttled:
+            reason = f"HTTP {status}" if status in THROTTLE_STATUSES else type(error).__name__
+            self.shared(host, lambda bucket: bucket.throttle(reason, retry_after_seconds(retry_after)))
+        elif error is None:
+            self.shared(host, HostBucket.success)
+        return throttled
+
+    async def record_async(self, host, status=None, error=None, retry_after=None):
+        """record() for async fetchers, off the event loop like wait_async()."""
+        return await asyncio.to_thread(self.record, host, status, error, retry_after)
+
+    def record_page(self, host, driver, error=None):
+        """record() for a browser page load, with the status the browser received."""
+        try:
+            status = driver.execute_script(PAGE_STATUS_SCRIPT)
+        except Exception:
+            status = None
+        return self.record(host, status, error)
+
+    def rates(self):
+        return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+    def report(self):
+        for host, bucket in sorted(self.buckets.items()):
+            stats = bucket.stats
+            print(f"{host}: {bucket.rate:.2f} req/s now (peak {stats['peak_rate']:.2f}), "
+                  f"{stats['requests']} requests, {stats['throttled']} throttled, "
+                  f"{stats['decreases']} slowdowns, {stats['waited']:.0f} s paced")
+
+    def save(self):
+        # Re-read first so the other stores' scrapers running in parallel are kept
+        rates = load_rates(self.stats_path)
+        for host, bucket in self.buckets.items():
+            rates[host] = {'rate': round(bucket.rate, 3), 'updated_at': time.time()}
+        temp_path = f"{self.stats_path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(rates, f, indent=1)
+        os.replace(temp_path, self.stats_path)
+
+    def close(self):
+        if self.buckets:
+            self.report()
+            self.save()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def load_rates(path=RATE_STATS_FILE):
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            return json.load(f)
+    return {}
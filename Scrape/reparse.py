@@ -0,0 +1,108 @@
+import argparse
+import time
+import os
+import csv
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from store_config import LIBRIS_FIELDNAMES, BOOKLINE_FIELDNAMES, BOOKLINE_DETAILS_FIELDNAMES, CARTURESTI_FIELDNAMES
+from extractors import (parse_libris_book_page, parse_bookline_book_page, parse_carturesti_book_page,
+                        parse_carturesti_api_product)
+from html_archive import ARCHIVE_DIR, HtmlArchive, read_object
+
+BOOKLINE_DEFAULTS = {'pages': "N/A", 'edition': "N/A", 'code': "N/A", 'category': "N/A"}
+
+# Archive dataset -> how its book_details rows were built by the scraper.
+# Rows are the defaults, then the archived context (year/page/title/...),
+# then whatever the parser finds on the page.
+DATASETS = {
+    'libris_details': {
+        'parser': parse_libris_book_page,
+        'fieldnames': LIBRIS_FIELDNAMES,
+        'missing': "null",
+        'defaults': {},
+        'output': 'Data/Libris/book_details_reparsed.csv',
+    },
+    'bookline_details2': {
+        'parser': parse_bookline_book_page,
+        'fieldnames': BOOKLINE_FIELDNAMES,
+        'missing': "null",
+        'defaults': BOOKLINE_DEFAULTS,
+        'output': 'Data/Bookline/Book_bookdetails2_reparsed.csv',
+    },
+    'bookline_details': {
+        'parser': parse_bookline_book_page,
+        'fieldnames': BOOKLINE_DETAILS_FIELDNAMES,
+        'missing': "null",
+        'defaults': BOOKLINE_DEFAULTS,
+        'output': 'Data/Bookline/book_details_reparsed.csv',
+    },
+    'carturesti_details': {
+        'parser': parse_carturesti_book_page,
+        'fieldnames': CARTURESTI_FIELDNAMES,
+        'missing': "N/A",
+        'defaults': {},
+        'output': 'Data/Carturesti/book_details_reparsed.csv',
+    },
+    'carturesti_api': {
+        'parser': parse_carturesti_api_product,
+        'fieldnames': CARTURESTI_FIELDNAMES,
+        'missing': "N/A",
+        'defaults': {},
+        'output': 'Data/Carturesti/book_details_api_reparsed.csv',
+    },
+}
+
+def format_runtime(seconds):
+    return str(timedelta(seconds=int(seconds)))
+
+def reparse_page(job):
+    # Runs in a worker process: read one archived page and build its row
+    dataset, root, page = job
+    config = DATASETS[dataset]
+    book_details = {field: config['missing'] for field in config['fieldnames']}
+    book_details.update(config['defaults'])
+    book_details.update(page['context'])
+    try:
+        book_details.update(config['parser'](read_object(root, page['sha256'])))
+    except Exception as e:
+        return None, f"{page['url']}: {e}"
+    return book_details, None
+
+def reparse(dataset, output=None, root=ARCHIVE_DIR, workers=None):
+    """Rebuild a book details file from the archive only; nothing is fetched."""
+    config = DATASETS[dataset]
+    output = output or config['output']
+    archive = HtmlArchive(root)
+    pages = archive.latest(dataset)
+    archive.close()
+    print(f"{len(pages)} archived pages in {dataset}")
+
+    start_time = time.time()
+    written, errors = 0, 0
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=config['fieldnames'], delimiter=';', extrasaction='ignore')
+        writer.writeheader()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            jobs = ((dataset, root, page) for page in pages)
+            # map keeps the archive order, so rows come out in scrape order
+            for book_details, error in executor.map(reparse_page, jobs, chunksize=64):
+                if error:
+                    print(f"Error parsing {error}")
+                    errors += 1
+                    continue
+                writer.writerow(book_details)
+                written += 1
+
+    print(f"Wrote {written} rows to {output} ({errors} errors) in {format_runtime(time.time() - start_time)}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Regenerate a book details file from the HTML archive, offline.")
+    parser.add_argument('dataset', choices=list(DATASETS))
+    parser.add_argument('--output', help="CSV file to write (overwritten), e.g. Data/Libris/book_details.csv")
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help="Archive directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Parser processes")
+    args = parser.parse_args()
+
+    reparse(args.dataset, args.output, args.archive, args.workers)
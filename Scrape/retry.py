@@ -0,0 +1,93 @@
+import asyncio
+import random
+import time
+
+from rate_limiter import is_timeout
+
+# What went wrong with a title; only transient failures are worth another try
+TRANSIENT = 'transient'    # Timeouts, stale elements, dropped connections, 429/5xx
+NOT_FOUND = 'not_found'    # The store has no match for the title
+PARSE_ERROR = 'parse_error'  # The page (or the input row) is not in the expected shape
+
+# Libraries whose own exceptions are all about the browser or the connection
+TRANSIENT_MODULES = ('selenium', 'requests', 'urllib3', 'aiohttp')
+
+RETRY_ATTEMPTS = 3
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 30.0
+
+
+class NotFound(Exception):
+    """The store has no match for the title; it is recorded once and not searched again."""
+
+class ParseError(Exception):
+    pass
+
+
+def classify(error):
+    if isinstance(error, NotFound):
+        return NOT_FOUND
+    if isinstance(error, ParseError):
+        return PARSE_ERROR
+    # HTTP errors of aiohttp (status) and requests (response.status_code)
+    status = getattr(error, 'status', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    if status in (404, 410):
+        return NOT_FOUND
+    if is_timeout(error) or isinstance(error, OSError) or type(error).__module__.split('.')[0] in TRANSIENT_MODULES:
+        return TRANSIENT
+    if isinstance(error, (ValueError, IndexError, KeyError, AttributeError)):
+        return PARSE_ERROR
+    return TRANSIENT
+
+def backoff_delay(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """Exponential backoff with full jitter: up to base * 2**(attempt - 1) seconds, at most cap."""
+    return random.uniform(0, min(cap, base * 2 ** (attempt - 1)))
+
+def first_line(error):
+    return (str(error) or type(error).__name__).split('\n')[0]
+
+def retry_message(error, attempt, attempts, delay):
+    return f"Attempt {attempt}/{attempts} failed ({first_line(error)}), retrying in {delay:.1f} s"
+
+def retry_call(func, *args, attempts=RETRY_ATTEMPTS, before_retry=None, **kwargs):
+    """Call func(*args, **kwargs), retrying transient failures with backoff.
+
+    before_retry(error) runs before each new attempt (e.g. reload the store's
+    home page). Not-found and parse errors, and the last transient one, are
+    raised; classify() tells the caller which kind it was.
+    """
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or classify(e) != TRANSIENT:
+                raise
+            delay = backoff_delay(attempt)
+            print(retry_message(e, attempt, attempts, delay))
+            time.sleep(delay)
+            if before_retry:
+                before_retry(e)
+
+async def retry_async(func, *args, attempts=RETRY_ATTEMPTS, **kwargs):
+    """retry_call() for a coroutine function."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or classify(e) != TRANSIENT:
+                raise
+            delay = backoff_delay(attempt)
+            print(retry_message(e, attempt, attempts, delay))
+            await asyncio.sleep(delay)
+
+def no_results(driver, error, message="No search results"):
+    """The exception to raise when a wait for search results timed out.
+
+    If the page finished loading the search found nothing (NotFound);
+    otherwise the page was just slow and error stays transient.
+    """
+    try:
+        loaded = driver.execute_script("return document.readyState") == 'complete'
+    except Exception:
+        loaded = False
+    return NotFound(message) if loaded else error
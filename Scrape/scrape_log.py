@@ -0,0 +1,74 @@
+import logging
+import logging.handlers
+import os
+import sys
+import time
+
+# SCRAPE_LOG_LEVEL=DEBUG also logs every extracted field
+LOG_LEVEL = os.environ.get('SCRAPE_LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+# Records are written in batches: when this many are buffered, after
+# FLUSH_SECONDS, or at once for warnings and errors
+BUFFER_RECORDS = 100
+FLUSH_SECONDS = 5.0
+
+
+def format_value(value):
+    text = str(value)
+    if not text or any(c in text for c in ' ="'):
+        return '"' + text.replace('\\', '\\\\').replace('"', '\\"') + '"'
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """The usual log line followed by the record's fields as key=value pairs."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={format_value(value)}" for key, value in fields.items())
+        return line
+
+
+class BufferedHandler(logging.handlers.MemoryHandler):
+    # MemoryHandler that also flushes when the buffer is FLUSH_SECONDS old
+    def __init__(self, target):
+        super().__init__(BUFFER_RECORDS, flushLevel=logging.WARNING, target=target)
+        self.last_flush = time.monotonic()
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or time.monotonic() - self.last_flush >= FLUSH_SECONDS
+
+    def flush(self):
+        super().flush()
+        self.last_flush = time.monotonic()
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """log.info("title done", position=12, title=...) puts the keywords in the record's fields."""
+
+    def process(self, msg, kwargs):
+        fields = {key: kwargs.pop(key) for key in list(kwargs)
+                  if key not in ('exc_info', 'stack_info', 'stacklevel', 'extra')}
+        kwargs['extra'] = dict(kwargs.get('extra') or {}, fields=fields)
+        return msg, kwargs
+
+
+def setup_logging(level=LOG_LEVEL):
+    root = logging.getLogger('scrape')
+    if root.handlers:
+        return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(KeyValueFormatter(LOG_FORMAT))
+    root.addHandler(BufferedHandler(stream))
+    root.setLevel(level)
+    root.propagate = False
+
+def get_logger(name):
+    setup_logging()
+    return StructuredLogger(logging.getLogger(f'scrape.{name}'), {})
+
+def flush_logs():
+    for handler in logging.getLogger('scrape').handlers:
+        handler.flush()
@@ -0,0 +1,111 @@
+# Store endpoints and file layouts shared by the browserless scrapers, the async
+# crawl engine and reparse.py
+import os
+
+LIVE_STORE_URLS = {
+    'libris': "https://www.libris.ro",
+    'bookline': "https://bookline.ro",
+    'carturesti': "https://carturesti.ro",
+}
+
+# SCRAPE_LIBRIS_URL=http://127.0.0.1:8801 (and _BOOKLINE_, _CARTURESTI_) points
+# every scraper at another copy of the store, e.g. mock_store.py
+STORE_URLS = {store: os.environ.get(f"SCRAPE_{store.upper()}_URL", url).rstrip('/')
+              for store, url in LIVE_STORE_URLS.items()}
+
+# Search URLs, filled in with the url-quoted query
+SEARCH_PATHS = {
+    'libris': "/search?q={query}",  # Target of the autoComplete search form
+    'bookline': "/search/search.action?searchfield={query}",
+    'carturesti': "/product/search/{query}",
+}
+
+# JSON endpoints behind the Carturesti product pages, used by carturesti_scrape_api.py
+# and served by mock_store.py. carturesti_scrape_api.py --capture records the
+# ones the live Angular app calls to CARTURESTI_API_FILE, which overrides these.
+CARTURESTI_API_PATHS = {
+    'search': "/api/search?q={query}",
+    'product': "/api/product/{product_id}",
+}
+CARTURESTI_API_FILE = 'Scrape/Carturesti/api_endpoints.json'
+
+# Listing URLs used by libris.py and bookline_books.py
+LIBRIS_LISTING_PATH = "/carti?ft&fsv_77563={filter_value}&iv.pg={page}&isf=1"
+BOOKLINE_LISTING_PATH = "/search/search.action?page={page}&searchfield=*"
+# bookline_sorted.py: sorted by copies sold ("Eladott darabszám szerint") and
+# filtered to books ("Könyv") or antiquarian books ("Antikvár") through the
+# URL instead of the sort menu and filter checkboxes, so any page can be
+# opened directly. The parameter names are unverified: the scraper checks
+# the active sort and filter on every page and, if the site ignored them,
+# sets both by clicking and uses the address the site shows instead.
+BOOKLINE_SORTED_LISTING_PATH = BOOKLINE_LISTING_PATH + "&orderBy=SOLD_COUNT&type={product_type}"
+BOOKLINE_FILTERS = {'books': 'KONYV', 'antiquarian': 'ANTIKVAR'}
+# Sharded Libris listing (crawl_all.py listing --shard-pages): years with more
+# pages than --split-pages are crawled once per price band, this filter being
+# appended to LIBRIS_LISTING_PATH. The parameter name is a guess at the price
+# slider's query string; check it against the live category page before use.
+# A split year's titles are written band by band, its page column numbered on
+# across the bands (merge_libris_shards), not the unfiltered listing's pages.
+LIBRIS_PRICE_FILTER = "&pf={low}-{high}"
+LIBRIS_PRICE_BANDS = [(0, 25), (25, 40), (40, 60), (60, 100), (100, 100000)]
+LIBRIS_SHARD_PLAN = 'Scrape/Libris/listing_shards.json'
+
+# Columns of the book details files written by the detail scrapers
+LIBRIS_FIELDNAMES = ['year', 'page', 'title', 'average_score', 'votes', 'price',
+                     'categories', 'author', 'publisher', 'cover_type',
+                     'publication_year', 'num_pages', 'format', 'code']
+BOOKLINE_FIELDNAMES = ['page', 'rank', 'title', 'author', 'publisher', 'price', 'score', 'reviews', 'language',
+                       'pages', 'edition', 'code', 'category']  # bl_scr_det2.py
+BOOKLINE_DETAILS_FIELDNAMES = ['page', 'title', 'author', 'publisher', 'price', 'score', 'reviews', 'language',
+                               'pages', 'edition', 'code', 'category']  # bookline_scrape_details.py
+CARTURESTI_FIELDNAMES = ['title', 'author', 'score', 'reviews', 'price', 'category_1',
+                         'category_2', 'category_3', 'category_4', 'language', 'publish_date',
+                         'publisher', 'pages', 'translator', 'edition']
+
+# Default number of simultaneous requests per host
+DEFAULT_HOST_CONCURRENCY = 4
+
+# Request pacing per host (requests per second) used by rate_limiter.py.
+# The rate starts at 'start' (or the rate the host last sustained), grows by
+# 'increase' req/s per second without errors and is multiplied by 'decrease'
+# on a timeout, 429 or 5xx, at most once per 'cooldown' seconds.
+DEFAULT_RATE_LIMIT = {'start': 2.0, 'min': 0.2, 'max': 10.0, 'increase': 0.1,
+                      'decrease': 0.5, 'cooldown': 2.0, 'burst': 2}
+# Per-store overrides of DEFAULT_RATE_LIMIT, e.g. {'bookline': {'max': 5.0}}
+RATE_LIMITS = {}
+
+# First local port of the scrapers' Prometheus /metrics endpoint (metrics.py)
+METRICS_PORT = 9470
+
+# Product pages the browser detail scrapers load ahead in background tabs while
+# they parse and write the current title (SCRAPE_PREFETCH_TABS=3; 0 is off), and
+# the seconds a tab may take before the page is loaded in the main tab instead
+PREFETCH_TABS = int(os.environ.get('SCRAPE_PREFETCH_TABS', 0))
+PREFETCH_TIMEOUT = 30
+
+# The browser's performance log is only kept when the "transferred" figures of
+# the scrapers' logs are wanted (SCRAPE_NETWORK_LOG=1): page_bytes() drains it
+# once per title, and it grows until then
+NETWORK_LOG = os.environ.get('SCRAPE_NETWORK_LOG', '') == '1'
+
+# driver_watchdog.py restarts a detail scraper's browser after BROWSER_MAX_PAGES
+# titles, above BROWSER_MAX_RSS_MB of memory (needs psutil), when a trivial command
+# takes over BROWSER_MAX_LATENCY seconds, or when one title runs for BROWSER_STALL_SECONDS
+BROWSER_MAX_PAGES = 500
+BROWSER_MAX_RSS_MB = 1500
+BROWSER_MAX_LATENCY = 5.0
+BROWSER_STALL_SECONDS = 300
+
+# Minimum title_matching score (0-1) for a search result to count as the wanted book
+TITLE_MATCH_THRESHOLD = 0.85
+
+HEADERS = {
+    'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                  "(KHTML, like Gecko) Chrome/124.0 Safari/537.36 Edg/124.0",
+    'Accept-Language': "ro-RO,ro;q=0.9,hu;q=0.8,en;q=0.7",
+}
+
+def libris_year_filter(year):
+    # The fsv_77563 filter value decreases by 1 for each year
+    filter_base = 820 - (year - 2002)
+    return f"000{filter_base}{year}"
@@ -0,0 +1,123 @@
+import time
+from collections import deque
+
+from selenium.common.exceptions import WebDriverException
+
+from browser_factory import setup_tab
+from scrape_log import get_logger
+
+log = get_logger('tab_prefetch')
+
+
+def with_lookahead(items, depth):
+    """Yield (item, the next depth items) pairs; the upcoming items are taken (leased) early."""
+    upcoming = deque()
+    for item in items:
+        upcoming.append(item)
+        if len(upcoming) > depth:
+            current = upcoming.popleft()
+            yield current, list(upcoming)
+    while upcoming:
+        current = upcoming.popleft()
+        yield current, list(upcoming)
+
+
+class TabPrefetcher:
+    """Product pages of the next titles, loading in background tabs of the same browser.
+
+    prefetch(url) opens a tab and starts loading url without waiting for it,
+    so the page loads while the scraper parses and writes the current title.
+    take(url) switches to that tab once it finished loading; release() closes
+    it and goes back to the main tab. keep(urls) closes the tabs of titles
+    the scraper moved past without taking them. A tab that is still loading after
+    timeout seconds, or that crashed, is closed and take() returns False, so
+    the scraper loads the page itself in the main tab instead.
+    """
+
+    def __init__(self, driver, depth, timeout, before_load=None):
+        self.driver = driver
+        self.depth = depth
+        self.timeout = timeout
+        # Called before each background load, e.g. to wait for the rate limiter
+        self.before_load = before_load
+        self.main = driver.current_window_handle
+        self.tabs = {}  # url -> (window handle, opened at)
+        self.stats = {'prefetched': 0, 'used': 0, 'timed_out': 0, 'failed': 0}
+
+    def prefetch(self, url):
+        if url in self.tabs or len(self.tabs) >= self.depth:
+            return
+        if self.before_load:
+            self.before_load()
+        current = self.driver.current_window_handle
+        try:
+            self.driver.switch_to.new_window('tab')
+            handle = self.driver.current_window_handle
+            # The main tab's URL blocking does not carry over to a new tab
+            setup_tab(self.driver)
+            # Assigning location returns at once, unlike driver.get()
+            self.driver.execute_script("window.location.href = arguments[0];", url)
+            self.tabs[url] = (handle, time.monotonic())
+            self.stats['prefetched'] += 1
+        except WebDriverException as e:
+            self.stats['failed'] += 1
+            log.warning("prefetch failed", url=url, error=str(e).split('\n')[0])
+        finally:
+            self.driver.switch_to.window(current)
+
+    def keep(self, urls):
+        """Close every prefetched tab whose url is not in urls (the current and upcoming titles)."""
+        for url in [url for url in self.tabs if url not in urls]:
+            handle, _ = self.tabs.pop(url)
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except WebDriverException:
+                pass  # Already gone
+        self.driver.switch_to.window(self.main)
+
+    def take(self, url):
+        """Switch to url's tab once its page has loaded; False if there is no usable tab."""
+        if url not in self.tabs:
+            return False
+        handle, opened_at = self.tabs.pop(url)
+        try:
+            self.driver.switch_to.window(handle)
+            while self.driver.execute_script("return document.readyState") != 'complete':
+                if time.monotonic() - opened_at > self.timeout:
+                    self.stats['timed_out'] += 1
+                    log.warning("prefetched tab timed out", url=url, seconds=f"{time.monotonic() - opened_at:.1f}")
+                    self.release()
+                    return False
+                time.sleep(0.1)
+        except WebDriverException as e:
+            self.stats['failed'] += 1
+            log.warning("prefetched tab failed", url=url, error=str(e).split('\n')[0])
+            self.release()
+            return False
+        self.stats['used'] += 1
+        return True
+
+    def release(self):
+        """Close the tab the scraper is on (unless it is the main one) and go back to the main tab."""
+        try:
+            if self.driver.current_window_handle != self.main:
+                self.driver.close()
+            self.driver.switch_to.window(self.main)
+        except WebDriverException:
+            pass  # Already gone, or the watchdog is restarting the browser
+
+    def reset(self):
+        # The browser was restarted (driver_watchdog.py): its tabs are gone
+        self.tabs.clear()
+        self.main = self.driver.current_window_handle
+
+    def close(self):
+        for handle, _ in self.tabs.values():
+            try:
+                self.driver.switch_to.window(handle)
+                self.driver.close()
+            except WebDriverException:
+                pass
+        self.tabs.clear()
+        self.driver.switch_to.window(self.main)
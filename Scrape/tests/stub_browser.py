@@ -0,0 +1,103 @@
+from lxml import html
+from selenium.webdriver.common.by import By
+
+from mock_store import CONSENT_COOKIE, MockStore, path_of
+from page_scripts import BOOKLINE_LISTING_ITEMS
+from rate_limiter import PAGE_STATUS_SCRIPT
+
+XPATHS = {
+    By.XPATH: lambda value: value,
+    By.ID: lambda value: f".//*[@id='{value}']",
+    By.TAG_NAME: lambda value: f".//{value}",
+    By.CLASS_NAME: lambda value: f".//*[contains(concat(' ', normalize-space(@class), ' '), ' {value} ')]",
+}
+
+
+def find_all(tree, by, value):
+    return [StubElement(element) for element in tree.xpath(XPATHS[by](value))]
+
+
+class StubElement:
+    """The parts of a WebElement the listing scrapers use, over an lxml element."""
+
+    def __init__(self, element):
+        self.element = element
+
+    @property
+    def text(self):
+        return self.element.text_content().strip()
+
+    def get_attribute(self, name):
+        return self.element.get(name)
+
+    def find_elements(self, by, value):
+        return find_all(self.element, by, value)
+
+    def find_element(self, by, value):
+        found = self.find_elements(by, value)
+        if not found:
+            raise Exception(f"No element {value}")
+        return found[0]
+
+    def is_displayed(self):
+        return True
+
+    def is_selected(self):
+        return False
+
+    def click(self):
+        pass
+
+
+class StubBrowser:
+    """A browser that serves a mock store's pages without Chrome.
+
+    Scripts the scrapers run are answered in Python; pages listed in
+    broken_once load empty the first time they are opened.
+    """
+
+    def __init__(self, store, broken_once=()):
+        self.store = MockStore(store, 'http://mock', archive_root=None)
+        self.broken_once = set(broken_once)
+        self.current_url = None
+        self.page_source = ""
+        self.tree = html.fromstring("<html></html>")
+        self.visited = []
+
+    def get(self, url):
+        self.current_url = url
+        path = path_of(url)
+        self.visited.append(path)
+        if path in self.broken_once:
+            self.broken_once.discard(path)
+            self.page_source = "<html><body></body></html>"
+        else:
+            self.page_source = self.store.respond(path, {CONSENT_COOKIE: 'accepted'})[1]
+        self.tree = html.fromstring(self.page_source)
+
+    def find_elements(self, by, value):
+        return find_all(self.tree, by, value)
+
+    def find_element(self, by, value):
+        return StubElement(self.tree).find_element(by, value)
+
+    def execute_script(self, script, *args):
+        if script == BOOKLINE_LISTING_ITEMS:
+            items = []
+            for index, product in enumerate(args[0]):
+                links = product.find_elements(By.XPATH, ".//*[contains(@class, 'c-product-title')]//a")
+                authors = product.find_elements(By.CLASS_NAME, 'o-product__authors')
+                items.append({'position': index + 1, 'title': links[0].text if links else None,
+                              'author': authors[0].text if authors else '',
+                              'url': links[0].get_attribute('href') if links else '', 'price': None})
+            return items
+        if script == PAGE_STATUS_SCRIPT:
+            return 200
+        # AdaptiveWait's network state, document.readyState
+        return ['complete', 0] if 'performance' in script else 'complete'
+
+    def execute_cdp_cmd(self, command, params):
+        return {}
+
+    def quit(self):
+        pass
@@ -0,0 +1,122 @@
+import csv
+import os
+import sys
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+import requests
+from selenium.webdriver.support.ui import WebDriverWait
+
+from extractors import bookline_listing_ended
+import retry
+from mock_store import BOOKLINE_PAGE_SIZE, serve_stores, path_of
+from rate_limiter import RateLimiter
+from store_config import STORE_URLS, BOOKLINE_LISTING_PATH, BOOKLINE_SORTED_LISTING_PATH
+from stub_browser import StubBrowser
+from work_queue import WorkQueue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Bookline'))
+import bookline_books  # noqa: E402
+import bookline_sorted  # noqa: E402
+
+LISTING_PAGES = 3
+
+
+@pytest.fixture(scope='module')
+def bookline():
+    server = serve_stores(['bookline'], port=0, listing_pages=LISTING_PAGES, archive_root=None)['bookline']
+    yield server.base_url
+    server.shutdown()
+
+
+def listing_page(base_url, page):
+    return requests.get(base_url + BOOKLINE_LISTING_PATH.format(page=page), timeout=10).text
+
+
+def test_listing_end_is_detected_past_the_last_page(bookline):
+    assert not bookline_listing_ended(listing_page(bookline, LISTING_PAGES))
+    assert bookline_listing_ended(listing_page(bookline, LISTING_PAGES + 1))
+
+
+def test_page_that_did_not_load_is_not_the_end():
+    # Neither products nor the "no results" message: retried, not taken as the end
+    assert not bookline_listing_ended("<html><body><div class='l-flex'></div></body></html>")
+
+
+class NoWait:
+    def __init__(self, driver, store):
+        pass
+
+    def until(self, *args, **kwargs):
+        return True
+
+    def close(self):
+        pass
+
+
+def stub_scraper(module, monkeypatch, browser):
+    # The listing scraper's browser, waits and rate limit, without Chrome
+    monkeypatch.setattr(module, 'create_driver', lambda **options: browser)
+    monkeypatch.setattr(module, 'restore_consent', lambda driver, store: True)
+    monkeypatch.setattr(module, 'AdaptiveWait', NoWait)
+    monkeypatch.setattr(module, 'WebDriverWait', lambda driver, timeout: WebDriverWait(driver, 0.01, poll_frequency=0.001))
+    monkeypatch.setattr(module, 'RateLimiter', lambda: RateLimiter({module.HOST: {'start': 1000.0, 'max': 1000.0}}))
+
+
+def test_range_past_the_last_page_finishes(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    browser = StubBrowser('bookline')
+    stub_scraper(bookline_books, monkeypatch, browser)
+    monkeypatch.setattr(bookline_books, 'LAST_PAGE', 10)
+
+    # A driver_pool shard planned past the end of the 3 mock pages
+    start, end = 2, 8
+    bookline_books.scrape_bookline(titles_file='titles.csv', start_page=start, end_page=end)
+
+    assert [parse_qs(urlsplit(path).query)['page'][0] for path in browser.visited] == ['2', '3', '4']
+    with open('titles.csv', newline='', encoding='utf-8') as f:
+        assert {row['page'] for row in csv.DictReader(f, delimiter=';')} == {'2', '3'}
+    queue = WorkQueue('bookline_listing')
+    assert queue.remaining(start, end) == 0
+    # Pages outside the shard are left to their own shards
+    assert queue.remaining() == 4
+    queue.close()
+
+
+def test_page_that_did_not_load_is_retried_in_place(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    browser = StubBrowser('bookline', broken_once=[path_of(STORE_URLS['bookline'] + BOOKLINE_LISTING_PATH.format(page=2))])
+    stub_scraper(bookline_books, monkeypatch, browser)
+    monkeypatch.setattr(bookline_books, 'LAST_PAGE', 10)
+    monkeypatch.setattr(retry, 'backoff_delay', lambda attempt: 0)
+
+    bookline_books.scrape_bookline(titles_file='titles.csv')
+
+    assert [parse_qs(urlsplit(path).query)['page'][0] for path in browser.visited] == ['1', '2', '2', '3', '4']
+    with open('titles.csv', newline='', encoding='utf-8') as f:
+        assert [int(row['page']) for row in csv.DictReader(f, delimiter=';')] == sorted(
+            page for page in range(1, LISTING_PAGES + 1) for _ in range(BOOKLINE_PAGE_SIZE))
+    queue = WorkQueue('bookline_listing')
+    assert queue.remaining() == 0 and not queue.failed_items()
+    queue.close()
+
+
+def test_sorted_listing_ranks_follow_the_pages(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    listing_url = STORE_URLS['bookline'] + BOOKLINE_SORTED_LISTING_PATH.format(page=1, product_type='KONYV')
+    # Page 2 fails once, so the work queue retries it after page 3
+    browser = StubBrowser('bookline', broken_once=[path_of(bookline_sorted.with_page(listing_url, 2))])
+    stub_scraper(bookline_sorted, monkeypatch, browser)
+    monkeypatch.setattr(bookline_sorted, 'listing_sorted', lambda driver, filter_label: True)
+    monkeypatch.setattr(bookline_sorted, 'LAST_PAGE', 10)
+
+    bookline_sorted.scrape_bookline('books', titles_file='titles.csv')
+
+    assert [parse_qs(urlsplit(path).query)['page'][0] for path in browser.visited] == ['1', '2', '3', '4', '2']
+    with open('titles.csv', newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    assert [int(row['page']) for row in rows] == sorted(int(row['page']) for row in rows)
+    assert [int(row['rank']) for row in rows] == list(range(1, LISTING_PAGES * BOOKLINE_PAGE_SIZE + 1))
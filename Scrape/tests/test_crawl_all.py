@@ -0,0 +1,170 @@
+import asyncio
+import csv
+import os
+from urllib.parse import parse_qs, urlsplit
+
+import crawl_all
+from html_archive import HtmlArchive
+from mock_store import MockStore, path_of
+from work_queue import WorkQueue
+
+
+class SlowFirstFetcher:
+    """Serves the mock Libris listing; earlier years take longer, so they finish last."""
+
+    def __init__(self):
+        self.store = MockStore('libris', 'http://mock', archive_root=None)
+
+    async def fetch(self, url):
+        year = int(parse_qs(urlsplit(url).query)['fsv_77563'][0][-4:])
+        await asyncio.sleep(0.01 * (2024 - year))
+        return self.store.respond(path_of(url), {})[1]
+
+
+def test_libris_listing_is_written_in_year_order(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    os.makedirs(tmp_path / 'Data' / 'Libris')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(crawl_all, 'LIBRIS_FIRST_YEAR', 2020)
+    monkeypatch.setattr(crawl_all, 'LIBRIS_LAST_YEAR', 2023)
+    archive = HtmlArchive(str(tmp_path / 'archive'))
+    asyncio.run(crawl_all.crawl_libris_listing(SlowFirstFetcher(), 'http://mock', 4, archive))
+    archive.close()
+    crawl_all.flush_logs()
+
+    with open('Data/Libris/libris_titles.txt', encoding='utf-8') as f:
+        keys = [tuple(int(part) for part in line.split(',', 2)[:2]) for line in f]
+    # 3 mock pages per year, the last one half full
+    assert len(keys) == 4 * 100
+    assert keys == sorted(keys)
+    assert WorkQueue('libris_listing').counts() == {'done': 4}
+
+
+def test_detail_rows_are_written_in_queue_order(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    queue = WorkQueue('test_details')
+    queue.seed((i, f"Title {i}", f"Title {i}") for i in range(12))
+
+    async def scrape_row(title):
+        # Later titles finish first; every fifth one is not found
+        position = int(title.split()[-1])
+        await asyncio.sleep(0.002 * (12 - position))
+        return None if position % 5 == 0 else {'title': title}
+
+    asyncio.run(crawl_all.crawl_details('test', queue, scrape_row, 'details.csv', ['title'], 4))
+    crawl_all.flush_logs()
+
+    with open('details.csv', newline='', encoding='utf-8') as f:
+        titles = [row['title'] for row in csv.DictReader(f, delimiter=';')]
+    assert titles == [f"Title {i}" for i in range(12) if i % 5]
+    assert WorkQueue('test_details').counts() == {'done': 9, 'failed': 3}
+
+
+class PriceFilterFetcher(SlowFirstFetcher):
+    """The mock listing with a working price filter: only the first band has titles."""
+
+    async def fetch(self, url):
+        if '&pf=' in url and '&pf=0-' not in url:
+            url = url.replace('iv.pg=', 'iv.pg=99')
+        return self.store.respond(path_of(url), {})[1]
+
+
+def test_sharding_aborts_when_price_filter_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(crawl_all, 'LIBRIS_FIRST_YEAR', 2023)
+    monkeypatch.setattr(crawl_all, 'LIBRIS_LAST_YEAR', 2023)
+
+    # The mock store serves the whole year for every band
+    plan = asyncio.run(crawl_all.plan_libris_shards(SlowFirstFetcher(), 'http://mock', 2, split_pages=2))
+    assert plan is None
+
+    plan = asyncio.run(crawl_all.plan_libris_shards(PriceFilterFetcher(), 'http://mock', 2, split_pages=2))
+    assert [(shard['band'], shard['first'], shard['last']) for shard in plan['shards']] == [
+        ([0, 25], 1, 2), ([0, 25], 3, 3)]
+
+
+def test_merged_band_shards_number_pages_across_the_year(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape' / 'Libris')
+    os.makedirs(tmp_path / 'Data' / 'Libris')
+    monkeypatch.chdir(tmp_path)
+    # Year 2023 in two price bands of 3 and 2 pages, 2024 unsplit
+    shards = [(2023, [0, 25], 1, 2), (2023, [0, 25], 3, 3), (2023, [25, 50], 1, 2), (2024, None, 1, 2)]
+    plan = {'shard_pages': 2, 'split_pages': 2, 'shards': [
+        {'index': index, 'year': year, 'band': band, 'first': first, 'last': last}
+        for index, (year, band, first, last) in enumerate(shards)]}
+    for shard in plan['shards']:
+        f, writer = crawl_all.open_csv_writer(crawl_all.shard_path(crawl_all.LIBRIS_URLS_FILE, shard['index']),
+                                              crawl_all.LIBRIS_URL_FIELDNAMES)
+        writer.writerows({'year': shard['year'], 'page': page, 'title': f"{shard['index']}-{page}"}
+                         for page in range(shard['first'], shard['last'] + 1))
+        f.close()
+    crawl_all.save_shard_plan(plan)
+
+    crawl_all.merge_libris_shards(plan)
+
+    with open('Data/Libris/libris_titles.txt', encoding='utf-8') as f:
+        assert [tuple(line.split(',', 2)[:2]) for line in f] == [
+            ('2023', '1'), ('2023', '2'), ('2023', '3'), ('2023', '4'), ('2023', '5'), ('2024', '1'), ('2024', '2')]
+
+
+class SlowFirstBooklineFetcher:
+    """Serves the mock Bookline listing; earlier pages take longer."""
+
+    def __init__(self):
+        self.store = MockStore('bookline', 'http://mock', archive_root=None)
+
+    async def fetch(self, url):
+        page = int(parse_qs(urlsplit(url).query)['page'][0])
+        await asyncio.sleep(0.01 * max(0, 5 - page))
+        return self.store.respond(path_of(url), {})[1]
+
+
+def test_bookline_listing_is_written_in_page_order(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    os.makedirs(tmp_path / 'Data' / 'Bookline')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(crawl_all, 'BOOKLINE_LAST_PAGE', 5)
+    archive = HtmlArchive(str(tmp_path / 'archive'))
+    asyncio.run(crawl_all.crawl_bookline_listing(SlowFirstBooklineFetcher(), 'http://mock', 4, archive))
+    archive.close()
+    crawl_all.flush_logs()
+
+    with open('Data/Bookline/bookline_titles.csv', newline='', encoding='utf-8') as f:
+        pages = [int(row['page']) for row in csv.DictReader(f, delimiter=';')]
+    assert pages and pages == sorted(pages)
+    assert set(pages) == {1, 2, 3}
+
+
+def test_finished_details_keep_their_lease_behind_a_slow_title(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    queue = WorkQueue('test_details', lease_seconds=0.3)
+    queue.seed((i, f"Title {i}", f"Title {i}") for i in range(40))
+
+    async def scrape_row(title):
+        # The first title outlasts the lease of the ones finished behind it
+        await asyncio.sleep(1 if title == "Title 0" else 0.03)
+        return {'title': title}
+
+    asyncio.run(crawl_all.crawl_details('test', queue, scrape_row, 'details.csv', ['title'], 3))
+    crawl_all.flush_logs()
+
+    with open('details.csv', newline='', encoding='utf-8') as f:
+        titles = [row['title'] for row in csv.DictReader(f, delimiter=';')]
+    assert titles == [f"Title {i}" for i in range(40)]
+
+
+def test_incremental_bookline_listing_leaves_no_pages_pending(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    os.makedirs(tmp_path / 'Data' / 'Bookline')
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(crawl_all, 'BOOKLINE_LAST_PAGE', 10)
+    archive = HtmlArchive(str(tmp_path / 'archive'))
+    fetcher = SlowFirstBooklineFetcher()
+    asyncio.run(crawl_all.crawl_bookline_listing(fetcher, 'http://mock', 1, archive))
+    # The refresh finds the 3 mock pages unchanged and stops there
+    asyncio.run(crawl_all.crawl_bookline_listing(fetcher, 'http://mock', 1, archive, incremental=True))
+    archive.close()
+    crawl_all.flush_logs()
+
+    assert WorkQueue('bookline_listing').counts() == {'done': 10}
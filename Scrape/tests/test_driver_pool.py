@@ -0,0 +1,39 @@
+import csv
+import json
+import os
+
+import driver_pool
+from work_queue import WorkQueue
+
+
+def test_detail_merge_restores_input_order(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape' / 'Libris')
+    monkeypatch.chdir(tmp_path)
+    module = driver_pool.load_store_module('libris')
+    titles = [f"Title {i}" for i in range(6)]
+    # A finished pool run: every title is done in the work queue
+    queue = WorkQueue(module.QUEUE_NAME)
+    queue.seed(((i, title, f"2020,1,{title}\n") for i, title in enumerate(titles)), done_before=len(titles))
+    queue.close()
+
+    # Shard 0 retried position 0 after the rest of its range
+    shards = [{'index': 0, 'start_line': 0, 'end_line': 3, 'positions': [1, 2, 0]},
+              {'index': 1, 'start_line': 3, 'end_line': 6, 'positions': [3, 5, 4]}]
+    fieldnames = ['year', 'page', 'title', driver_pool.SHARD_POSITION]
+    for shard in shards:
+        shard['details_file'] = driver_pool.shard_path(module.DETAILS_FILE, shard['index'])
+        with open(shard['details_file'], 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames, delimiter=';')
+            writer.writeheader()
+            writer.writerows({'year': 2020, 'page': 1, 'title': titles[i], driver_pool.SHARD_POSITION: i}
+                             for i in shard['positions'])
+    with open(driver_pool.STORES['libris']['plan'], 'w') as f:
+        json.dump({'store': 'libris', 'workers': 2, 'shards': shards}, f)
+
+    driver_pool.merge_shards('libris')
+
+    with open(module.DETAILS_FILE, encoding='utf-8') as f:
+        reader = csv.DictReader(f, delimiter=';')
+        assert reader.fieldnames == ['year', 'page', 'title']
+        assert [row['title'] for row in reader] == titles
+    assert not os.path.exists(shards[0]['details_file'])
@@ -0,0 +1,23 @@
+import driver_watchdog
+from driver_watchdog import WatchedDriver
+
+
+class QuietBrowser:
+    def execute_script(self, script):
+        return 'complete'
+
+    def quit(self):
+        pass
+
+
+def test_restart_reopens_the_store_through_the_rate_limiter(monkeypatch):
+    opened = []
+    monkeypatch.setattr(driver_watchdog, 'create_driver', lambda **options: QuietBrowser())
+    monkeypatch.setattr(driver_watchdog, 'open_store',
+                        lambda browser, store, limiter=None: opened.append((store, limiter)))
+    limiter = object()
+    driver = WatchedDriver('libris', limiter=limiter)
+    driver.restart("test")
+    driver.quit()
+
+    assert opened == [('libris', limiter)]
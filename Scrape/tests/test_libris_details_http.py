@@ -0,0 +1,94 @@
+import csv
+import os
+import sys
+
+import pytest
+
+import retry
+from extractors import parse_libris_book_page
+from work_queue import WorkQueue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Libris'))
+import scrape_details_http  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def test_product_page_fixture_is_parsed():
+    with open(os.path.join(FIXTURES, 'libris_product.html'), encoding='utf-8') as f:
+        details = parse_libris_book_page(f.read())
+
+    assert details == {
+        'average_score': '4.6', 'votes': '23', 'categories': 'Literatura romana', 'author': 'Mircea Eliade',
+        'publisher': 'Cartex', 'cover_type': 'Paperback', 'publication_year': '2019', 'num_pages': '208',
+        'format': '13x20', 'code': '9786060800561',
+    }
+    assert set(details) <= set(scrape_details_http.LIBRIS_FIELDNAMES)
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # The scraper uses paths relative to the repository root
+    os.makedirs(tmp_path / 'Data' / 'Libris')
+    os.makedirs(tmp_path / 'Scrape' / 'Libris')
+    with open(tmp_path / 'Data' / 'Libris' / 'libris_titles_unique.txt', 'w', encoding='utf-8') as f:
+        f.write("2019,1,Maitreyi\n2019,1,Noaptea de Sanziene\n")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(retry, 'backoff_delay', lambda attempt: 0)
+    return tmp_path
+
+
+def test_empty_page_fails_the_title_instead_of_the_run(workdir, monkeypatch):
+    with open(os.path.join(FIXTURES, 'libris_product.html'), encoding='utf-8') as f:
+        product_html = f.read()
+
+    def fetch_page(session, url, limiter=None, timeout=15):
+        if 'Sanziene' in url:
+            return ""  # Empty body: lxml raises ParserError
+        if '/carte/' in url:
+            return product_html
+        return ("<div class='pr-history-item'><a href='/carte/maitreyi' data-price='32.90'>"
+                "<h2 class='pr-title-categ-pg'>Maitreyi</h2></a></div>")
+
+    monkeypatch.setattr(scrape_details_http, 'fetch_page', fetch_page)
+    scrape_details_http.scrape_book_details_http('http://127.0.0.1:9')
+
+    with open(scrape_details_http.DETAILS_FILE, encoding='utf-8') as f:
+        rows = list(csv.DictReader(f, delimiter=';'))
+    assert [row['title'] for row in rows] == ['Maitreyi']
+    queue = WorkQueue(scrape_details_http.QUEUE_NAME)
+    # Retried as a transient failure until it ran out of attempts
+    assert queue.counts() == {'done': 1, 'failed': 1}
+    queue.close()
+
+
+def test_unexpected_page_shape_fails_the_title_once(workdir, monkeypatch):
+    with open(os.path.join(FIXTURES, 'libris_product.html'), encoding='utf-8') as f:
+        product_html = f.read()
+
+    def fetch_page(session, url, limiter=None, timeout=15):
+        if '/carte/' in url:
+            return product_html
+        slug = 'maitreyi' if 'Maitreyi' in url else 'sanziene'
+        return (f"<div class='pr-history-item'><a href='/carte/{slug}' data-price='32.90'>"
+                f"<h2 class='pr-title-categ-pg'>{'Maitreyi' if slug == 'maitreyi' else 'Noaptea de Sanziene'}</h2></a></div>")
+
+    def parse_book_page(html):
+        # The second title's page is not in the shape the parser expects
+        calls.append(html)
+        if len(calls) == 2:
+            raise KeyError('pr-lista-item')
+        return parse_libris_book_page(html)
+
+    calls = []
+    monkeypatch.setattr(scrape_details_http, 'fetch_page', fetch_page)
+    monkeypatch.setattr(scrape_details_http, 'parse_libris_book_page', parse_book_page)
+    scrape_details_http.scrape_book_details_http('http://127.0.0.1:9')
+
+    with open(scrape_details_http.DETAILS_FILE, encoding='utf-8') as f:
+        assert [row['title'] for row in csv.DictReader(f, delimiter=';')] == ['Maitreyi']
+    queue = WorkQueue(scrape_details_http.QUEUE_NAME)
+    # A parse error is recorded once, not retried
+    assert [row['error_kind'] for row in queue.failed_items()] == [retry.PARSE_ERROR]
+    assert len(calls) == 2
+    queue.close()
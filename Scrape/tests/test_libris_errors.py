@@ -0,0 +1,27 @@
+import os
+import sys
+
+from work_queue import WorkQueue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Libris'))
+import scrape_errors  # noqa: E402
+
+
+def test_error_queue_takes_the_failed_details_titles(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    details = WorkQueue(scrape_errors.DETAILS_QUEUE)
+    titles = [f"Title {i}" for i in range(4)]
+    details.seed((i, title, f"2020,{i},{title}\n") for i, title in enumerate(titles))
+    details.fail(1, "No matching search result", retry=False)
+    details.fail(3, "Timeout", retry=False)
+
+    queue = scrape_errors.open_queue()
+    assert [(item['position'], item['payload']) for item in queue.items()] == \
+        [(1, "2020,1,Title 1\n"), (3, "2020,3,Title 3\n")]
+
+    # Titles failing after the first run are picked up by the next one
+    details.fail(2, "Timeout", retry=False)
+    queue = scrape_errors.open_queue()
+    assert [item['key'] for item in queue.items()] == ["Title 2"]
+    details.close()
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sqlite3
+
+from rate_limiter import RateLimiter
+
+HOST = 'mock:8801'
+
+
+def test_processes_share_one_bucket_per_host(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    # Two scrapers of a pool, each with its own limiter (as in separate processes)
+    limits = {HOST: {'start': 2.0, 'max': 2.0, 'burst': 2}}
+    first, second = RateLimiter(limits), RateLimiter(limits)
+    assert first.reserve(HOST) == 0
+    assert second.reserve(HOST) == 0
+    # The burst is used up by both together, so the next request waits a full token
+    assert 0.45 < first.reserve(HOST) <= 0.5
+    assert 0.95 < second.reserve(HOST) <= 1.0
+
+    # A slowdown seen by one applies to the other
+    second.record(HOST, status=503)
+    assert first.shared(HOST, lambda bucket: bucket.rate) == 1.0
+    first.close()
+    second.close()
+
+
+def test_async_wait_leaves_the_event_loop_free_while_the_db_is_locked(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    limiter = RateLimiter({HOST: {'start': 100.0, 'max': 100.0, 'burst': 5}})
+    limiter.reserve(HOST)
+    # Another process in the middle of a transaction
+    other = sqlite3.connect('Scrape/work_queue.db', isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")
+
+    async def run():
+        ticks = 0
+        waiting = asyncio.create_task(limiter.wait_async(HOST))
+        while ticks < 20:
+            await asyncio.sleep(0.01)
+            ticks += 1
+        assert not waiting.done()
+        other.execute("COMMIT")
+        await waiting
+        await limiter.record_async(HOST, status=200)
+
+    asyncio.run(run())
+    other.close()
+    limiter.close()
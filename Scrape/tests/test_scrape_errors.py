@@ -0,0 +1,42 @@
+import importlib.util
+import os
+
+from work_queue import WorkQueue
+
+SCRAPE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_script(path):
+    # The stores' error scripts share a module name, so each is loaded from its file
+    spec = importlib.util.spec_from_file_location(os.path.splitext(os.path.basename(path))[0],
+                                                  os.path.join(SCRAPE_DIR, path))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bookline_error_queue_takes_the_failed_details_titles(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    scrape_errors = load_script('Bookline/bookline_scrape_errors.py')
+    details = WorkQueue(scrape_errors.DETAILS_QUEUE)
+    details.seed((i, f"Title {i}", f"{i};Title {i};;\n") for i in range(3))
+    details.fail(2, "No matching search result", retry=False)
+
+    queue = scrape_errors.open_queue()
+    assert [(item['position'], item['payload']) for item in queue.items()] == [(2, "2;Title 2;;\n")]
+    details.close()
+
+
+def test_carturesti_error_queue_takes_the_failed_details_books(tmp_path, monkeypatch):
+    os.makedirs(tmp_path / 'Scrape')
+    monkeypatch.chdir(tmp_path)
+    scrape_errors = load_script('Carturesti/carturesti_scrape_errors.py')
+    details = WorkQueue(scrape_errors.DETAILS_QUEUE)
+    details.seed((i, f"Title {i} - Author", [f"Title {i}", "10", "Author"]) for i in range(3))
+    details.fail(0, "Timeout", retry=False)
+    details.fail(1, "No matching search result", retry=False)
+
+    queue = scrape_errors.open_queue()
+    assert [item['payload'] for item in queue.items()] == [["Title 0", "10", "Author"], ["Title 1", "10", "Author"]]
+    details.close()
@@ -0,0 +1,69 @@
+from selenium.common.exceptions import WebDriverException
+
+from tab_prefetch import TabPrefetcher
+
+
+class FakeDriver:
+    """Records the CDP commands sent to each tab."""
+
+    class SwitchTo:
+        def __init__(self, driver):
+            self.driver = driver
+
+        def new_window(self, kind):
+            self.driver.current_window_handle = f"tab{len(self.driver.commands)}"
+            self.driver.commands[self.driver.current_window_handle] = []
+
+        def window(self, handle):
+            if self.driver.dead:
+                raise WebDriverException("browser is gone")
+            self.driver.current_window_handle = handle
+
+    def __init__(self):
+        self.blocked_urls = ['*.jpg']
+        self.current_window_handle = 'main'
+        self.commands = {'main': []}
+        self.switch_to = self.SwitchTo(self)
+        self.closed = []
+        self.dead = False
+
+    def execute_cdp_cmd(self, command, params):
+        self.commands[self.current_window_handle].append((command, params))
+
+    def execute_script(self, script, *args):
+        pass
+
+    def close(self):
+        self.closed.append(self.current_window_handle)
+
+
+def test_prefetched_tabs_block_the_same_urls():
+    driver = FakeDriver()
+    tabs = TabPrefetcher(driver, 2, 30)
+    tabs.prefetch('http://mock/carte/a-1')
+    tabs.prefetch('http://mock/carte/b-2')
+    assert driver.current_window_handle == 'main'
+    for handle, _ in tabs.tabs.values():
+        assert ('Network.setBlockedURLs', {'urls': ['*.jpg']}) in driver.commands[handle]
+
+
+def test_tabs_of_passed_titles_are_closed():
+    driver = FakeDriver()
+    tabs = TabPrefetcher(driver, 2, 30)
+    tabs.prefetch('http://mock/carte/a-1')
+    tabs.prefetch('http://mock/carte/b-2')
+    # a-1 was never taken: without keep() the depth stays used up
+    tabs.keep(['http://mock/carte/b-2', 'http://mock/carte/c-3'])
+    tabs.prefetch('http://mock/carte/c-3')
+    assert list(tabs.tabs) == ['http://mock/carte/b-2', 'http://mock/carte/c-3']
+    assert driver.closed == ['tab1']
+    assert driver.current_window_handle == 'main'
+
+
+def test_release_survives_a_killed_browser():
+    driver = FakeDriver()
+    tabs = TabPrefetcher(driver, 2, 30)
+    # The watchdog killed the browser while a prefetched tab was current
+    driver.current_window_handle = 'tab1'
+    driver.dead = True
+    tabs.release()
@@ -0,0 +1,79 @@
+import re
+import unicodedata
+from difflib import SequenceMatcher
+from urllib.parse import unquote, urlsplit
+
+from store_config import TITLE_MATCH_THRESHOLD
+
+# How much the author and publisher count next to the title (weight 1)
+AUTHOR_WEIGHT = 0.25
+PUBLISHER_WEIGHT = 0.1
+# Different numbers ("Vol. 1" and "Vol. 3", editions, years) are different books
+NUMBER_MISMATCH = 0.8
+
+
+def normalize(text):
+    """Lowercase, accent-stripped text with punctuation as spaces.
+
+    The same accent stripping as standardize_text in book_data_standardizer.py,
+    so "Înțelepciunea" and "Intelepciunea" compare equal.
+    """
+    if not text:
+        return ""
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if unicodedata.category(c) != 'Mn')
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+def similarity(a, b):
+    """0-1 similarity of two normalized strings, ignoring word order."""
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    words_a, words_b = a.split(), b.split()
+    in_order = SequenceMatcher(None, a, b).ratio()
+    sorted_words = SequenceMatcher(None, ' '.join(sorted(words_a)), ' '.join(sorted(words_b))).ratio()
+    result = max(in_order, sorted_words)
+    if {w for w in words_a if w.isdigit()} != {w for w in words_b if w.isdigit()}:
+        result *= NUMBER_MISMATCH
+    return result
+
+def slug_title(url):
+    # "/carte/autoportretul-unui-indaratnic-1234567" -> "autoportretul unui indaratnic"
+    slug = unquote(urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1])
+    return normalize(re.sub(r'[-_]\d+$', '', slug))
+
+def score(candidate, title, author=None, publisher=None):
+    """Weighted similarity of a search result to the wanted book.
+
+    candidate is a dict with 'title' and optionally 'author' and 'publisher';
+    title, author and publisher are already normalized.
+    """
+    candidate_title = normalize(candidate.get('title'))
+    total = similarity(candidate_title, title)
+    if author and not candidate.get('author'):
+        # Some stores put the author in the title (Libris) or the product URL (Carturesti)
+        total = max(total, similarity(candidate_title, f"{title} {author}"))
+    weights = 1.0
+    for wanted, field, weight in ((author, 'author', AUTHOR_WEIGHT), (publisher, 'publisher', PUBLISHER_WEIGHT)):
+        if wanted and candidate.get(field):
+            total += weight * similarity(normalize(candidate[field]), wanted)
+            weights += weight
+    return total / weights
+
+def best_match(candidates, title, author=None, publisher=None, threshold=TITLE_MATCH_THRESHOLD):
+    """Score every candidate in one pass and return (best candidate, its score).
+
+    The candidate is None when no score reaches threshold. A perfect score
+    ends the scan early.
+    """
+    title, author, publisher = normalize(title), normalize(author), normalize(publisher)
+    best, best_score = None, 0.0
+    for candidate in candidates:
+        candidate_score = score(candidate, title, author, publisher)
+        if candidate_score > best_score:
+            best, best_score = candidate, candidate_score
+        if candidate_score == 1.0:
+            break
+    if best_score < threshold:
+        return None, best_score
+    return best, best_score
@@ -0,0 +1,323 @@
+import argparse
+import json
+import sqlite3
+import time
+
+from retry import NOT_FOUND
+
+QUEUE_DB = 'Scrape/work_queue.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    queue TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    key TEXT,
+    payload TEXT,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+    error_kind TEXT,
+    lease_until REAL,
+    updated_at REAL,
+    PRIMARY KEY (queue, position)
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (queue, state, attempts, position);
+CREATE TABLE IF NOT EXISTS queues (
+    queue TEXT PRIMARY KEY,
+    seeded_at REAL,
+    total_runtime REAL NOT NULL DEFAULT 0
+);
+"""
+
+
+class WorkQueue:
+    """Resumable work queue kept in one SQLite database (WAL mode).
+
+    Every item goes pending -> leased -> done. A failed item goes back to
+    pending until it has been tried max_attempts times, then stays failed
+    with its last error. A lease that is not completed in lease_seconds (a
+    crashed browser) is handed out again, so several processes can take
+    items from the same queue.
+    """
+
+    def __init__(self, name, path=QUEUE_DB, max_attempts=3, lease_seconds=600):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        # Autocommit mode; multi-statement changes use explicit transactions
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        # Databases created before failures were classified
+        columns = [row['name'] for row in self.db.execute("PRAGMA table_info(items)")]
+        if 'error_kind' not in columns:
+            try:
+                self.db.execute("ALTER TABLE items ADD COLUMN error_kind TEXT")
+            except sqlite3.OperationalError:
+                return  # Added by another process in the meantime
+            # Misses recorded by the scrapers before then
+            self.db.execute(
+                "UPDATE items SET error_kind = ? WHERE state = 'failed' AND last_error IN (?, ?, ?)",
+                (NOT_FOUND, "No exact matches found", "No match found", "No results found")
+            )
+
+    def close(self):
+        self.db.close()
+
+    def is_seeded(self):
+        row = self.db.execute("SELECT seeded_at FROM queues WHERE queue = ?", (self.name,)).fetchone()
+        return row is not None and row['seeded_at'] is not None
+
+    def seed(self, items, done_before=0, runtime=0):
+        """Add (position, key, payload) items once.
+
+        Positions below done_before start as done and runtime is carried over,
+        so a run that used a progress JSON file resumes where it stopped.
+        """
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            self.db.executemany(
+                "INSERT OR IGNORE INTO items (queue, position, key, payload, state, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                ((self.name, position, key, json.dumps(payload), 'done' if position < done_before else 'pending', now)
+                 for position, key, payload in items)
+            )
+            self.db.execute(
+                "INSERT INTO queues (queue, seeded_at, total_runtime) VALUES (?, ?, ?) "
+                "ON CONFLICT(queue) DO UPDATE SET seeded_at = excluded.seeded_at",
+                (self.name, now, runtime)
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+
+    def add(self, position, key=None, payload=None):
+        # Items discovered while running (e.g. the next listing page)
+        self.db.execute(
+            "INSERT OR IGNORE INTO items (queue, position, key, payload, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (self.name, position, key, json.dumps(payload), time.time())
+        )
+
+    def _range(self, start, end):
+        sql, params = "", []
+        if start is not None:
+            sql += " AND position >= ?"
+            params.append(start)
+        if end is not None:
+            sql += " AND position < ?"
+            params.append(end)
+        return sql, params
+
+    def lease(self, start=None, end=None):
+        """Take the next item in [start, end) and return it as a dict, or None.
+
+        Untried items come first, so a failed one is retried after the rest.
+        """
+        now = time.time()
+        range_sql, range_params = self._range(start, end)
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            # Expired leases that used up their attempts will not be retried
+            self.db.execute(
+                "UPDATE items SET state = 'failed', last_error = 'Lease expired', lease_until = NULL "
+                "WHERE queue = ? AND state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (self.name, now, self.max_attempts)
+            )
+            row = self.db.execute(
+                "SELECT * FROM items WHERE queue = ? AND (state = 'pending' OR "
+                "(state = 'leased' AND lease_until < ?))" + range_sql +
+                " ORDER BY attempts, position LIMIT 1",
+                [self.name, now] + range_params
+            ).fetchone()
+            if row is None:
+                self.db.execute("COMMIT")
+                return None
+            self.db.execute(
+                "UPDATE items SET state = 'leased', attempts = attempts + 1, lease_until = ?, updated_at = ? "
+                "WHERE queue = ? AND position = ?",
+                (now + self.lease_seconds, now, self.name, row['position'])
+            )
+            self.db.execute("COMMIT")
+        except Exception:
+            self.db.execute("ROLLBACK")
+            raise
+        return {
+            'position': row['position'],
+            'key': row['key'],
+            'payload': json.loads(row['payload']),
+            'attempts': row['attempts'] + 1
+        }
+
+    def items(self, start=None, end=None):
+        """Lease and yield items until [start, end) has none left."""
+        while True:
+            item = self.lease(start, end)
+            if item is None:
+                return
+            yield item
+
+    def release_leases(self, start=None, end=None):
+        """Give leased items in [start, end) back without counting the attempt.
+
+        Called when a run stops, and when it starts again after a crash, by the
+        only process working on that range.
+        """
+        range_sql, range_params = self._range(start, end)
+        self.db.execute(
+            "UPDATE items SET state = 'pending', attempts = MAX(attempts - 1, 0), lease_until = NULL, updated_at = ? "
+            "WHERE queue = ? AND state = 'leased'" + range_sql,
+            [time.time(), self.name] + range_params
+        )
+
+    def _set(self, position, sql, params=()):
+        self.db.execute(
+            f"UPDATE items SET {sql}, updated_at = ? WHERE queue = ? AND position = ?",
+            tuple(params) + (time.time(), self.name, position)
+        )
+
+    def checkpoint(self, position, payload):
+        # Save partial progress of a leased item and extend its lease
+        self._set(position, "payload = ?, lease_until = ?", (json.dumps(payload), time.time() + self.lease_seconds))
+
+    def renew(self, position):
+        # Keep a leased item from being handed out again while it is still being worked on
+        self._set(position, "lease_until = ?", (time.time() + self.lease_seconds,))
+
+    def complete(self, position):
+        self._set(position, "state = 'done', lease_until = NULL")
+
+    def complete_range(self, start=None, end=None):
+        # A listing that ends before its last planned page: nothing is left to crawl in [start, end)
+        range_sql, range_params = self._range(start, end)
+        self.db.execute(
+            "UPDATE items SET state = 'done', lease_until = NULL, updated_at = ? "
+            "WHERE queue = ? AND state IN ('pending', 'leased')" + range_sql,
+            [time.time(), self.name] + range_params
+        )
+
+    def fail(self, position, error, retry=True, kind=None):
+        """Record an error; the item is retried later unless it ran out of attempts
+        or retry is False (e.g. the book is not in the store's search results).
+
+        kind is retry.classify()'s name for the failure, kept for retry_failed().
+        """
+        attempts = self.max_attempts if retry else 0
+        self._set(
+            position,
+            "state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, last_error = ?, error_kind = ?, "
+            "lease_until = NULL",
+            (attempts, str(error).split('\n')[0], kind)
+        )
+
+    def next_position(self, start=None, end=None):
+        """Position of the first item that is not done or failed, or None."""
+        range_sql, range_params = self._range(start, end)
+        row = self.db.execute(
+            "SELECT MIN(position) AS position FROM items WHERE queue = ? AND state IN ('pending', 'leased')" + range_sql,
+            [self.name] + range_params
+        ).fetchone()
+        return row['position']
+
+    def remaining(self, start=None, end=None):
+        range_sql, range_params = self._range(start, end)
+        return self.db.execute(
+            "SELECT COUNT(*) FROM items WHERE queue = ? AND state IN ('pending', 'leased')" + range_sql,
+            [self.name] + range_params
+        ).fetchone()[0]
+
+    def counts(self):
+        rows = self.db.execute(
+            "SELECT state, COUNT(*) AS n FROM items WHERE queue = ? GROUP BY state", (self.name,)
+        ).fetchall()
+        return {row['state']: row['n'] for row in rows}
+
+    def failed_items(self):
+        return self.db.execute(
+            "SELECT position, key, payload, attempts, last_error, error_kind FROM items WHERE queue = ? AND state = 'failed' "
+            "ORDER BY position",
+            (self.name,)
+        ).fetchall()
+
+    def retry_failed(self, include_not_found=False):
+        """Put failed items back to pending with a fresh attempt count.
+
+        Titles the store had no match for are left alone unless include_not_found.
+        """
+        sql = "UPDATE items SET state = 'pending', attempts = 0, updated_at = ? WHERE queue = ? AND state = 'failed'"
+        if not include_not_found:
+            sql += " AND error_kind IS NOT ?"
+        params = [time.time(), self.name] + ([] if include_not_found else [NOT_FOUND])
+        return self.db.execute(sql, params).rowcount
+
+    def reset(self, payload=None):
+        """Start a new round over every item (an incremental listing refresh).
+
+        A given payload replaces each item's, e.g. {'page': 1} for the Libris years.
+        """
+        sql = "UPDATE items SET state = 'pending', attempts = 0, last_error = NULL, lease_until = NULL, updated_at = ?"
+        params = [time.time()]
+        if payload is not None:
+            sql += ", payload = ?"
+            params.append(json.dumps(payload))
+        self.db.execute(sql + " WHERE queue = ?", params + [self.name])
+
+    def runtime(self):
+        row = self.db.execute("SELECT total_runtime FROM queues WHERE queue = ?", (self.name,)).fetchone()
+        return row['total_runtime'] if row else 0
+
+    def add_runtime(self, seconds):
+        self.db.execute(
+            "INSERT INTO queues (queue, total_runtime) VALUES (?, ?) "
+            "ON CONFLICT(queue) DO UPDATE SET total_runtime = total_runtime + excluded.total_runtime",
+            (self.name, seconds)
+        )
+
+
+def queue_names(path=QUEUE_DB):
+    db = sqlite3.connect(path)
+    names = [row[0] for row in db.execute("SELECT DISTINCT queue FROM items ORDER BY queue")]
+    db.close()
+    return names
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect and manage the scraper work queues.")
+    parser.add_argument('command', choices=['status', 'failed', 'retry', 'export'])
+    parser.add_argument('queue', nargs='?', help="Queue name, e.g. libris_details (all queues for status)")
+    parser.add_argument('--output', help="File the export command appends failed keys to")
+    parser.add_argument('--all', action='store_true',
+                        help="retry: also titles the store had no match for")
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        for name in ([args.queue] if args.queue else queue_names()):
+            queue = WorkQueue(name)
+            counts = queue.counts()
+            print(f"{name}: " + ", ".join(f"{counts.get(state, 0)} {state}"
+                                          for state in ['pending', 'leased', 'done', 'failed']))
+            queue.close()
+    elif not args.queue:
+        parser.error(f"{args.command} needs a queue name")
+    else:
+        queue = WorkQueue(args.queue)
+        if args.command == 'failed':
+            for row in queue.failed_items():
+                print(f"{row['position']}\t{row['key']}\t{row['attempts']} attempts\t"
+                      f"{row['error_kind'] or 'unknown'}\t{row['last_error']}")
+        elif args.command == 'retry':
+            print(f"{queue.retry_failed(args.all)} failed items are pending again")
+        else:
+            # Failed keys in the old error_titles.txt format
+            rows = queue.failed_items()
+            if args.output:
+                with open(args.output, 'a', encoding='utf-8') as f:
+                    f.writelines(f"{row['key']}\n" for row in rows)
+            else:
+                for row in rows:
+                    print(row['key'])
+        queue.close()